@@ -1,8 +1,8 @@
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timedelta
+from flask_migrate import Migrate
 from dotenv import load_dotenv
 
 # Cargar variables de entorno desde .env
@@ -10,40 +10,69 @@ load_dotenv()
 
 # Importamos nuestra configuración y modelos
 from config import Config
-from models import db, Song, Favorite
-from utils.logger import audit_logger
+from models import db
+from utils.logger import audit_logger, init_request_logging
+from utils.database import engine_options, replica_router
+from utils.db_profiler import init_db_profiler
+from utils.metrics import init_metrics
+from utils.auth import init_jwt
+from services.job_queue import init_job_queues
+from services.scheduler import init_scheduler
+from services.audit_service import audit_writer
+# Importar los módulos con tareas @scheduled_job para que queden registradas
+from services.cleanup_service import cleanup_history, file_reaper
+import services.upload_service
+import services.audio_pipeline
 
-def create_app():
+def create_app(start_scheduler=False):
     """
     Fábrica de Aplicación Flask.
     Aquí nace el servidor.
+    start_scheduler: solo los procesos del servidor (wsgi.py, app.py) arrancan
+    las tareas periódicas; scripts y comandos de consola no.
     """
-    app = Flask(__name__)
+    # Sin carpeta static por defecto: los audios los sirve media_bp (Range, ETag, caché)
+    app = Flask(__name__, static_folder=None)
     app.config.from_object(Config)
 
     # Inicializar extensiones
-    # 1. Base de Datos
+    # 1. Base de Datos (pool de conexiones según DB_*, réplica de lectura opcional)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
     db.init_app(app)
+    replica_router.init_app(app)
     
+    # Latencia de cada petición para el registro de auditoría
+    init_request_logging(app)
+    # Consultas SQL por petición: conteo, Server-Timing, N+1 y consultas lentas
+    init_db_profiler(app)
+    # Métricas de Prometheus (latencia por endpoint, consultas por petición) en /metrics.
+    # Solo los procesos del servidor suman las suyas con los demás workers
+    init_metrics(app, shared=start_scheduler)
+
     # 2. CORS (Permite que el Frontend React hable con este Backend)
     CORS(app)
 
     # 3. Scheduler (Para limpieza automática - RNF-12)
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(func=cleanup_history, trigger="interval", hours=1, args=[app])
-    scheduler.start()
+    # Con varios workers solo el líder (candado en Postgres o archivo) ejecuta las tareas
+    if start_scheduler:
+        init_scheduler(app)
+
+    # 4. Colas de trabajos (generación de música en segundo plano)
+    init_job_queues(app)
+
+    # 5. Eventos de auditoría en la BD (se insertan por lotes en segundo plano)
+    audit_writer.init_app(app)
 
     # Registrar Blueprints (Rutas)
-    from routes.auth_routes import auth_bp, bcrypt
+    from routes.auth_routes import auth_bp
     # from routes.music_routes import music_bp
     # from routes.admin_routes import admin_bp
     
-    # Inicializar Bcrypt con la app
-    bcrypt.init_app(app)
-    
     # Configurar JWT
     from flask_jwt_extended import JWTManager
     jwt = JWTManager(app)
+    init_jwt(jwt)
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     
@@ -56,41 +85,24 @@ def create_app():
     from routes.tts_routes import tts_bp
     app.register_blueprint(tts_bp, url_prefix='/api/tts')
 
-    # Crear tablas si no existen (Solo para prototipo)
-    with app.app_context():
-        db.create_all()
-        audit_logger.info("Sistema iniciado. Base de datos verificada.")
+    from routes.media_routes import media_bp
+    app.register_blueprint(media_bp)
 
-    return app
+    # Comando de consola: flask cleanup-history [--dry-run]
+    @app.cli.command('cleanup-history')
+    @click.option('--dry-run', is_flag=True, help='Solo cuenta las canciones que se borrarían.')
+    def cleanup_history_command(dry_run):
+        """Ejecuta la limpieza del historial manualmente (RNF-12)."""
+        stats = cleanup_history(app, dry_run=dry_run)
+        file_reaper.join()
+        click.echo(stats)
 
-def cleanup_history(app):
-    """
-    Tarea programada: Elimina canciones viejas (>24h) que NO son favoritas.
-    RNF-12: Gestión del historial.
-    """
-    with app.app_context():
-        audit_logger.info("Ejecutando limpieza automática de historial...")
-        expiration_time = datetime.utcnow() - timedelta(hours=24)
-        
-        # Lógica SQL: Borrar canciones creadas antes de 24h Y que no estén en favoritos
-        # Nota: SQLAlchemy lo hace más pythonico
-        
-        # 1. Buscar canciones expiradas
-        expired_songs = Song.query.filter(Song.created_at < expiration_time).all()
-        
-        deleted_count = 0
-        for song in expired_songs:
-            # Verificar si es favorita
-            is_fav = Favorite.query.filter_by(song_id=song.id).first()
-            if not is_fav:
-                db.session.delete(song)
-                deleted_count += 1
-                # Aquí también borraríamos el archivo físico MP3
-        
-        db.session.commit()
-        if deleted_count > 0:
-            audit_logger.info(f"Limpieza completada: {deleted_count} canciones eliminadas.")
+    # Migraciones versionadas (flask db upgrade), ver migrations/README
+    Migrate(app, db)
+    audit_logger.info("Sistema iniciado.")
+
+    return app
 
 if __name__ == '__main__':
-    app = create_app()
+    app = create_app(start_scheduler=True)
     app.run(debug=True, host='0.0.0.0', port=5000)
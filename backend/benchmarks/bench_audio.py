@@ -0,0 +1,162 @@
+"""
+Benchmark de la entrega de audio: manejador /static por defecto de Flask
+contra media_bp (Range, ETag fuerte, caché immutable).
+
+Levanta los dos servidores en hilos sobre una carpeta temporal con MP3
+de relleno y mide, con varios clientes a la vez:
+  - full:       descarga completa del archivo
+  - seek:       Range de 256 KB en una posición al azar (adelantar/reanudar)
+  - revalidate: GET con If-None-Match (el navegador ya tiene la copia)
+
+Uso:
+    python benchmarks/bench_audio.py --files 20 --size-mb 4 --clients 8 --seconds 5
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from werkzeug.serving import make_server
+from routes.media_routes import media_bp
+
+RANGE_BYTES = 256 * 1024
+
+
+def make_files(root, count, size):
+    music = os.path.join(root, 'static', 'music')
+    tts = os.path.join(root, 'static', 'tts')
+    os.makedirs(music)
+    os.makedirs(tts)
+    names = []
+    block = os.urandom(1024 * 1024)
+    for i in range(count):
+        # Mitad con nombre normal (ETag por hash del contenido), mitad direccionados por contenido
+        if i % 2:
+            folder, name = tts, f"{i:064x}.mp3"
+        else:
+            folder, name = music, f"song_{i}.mp3"
+        with open(os.path.join(folder, name), 'wb') as f:
+            for _ in range(size // len(block)):
+                f.write(block)
+            f.write(block[:size % len(block)])
+        names.append(f"/static/{os.path.basename(folder)}/{name}")
+    return names
+
+
+def default_app(root):
+    # Equivalente al manejador anterior: la carpeta static de Flask
+    return Flask('bench_default', static_folder=os.path.join(root, 'static'))
+
+
+def media_app(root):
+    app = Flask('bench_media', static_folder=None)
+    app.config['UPLOAD_FOLDER'] = os.path.join(root, 'static', 'music')
+    app.config['TTS_FOLDER'] = os.path.join(root, 'static', 'tts')
+    app.register_blueprint(media_bp)
+    return app
+
+
+def serve(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(port, path, headers):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    try:
+        conn.request('GET', path, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        return resp.status, len(body), resp.getheader('ETag')
+    finally:
+        conn.close()
+
+
+def run_scenario(port, paths, scenario, etags, size, clients, seconds):
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    totals = {'requests': 0, 'bytes': 0, 'statuses': {}}
+
+    def worker():
+        while time.perf_counter() < deadline:
+            path = random.choice(paths)
+            headers = {}
+            if scenario == 'seek':
+                start = random.randint(0, size - RANGE_BYTES)
+                headers['Range'] = f"bytes={start}-{start + RANGE_BYTES - 1}"
+            elif scenario == 'revalidate':
+                headers['If-None-Match'] = etags[path]
+            status, length, _ = request(port, path, headers)
+            with lock:
+                totals['requests'] += 1
+                totals['bytes'] += length
+                totals['statuses'][status] = totals['statuses'].get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        for _ in range(clients):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    return {
+        'rps': totals['requests'] / elapsed,
+        'mbps': totals['bytes'] / elapsed / (1024 * 1024),
+        'statuses': totals['statuses'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    root = tempfile.mkdtemp(prefix='bench_audio_')
+    try:
+        print(f"Creando {args.files} archivos de {args.size_mb} MB en {root}...")
+        paths = make_files(root, args.files, size)
+
+        results = {}
+        for name, factory in (('flask /static', default_app), ('media_bp', media_app)):
+            server = serve(factory(root))
+            port = server.server_port
+            # Primera pasada: obtiene los ETag (y en media_bp calcula los hashes)
+            started = time.perf_counter()
+            etags = {path: request(port, path, {})[2] for path in paths}
+            warmup = time.perf_counter() - started
+            results[name] = {'warmup': warmup}
+            for scenario in ('full', 'seek', 'revalidate'):
+                print(f"{name}: {scenario}...")
+                results[name][scenario] = run_scenario(
+                    port, paths, scenario, etags, size, args.clients, args.seconds
+                )
+            server.shutdown()
+
+        print()
+        print(f"{'manejador':<14} {'escenario':<11} {'req/s':>9} {'MB/s':>9}  estados")
+        for name, scenarios in results.items():
+            for scenario in ('full', 'seek', 'revalidate'):
+                r = scenarios[scenario]
+                print(f"{name:<14} {scenario:<11} {r['rps']:>9.1f} {r['mbps']:>9.1f}  {r['statuses']}")
+            print(f"{name:<14} {'1ª pasada':<11} {scenarios['warmup']:>8.2f}s")
+        print()
+        print("Con media_bp los archivos <sha256>.mp3 llevan Cache-Control immutable:")
+        print("al volver a reproducirlos el navegador no hace ninguna petición.")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
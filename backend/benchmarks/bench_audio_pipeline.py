@@ -0,0 +1,95 @@
+"""
+Benchmark del procesamiento de audio (transcodificar + loudnorm + ffprobe)
+en una máquina solo con CPU.
+
+Genera WAV de prueba (tono con ruido), los procesa con process_audio en un
+ProcessPoolExecutor con distinta cantidad de procesos y muestra archivos/s,
+segundos de audio procesados por segundo (x tiempo real) y la reducción de tamaño.
+Necesita ffmpeg y ffprobe en el PATH.
+
+Uso:
+    python benchmarks/bench_audio_pipeline.py --files 16 --seconds 60 --workers 1,2,4
+"""
+import argparse
+import array
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.audio_processing import process_audio
+
+SAMPLE_RATE = 44100
+
+
+def make_wav(path, seconds, seed):
+    # Estéreo 16 bits; el volumen varía entre archivos para que loudnorm trabaje
+    rng = random.Random(seed)
+    freq = rng.uniform(200, 900)
+    gain = rng.uniform(0.05, 0.9) * 32767
+    samples = array.array('h')
+    for i in range(int(seconds * SAMPLE_RATE)):
+        value = int(gain * (0.8 * math.sin(2 * math.pi * freq * i / SAMPLE_RATE) + 0.2 * (rng.random() - 0.5)))
+        samples.append(value)
+        samples.append(value)
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(samples.tobytes())
+
+
+def run(sources, out_dir, workers, fmt, bitrate):
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            process_audio, sources, [out_dir] * len(sources), [fmt] * len(sources), [bitrate] * len(sources)
+        ))
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=60, help='Duración de cada WAV')
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    parser.add_argument('--format', default='mp3', choices=['mp3', 'opus'])
+    parser.add_argument('--bitrate', default='128k')
+    args = parser.parse_args()
+
+    if not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+        parser.error('Se necesitan ffmpeg y ffprobe en el PATH')
+
+    root = tempfile.mkdtemp(prefix='bench_pipeline_')
+    try:
+        print(f"Generando {args.files} WAV de {args.seconds}s...")
+        sources = []
+        for i in range(args.files):
+            path = os.path.join(root, f"source_{i}.wav")
+            make_wav(path, args.seconds, seed=i)
+            sources.append(path)
+        source_bytes = sum(os.path.getsize(p) for p in sources)
+
+        print(f"CPUs: {os.cpu_count()}, formato: {args.format} {args.bitrate}")
+        print(f"{'procesos':>8} {'total':>8} {'archivos/s':>11} {'x tiempo real':>14} {'tamaño':>8}")
+        for workers in (int(n) for n in args.workers.split(',')):
+            out_dir = os.path.join(root, f"out_{workers}")
+            os.makedirs(out_dir)
+            results, elapsed = run(sources, out_dir, workers, args.format, args.bitrate)
+            audio_seconds = sum(r['duration'] or 0 for r in results)
+            output_bytes = sum(r['audio_info']['size'] for r in results)
+            print(f"{workers:>8} {elapsed:>7.1f}s {len(results) / elapsed:>11.2f} "
+                  f"{audio_seconds / elapsed:>13.1f}x {output_bytes / source_bytes:>7.1%}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
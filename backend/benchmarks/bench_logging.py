@@ -0,0 +1,121 @@
+"""
+Benchmark del costo de audit_logger.info(...) en el hilo de la petición.
+
+Compara:
+  - directo: RotatingFileHandler + consola en el logger (la configuración
+             anterior: cada registro escribe, hace flush y revisa la rotación)
+  - en cola: RequestQueueHandler + BatchQueueListener (utils/logger.py):
+             la petición solo encola; otro hilo escribe JSON por lotes
+
+Cada hilo simula peticiones dentro de un contexto de Flask y registra
+--per-request líneas por petición. Muestra el costo por petición (p50/p99)
+y el tiempo hasta que todo quedó escrito en el archivo.
+
+Uso:
+    python benchmarks/bench_logging.py --requests 5000 --threads 1,8 --per-request 2
+"""
+import argparse
+import logging
+import os
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, g
+from utils.logger import BatchFileHandler, BatchQueueListener, JsonFormatter, RequestQueueHandler
+
+FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+
+def direct_logger(name, folder, console):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    file_handler = RotatingFileHandler(os.path.join(folder, 'app.log'), maxBytes=1024 * 1024, backupCount=10)
+    console_handler = logging.StreamHandler(console)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(logging.Formatter(FORMAT))
+        logger.addHandler(handler)
+    return logger, lambda: None
+
+
+def queued_logger(name, folder, console):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    file_handler = BatchFileHandler(os.path.join(folder, 'app.log'))
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(console)
+    console_handler.setFormatter(logging.Formatter(FORMAT))
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(RequestQueueHandler(log_queue))
+    listener = BatchQueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    return logger, listener.stop
+
+
+def simulate(app, logger, requests, per_request, timings):
+    for i in range(requests):
+        with app.test_request_context(f'/api/music/history?page={i}'):
+            g._log_context = {'method': 'GET', 'route': '/api/music/history', 'started': time.perf_counter()}
+            started = time.perf_counter()
+            for j in range(per_request):
+                logger.info(f"Canción guardada: {i}-{j}", extra={'user_id': i % 300})
+            timings.append((time.perf_counter() - started) * 1e6)
+
+
+def run(setup, threads, args, folder, console):
+    app = Flask(__name__)
+    logger, stop = setup(f'bench_{setup.__name__}_{threads}', folder, console)
+    timings = []
+    started = time.perf_counter()
+    workers = [
+        threading.Thread(target=simulate, args=(app, logger, args.requests // threads, args.per_request, timings))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    requests_done = time.perf_counter() - started
+    stop()
+    all_written = time.perf_counter() - started
+    for handler in logger.handlers:
+        handler.close()
+    return timings, requests_done, all_written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', default='1,8')
+    parser.add_argument('--per-request', type=int, default=2, help='Líneas de log por petición')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_logging_')
+    try:
+        with open(os.devnull, 'w') as console:
+            print(f"{args.requests} peticiones, {args.per_request} líneas por petición (consola a /dev/null)")
+            print(f"{'modo':<9} {'hilos':>6} {'p50':>9} {'p99':>9} {'peticiones':>11} {'todo escrito':>13}")
+            for threads in (int(n) for n in args.threads.split(',')):
+                for setup in (direct_logger, queued_logger):
+                    folder = os.path.join(root, f'{setup.__name__}_{threads}')
+                    os.makedirs(folder)
+                    timings, requests_done, all_written = run(setup, threads, args, folder, console)
+                    timings.sort()
+                    label = 'directo' if setup is direct_logger else 'en cola'
+                    print(f"{label:<9} {threads:>6} {statistics.median(timings):>7.1f}µs "
+                          f"{timings[int(len(timings) * 0.99)]:>7.1f}µs {requests_done:>10.2f}s {all_written:>12.2f}s")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de una "tormenta de logins" (toda la escuela entra a las 8:00).
+
+Levanta un servidor Flask con hilos y dos rutas: /login, que verifica una
+contraseña con PasswordHasher (la misma parte de CPU que /api/auth/login),
+y /ping, una ruta liviana que arma una respuesta JSON como las del historial.
+Mientras --logins clientes hacen login sin parar, otro cliente mide la
+latencia de /ping. Se compara bcrypt en el hilo de la petición (workers=0)
+con el pool de procesos: con el pool el p99 de /ping debería quedar plano.
+
+Uso:
+    python benchmarks/bench_login_storm.py --logins 32 --seconds 10 --rounds 12 --workers 0,2
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+from services.password_service import PasswordHasher, PasswordBusyError
+
+PASSWORD = 'ContraseñaDeDocente2024'
+
+
+def build_app(hasher, password_hash):
+    app = Flask(__name__)
+    rows = [{'id': i, 'title': f'Canción {i}', 'prompt': 'cumbia para aprender los números'} for i in range(50)]
+
+    @app.route('/login', methods=['POST'])
+    def login():
+        try:
+            ok = hasher.verify(password_hash, PASSWORD)
+        except PasswordBusyError:
+            return jsonify({'error': 'ocupado'}), 503
+        return jsonify({'ok': ok}), 200 if ok else 401
+
+    @app.route('/ping')
+    def ping():
+        return jsonify({'items': rows})
+
+    return app
+
+
+def storm(base, stop, counts, lock):
+    while not stop.is_set():
+        request = urllib.request.Request(f'{base}/login', data=b'{}', method='POST')
+        try:
+            urllib.request.urlopen(request).read()
+            status = 'ok'
+        except urllib.error.HTTPError as e:
+            status = e.code
+        with lock:
+            counts[status] = counts.get(status, 0) + 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(workers, args):
+    hasher = PasswordHasher(args.rounds, workers, max_pending=args.logins, wait_timeout=args.queue_timeout)
+    # Calienta el pool (arrancar los procesos no forma parte de la medición)
+    password_hash = hasher.hash(PASSWORD)
+    server = make_server('127.0.0.1', 0, build_app(hasher, password_hash), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    stop = threading.Event()
+    counts, lock = {'ok': 0}, threading.Lock()
+    clients = [threading.Thread(target=storm, args=(base, stop, counts, lock), daemon=True) for _ in range(args.logins)]
+    for client in clients:
+        client.start()
+
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        urllib.request.urlopen(f'{base}/ping').read()
+        latencies.append((time.perf_counter() - started) * 1000)
+        stop.wait(0.01)
+
+    stop.set()
+    for client in clients:
+        client.join()
+    server.shutdown()
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+    return latencies, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=32, help='Clientes haciendo login a la vez')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12, help='Costo de bcrypt')
+    parser.add_argument('--workers', default=f"0,{max(1, (os.cpu_count() or 2) // 2)}",
+                        help='Procesos del pool a probar (0 = bcrypt en el hilo de la petición)')
+    parser.add_argument('--queue-timeout', type=float, default=2)
+    args = parser.parse_args()
+    # Sin una línea de log por petición
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    print(f"CPUs: {os.cpu_count()}, costo bcrypt: {args.rounds}, clientes de login: {args.logins}")
+    print(f"{'workers':>8} {'logins/s':>9} {'503':>6} {'ping p50':>9} {'ping p99':>9} {'ping máx':>9}")
+    for workers in (int(n) for n in args.workers.split(',')):
+        latencies, counts = run(workers, args)
+        print(f"{workers:>8} {counts['ok'] / args.seconds:>9.1f} {counts.get(503, 0):>6} "
+              f"{statistics.median(latencies):>7.1f}ms {percentile(latencies, 0.99):>7.1f}ms "
+              f"{max(latencies):>7.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark de subidas de audio: velocidad (MB/s) y memoria máxima (tracemalloc).
+
+Compara:
+  - en memoria: leer el archivo completo y luego guardarlo (como un
+                buffer de la petición entera)
+  - por partes: UploadStore (create / append por fragmentos / complete),
+                con el hash calculado mientras se escribe
+  - repetida:   la misma subida otra vez; se deduplica por hash
+
+Uso:
+    python benchmarks/bench_upload.py --size-mb 200 --chunk-mb 5
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.upload_service import UploadStore
+
+
+class FakeStream:
+    """Cuerpo de petición de `size` bytes generado al vuelo (no ocupa memoria)."""
+
+    def __init__(self, size, block):
+        self.remaining = size
+        self.block = block
+
+    def read(self, n=-1):
+        if self.remaining <= 0:
+            return b''
+        if n < 0:
+            n = self.remaining
+        n = min(n, self.remaining)
+        self.remaining -= n
+        repeats, rest = divmod(n, len(self.block))
+        return self.block * repeats + self.block[:rest]
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def buffered_upload(folder, size, block):
+    data = FakeStream(size, block).read()
+    filename = f"{hashlib.sha256(data).hexdigest()}.wav"
+    with open(os.path.join(folder, filename), 'wb') as f:
+        f.write(data)
+    return filename
+
+
+def chunked_upload(store, size, chunk, block):
+    upload_id = store.create(size, 'wav', title='bench')
+    offset = 0
+    while offset < size:
+        length = min(chunk, size - offset)
+        offset = store.append(upload_id, offset, FakeStream(length, block))
+    filename, deduplicated, _ = store.complete(upload_id)
+    return filename, deduplicated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=200)
+    parser.add_argument('--chunk-mb', type=float, default=5)
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    chunk = int(args.chunk_mb * 1024 * 1024)
+    # Bloque de largo primo para que el contenido no se repita en fragmentos alineados
+    block = os.urandom(1024 * 1024 + 7)
+
+    root = tempfile.mkdtemp(prefix='bench_upload_')
+    try:
+        buffered_dir = os.path.join(root, 'buffered')
+        os.makedirs(buffered_dir)
+        store = UploadStore(os.path.join(root, 'music'), os.path.join(root, 'tmp'), max_bytes=size)
+
+        rows = []
+        _, elapsed, peak = measure(lambda: buffered_upload(buffered_dir, size, block))
+        rows.append(('en memoria', elapsed, peak, '-'))
+        (name, dedup), elapsed, peak = measure(lambda: chunked_upload(store, size, chunk, block))
+        rows.append(('por partes', elapsed, peak, dedup))
+        (name2, dedup), elapsed, peak = measure(lambda: chunked_upload(store, size, chunk, block))
+        rows.append(('repetida', elapsed, peak, dedup))
+        assert name == name2
+
+        files = os.listdir(store.folder)
+        print(f"Archivo de {args.size_mb} MB, fragmentos de {args.chunk_mb} MB")
+        print(f"{'modo':<12} {'MB/s':>9} {'memoria máx.':>14}  deduplicada")
+        for label, elapsed, peak, dedup in rows:
+            print(f"{label:<12} {size / elapsed / (1024 * 1024):>9.1f} {peak / (1024 * 1024):>12.1f}MB  {dedup}")
+        print(f"Archivos en la carpeta de música tras dos subidas iguales: {len(files)}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -29,11 +31,194 @@ class Config:
     
     # Desactivamos notificaciones pesadas de cambios en la BD para mejorar rendimiento.
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Pool de conexiones por worker (utils/database.py): como mucho DB_POOL_SIZE +
+    # DB_MAX_OVERFLOW conexiones; si no hay libre se espera DB_POOL_TIMEOUT segundos.
+    # Con pre-ping y DB_POOL_RECYCLE las conexiones muertas tras un reinicio de Postgres
+    # se descartan antes de usarlas. DB_STATEMENT_TIMEOUT_MS corta consultas colgadas (0 = sin límite).
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 5))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    # Detrás de pgbouncer en modo transacción: sin pool propio ni parámetros de inicio
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true'
+    # Réplica de lectura opcional para los endpoints de solo lectura (historial, favoritos,
+    # monitor, usuarios). Se deja de usar si va más de DB_REPLICA_MAX_LAG segundos atrasada
+    # (revisado cada DB_REPLICA_CHECK_SECONDS); quien acaba de escribir lee del primario
+    # durante DB_REPLICA_STICKY_SECONDS
+    DB_REPLICA_URL = os.environ.get('DB_REPLICA_URL')
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+    DB_REPLICA_CHECK_SECONDS = int(os.environ.get('DB_REPLICA_CHECK_SECONDS', 10))
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
     
     # Configuración de JWT (Tokens de Seguridad)
     # Los tokens de acceso expiran en 1 hora por seguridad (RNF-03).
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-super-secret'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    # El token va solo en la cabecera Authorization: en la URL terminaría en los logs.
+    # EventSource (SSE) no permite enviar cabeceras: esos endpoints aceptan además
+    # ?stream_token=, un token de STREAM_TOKEN_TTL segundos que solo sirve para streams
+    # (POST /api/auth/stream-token)
+    JWT_TOKEN_LOCATION = ['headers']
+    JWT_QUERY_STRING_NAME = 'stream_token'
+    STREAM_TOKEN_TTL = int(os.environ.get('STREAM_TOKEN_TTL', 60))
+    # Segundos que se cachea el rol de un usuario para autorizar peticiones de admin
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # Contraseñas (RNF-03): costo de bcrypt. Si se cambia, cada hash se
+    # actualiza en segundo plano la próxima vez que su usuario inicia sesión.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # bcrypt corre en un pool de PASSWORD_WORKERS procesos por worker web (0 = en el hilo
+    # de la petición); hasta PASSWORD_QUEUE_MAX esperan turno y si no hay lugar en
+    # PASSWORD_QUEUE_TIMEOUT segundos se responde 503.
+    # Por defecto se reparte PASSWORD_CPU_BUDGET (procesos de bcrypt en todo el
+    # servidor, la mitad de los núcleos) entre los WEB_CONCURRENCY workers de
+    # gunicorn (la misma variable que gunicorn usa para su número de workers)
+    WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+    PASSWORD_CPU_BUDGET = int(os.environ.get('PASSWORD_CPU_BUDGET', max(1, (os.cpu_count() or 2) // 2)))
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', max(1, PASSWORD_CPU_BUDGET // WEB_CONCURRENCY)))
+    PASSWORD_QUEUE_MAX = int(os.environ.get('PASSWORD_QUEUE_MAX', 32))
+    PASSWORD_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', 2))
+
+    # Colas de trabajos en segundo plano (RF04).
+    # workers: generaciones simultáneas; max_pending: tope de trabajos en espera.
+    JOB_QUEUES = {
+        'generation': {
+            'workers': int(os.environ.get('GENERATION_WORKERS', 2)),
+            'max_pending': int(os.environ.get('GENERATION_QUEUE_MAX', 50)),
+        },
+        # Actualización de hashes tras cambiar BCRYPT_LOG_ROUNDS, fuera del login
+        'password_rehash': {
+            'workers': 1,
+            'max_pending': int(os.environ.get('PASSWORD_REHASH_QUEUE_MAX', 100)),
+        },
+    }
+    # Máximo de prompts por petición en /api/music/generate-batch
+    GENERATION_BATCH_MAX_ITEMS = int(os.environ.get('GENERATION_BATCH_MAX_ITEMS', 20))
+    # Segundos que se conserva el resultado de un trabajo terminado
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+    # Segundos entre consultas a la tabla jobs cuando el trabajo corre en otro worker (SSE)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+
+    # Caché de generación por prompt (RF04): resultados guardados por proceso y
+    # similitud mínima (0-1, coseno de trigramas) para reutilizar un prompt parecido
+    PROMPT_CACHE_ENABLED = os.environ.get('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+    PROMPT_CACHE_SIZE = int(os.environ.get('PROMPT_CACHE_SIZE', 1000))
+    PROMPT_CACHE_SIMILARITY = float(os.environ.get('PROMPT_CACHE_SIMILARITY', 0.85))
+    # Horas que una entrada protege su archivo del FileReaper (tabla cached_audio);
+    # las entradas usadas se renuevan y las demás caducan
+    PROMPT_CACHE_LEASE_HOURS = float(os.environ.get('PROMPT_CACHE_LEASE_HOURS', 24))
+
+    # Registro de auditoría (RNF-15): carpeta de app.log (ruta absoluta, compartida por
+    # todos los workers; rotarla con logrotate), registros por escritura, copia en consola
+    # y una línea por petición con su latencia
+    LOG_FOLDER = os.environ.get('LOG_FOLDER', os.path.join(BASE_DIR, 'logs'))
+    LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 500))
+    LOG_TO_CONSOLE = os.environ.get('LOG_TO_CONSOLE', 'true').lower() == 'true'
+    LOG_REQUESTS = os.environ.get('LOG_REQUESTS', 'false').lower() == 'true'
+
+    # Métricas de Prometheus en GET /metrics. Cada worker guarda las suyas en
+    # METRICS_DIR/<worker>.json y /metrics suma las de todos; el maestro de gunicorn
+    # vacía la carpeta al arrancar (gunicorn.conf.py). Por defecto en la carpeta
+    # temporal del sistema, una por instalación.
+    # /metrics solo se expone con METRICS_TOKEN (Prometheus envía
+    # Authorization: Bearer <token>, authorization.credentials en scrape_configs).
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(
+        tempfile.gettempdir(), f"metrics-{hashlib.sha256(BASE_DIR.encode('utf-8')).hexdigest()[:12]}"))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    # Perfil de consultas SQL (utils/db_profiler.py). SQL_PROFILER: 'off', 'on' (todas las
+    # peticiones) o 'request' (solo con la cabecera X-Profile-SQL: 1 o ?_profile_sql=1; para
+    # staging). El perfil responde con Server-Timing y avisa si una misma consulta se repite
+    # SQL_N_PLUS_ONE_THRESHOLD veces en una petición (N+1).
+    # Las consultas de más de SQL_SLOW_QUERY_MS se registran siempre (0 = no registrar).
+    SQL_PROFILER = os.environ.get('SQL_PROFILER', 'off').lower()
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    SQL_SLOW_QUERY_MS = int(os.environ.get('SQL_SLOW_QUERY_MS', 500))
+
+    # Eventos de auditoría en la BD (tabla audit_events): se insertan en lotes de
+    # AUDIT_BATCH_SIZE o cada AUDIT_FLUSH_MS ms; como mucho AUDIT_QUEUE_MAX en memoria
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+    AUDIT_FLUSH_MS = int(os.environ.get('AUDIT_FLUSH_MS', 500))
+    AUDIT_QUEUE_MAX = int(os.environ.get('AUDIT_QUEUE_MAX', 10000))
+
+    # Monitor del admin (RF11): cada cuántos segundos el stream consulta
+    # audit_events y cuánto dura como máximo una conexión (el cliente reconecta;
+    # tampoco pasa del vencimiento de su token)
+    MONITOR_POLL_SECONDS = float(os.environ.get('MONITOR_POLL_SECONDS', 2))
+    MONITOR_STREAM_MAX_SECONDS = int(os.environ.get('MONITOR_STREAM_MAX_SECONDS', 300))
 
     # Carpeta donde guardaremos los archivos de audio generados
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'music')
+    # Subidas manuales del admin: tamaño máximo, carpeta de subidas por partes
+    # en curso y horas tras las que se borra una subida abandonada
+    MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+    UPLOAD_TMP_FOLDER = os.environ.get('UPLOAD_TMP_FOLDER', os.path.join(BASE_DIR, 'uploads_tmp'))
+    UPLOAD_EXPIRE_HOURS = int(os.environ.get('UPLOAD_EXPIRE_HOURS', 24))
+    # Límite de Flask para cualquier petición (el archivo más el resto del formulario)
+    MAX_CONTENT_LENGTH = MAX_UPLOAD_BYTES + 1024 * 1024
+
+    # Procesamiento de audios subidos (ffmpeg): transcodificar a AUDIO_FORMAT ('mp3' u 'opus'),
+    # normalizar el volumen a AUDIO_LOUDNESS_TARGET (LUFS) y leer la duración.
+    # Corre en un pool de AUDIO_WORKERS procesos; si no hay ffmpeg se sirve el archivo tal cual.
+    AUDIO_PIPELINE_ENABLED = os.environ.get('AUDIO_PIPELINE_ENABLED', 'true').lower() == 'true'
+    AUDIO_WORKERS = int(os.environ.get('AUDIO_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    AUDIO_FORMAT = os.environ.get('AUDIO_FORMAT', 'mp3')
+    AUDIO_BITRATE = os.environ.get('AUDIO_BITRATE', '128k')
+    AUDIO_LOUDNESS_TARGET = float(os.environ.get('AUDIO_LOUDNESS_TARGET', -16))
+    # Conservar el archivo subido original además de la versión procesada
+    AUDIO_KEEP_ORIGINAL = os.environ.get('AUDIO_KEEP_ORIGINAL', 'false').lower() == 'true'
+    AUDIO_PROCESS_RETRIES = int(os.environ.get('AUDIO_PROCESS_RETRIES', 2))
+    AUDIO_PROCESS_TIMEOUT = int(os.environ.get('AUDIO_PROCESS_TIMEOUT', 600))
+    # Minutos tras los que una canción sin procesar se vuelve a encolar (p. ej. tras un reinicio)
+    AUDIO_PROCESS_STALE_MINUTES = int(os.environ.get('AUDIO_PROCESS_STALE_MINUTES', 30))
+    FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+    FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+    # Caché de audios de voz (TTS)
+    TTS_FOLDER = os.path.join(BASE_DIR, 'static', 'tts')
+
+    # Entrega de audio (/static/music, /static/tts).
+    # Detrás de Apache/lighttpd: USE_X_SENDFILE=true (el servidor web envía el archivo).
+    # Detrás de nginx: AUDIO_ACCEL_REDIRECT=/_audio, con una location internal
+    # /_audio/ que apunte a la carpeta static (alias .../static/).
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    AUDIO_ACCEL_REDIRECT = os.environ.get('AUDIO_ACCEL_REDIRECT')
+
+    # Limpieza del historial (RNF-12): horas que se conserva una canción no favorita
+    # y filas borradas por transacción
+    HISTORY_RETENTION_HOURS = int(os.environ.get('HISTORY_RETENTION_HOURS', 24))
+    CLEANUP_BATCH_SIZE = int(os.environ.get('CLEANUP_BATCH_SIZE', 1000))
+
+    # Tareas periódicas: solo un proceso (el líder) las ejecuta.
+    # SCHEDULER_LOCK: 'auto' (Postgres si la BD es Postgres, si no archivo), 'postgres' o 'file'.
+    # El candado de Postgres necesita una conexión directa: con DB_PGBOUNCER se indica
+    # en SCHEDULER_LOCK_URL (si falta, 'auto' usa el archivo y 'postgres' no arranca)
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SCHEDULER_LOCK = os.environ.get('SCHEDULER_LOCK', 'auto')
+    SCHEDULER_LOCK_URL = os.environ.get('SCHEDULER_LOCK_URL')
+    SCHEDULER_LOCK_KEY = int(os.environ.get('SCHEDULER_LOCK_KEY', 72012))
+    SCHEDULER_LOCK_FILE = os.environ.get('SCHEDULER_LOCK_FILE', os.path.join(BASE_DIR, 'scheduler.lock'))
+
+    # Caché de audios TTS (static/tts): tope en bytes antes de borrar los menos usados
+    TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+    # Los audios usados hace menos de esto no se borran (su URL pudo entregarse recién)
+    TTS_CACHE_GRACE_SECONDS = int(os.environ.get('TTS_CACHE_GRACE_SECONDS', 300))
+
+    # Motor de voz: 'edge' (edge-tts) o 'stub' (silencio local, para pruebas de carga sin internet)
+    TTS_BACKEND = os.environ.get('TTS_BACKEND', 'edge')
+    TTS_STUB_LATENCY = float(os.environ.get('TTS_STUB_LATENCY', 0.5))
+    TTS_CONNECTION_LIMIT = int(os.environ.get('TTS_CONNECTION_LIMIT', 20))
+    # Segundos máximos de espera entre fragmentos de audio en modo streaming
+    TTS_STREAM_TIMEOUT = float(os.environ.get('TTS_STREAM_TIMEOUT', 30))
+    # /api/tts/speak-batch: frases sintetizadas a la vez y máximo de frases por petición
+    TTS_BATCH_CONCURRENCY = int(os.environ.get('TTS_BATCH_CONCURRENCY', 4))
+    TTS_BATCH_MAX_ITEMS = int(os.environ.get('TTS_BATCH_MAX_ITEMS', 50))
+    # Textos largos (letras completas): se parten en fragmentos de hasta N caracteres
+    # que se sintetizan en paralelo y se reutilizan entre peticiones
+    TTS_CHUNK_MAX_CHARS = int(os.environ.get('TTS_CHUNK_MAX_CHARS', 300))
+    TTS_CHUNK_CONCURRENCY = int(os.environ.get('TTS_CHUNK_CONCURRENCY', 4))
+    TTS_CHUNK_RETRIES = int(os.environ.get('TTS_CHUNK_RETRIES', 1))
@@ -1,10 +1,9 @@
 from app import create_app, db
 from models import User
-from flask_bcrypt import Bcrypt
+from services.password_service import password_hasher
 
 def create_admin():
     app = create_app()
-    bcrypt = Bcrypt(app)
     
     with app.app_context():
         # Verificar si ya existe
@@ -22,7 +21,7 @@ def create_admin():
 
         # Crear nuevo admin
         password = "AdminSecretPassword123!"
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        hashed_password = password_hasher.hash(password)
         
         new_admin = User(
             name="Super Admin",
@@ -0,0 +1,15 @@
+# Configuración de gunicorn (se lee sola al ejecutar "gunicorn wsgi:app" desde backend/)
+from dotenv import load_dotenv
+
+# Como app.py: METRICS_DIR puede venir del .env
+load_dotenv()
+
+from config import Config
+from utils.metrics import reset_metrics_dir
+
+
+def on_starting(server):
+    # En el maestro, antes de crear los workers: las métricas de un despliegue
+    # anterior no se suman a las nuevas
+    if Config.METRICS_ENABLED:
+        reset_metrics_dir(Config.METRICS_DIR)
@@ -0,0 +1,50 @@
+"""Índices para historial, favoritos y limpieza
+
+Se crean con CREATE INDEX CONCURRENTLY para no bloquear escrituras en
+tablas grandes. Antes del índice único se eliminan favoritos duplicados.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_songs_user_id_created_at', 'songs', ['user_id', 'created_at', 'id'], False),
+    ('ix_songs_created_at', 'songs', ['created_at'], False),
+    ('ix_songs_audio_filename', 'songs', ['audio_filename'], False),
+    ('uq_favorites_user_id_song_id', 'favorites', ['user_id', 'song_id'], True),
+    ('ix_favorites_song_id', 'favorites', ['song_id'], False),
+    ('ix_favorites_user_id_favorited_at', 'favorites', ['user_id', 'favorited_at', 'id'], False),
+]
+
+
+def upgrade():
+    # Conservar solo el favorito más antiguo de cada (user_id, song_id)
+    op.execute("""
+        DELETE FROM favorites a
+        USING favorites b
+        WHERE a.user_id = b.user_id
+          AND a.song_id = b.song_id
+          AND a.id > b.id
+    """)
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,88 @@
+"""Búsqueda de texto completo en canciones (título, prompt, letra)
+
+- Configuración es_unaccent: stemming en español e insensible a tildes.
+- songs.search_vector: tsvector que un trigger mantiene en cada INSERT/UPDATE
+  de título, prompt o letra. Se agrega vacía (sin reescribir la tabla ni
+  bloquearla más que un instante) y las filas existentes se llenan por lotes,
+  cada uno en su propia transacción.
+- Índice GIN sobre search_vector, creado con CONCURRENTLY.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def _search_vector(row=''):
+    # Documento de búsqueda: el título pesa más que el prompt, y este más que la letra
+    return (
+        f"setweight(to_tsvector(CAST('es_unaccent' AS regconfig), coalesce({row}title, '')), 'A') || "
+        f"setweight(to_tsvector(CAST('es_unaccent' AS regconfig), coalesce({row}prompt, '')), 'B') || "
+        f"setweight(to_tsvector(CAST('es_unaccent' AS regconfig), coalesce({row}lyrics, '')), 'C')"
+    )
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+                ALTER TEXT SEARCH CONFIGURATION es_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+            END IF;
+        END
+        $$;
+    """)
+    # Sin valor por defecto: solo cambia el catálogo, no reescribe la tabla
+    op.add_column('songs', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # En la misma transacción que la columna: ninguna fila nueva queda sin llenar
+    op.execute(f"""
+        CREATE FUNCTION songs_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {_search_vector('NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER songs_search_vector BEFORE INSERT OR UPDATE OF title, prompt, lyrics
+        ON songs FOR EACH ROW EXECUTE FUNCTION songs_search_vector_update()
+    """)
+
+    with op.get_context().autocommit_block():
+        # Filas existentes, por rangos de id: cada lote bloquea solo sus filas y poco tiempo
+        conn = op.get_bind()
+        last_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM songs")).scalar()
+        for start in range(0, last_id, BATCH_SIZE):
+            conn.execute(sa.text(
+                f"UPDATE songs SET search_vector = {_search_vector()} "
+                "WHERE id > :start AND id <= :end AND search_vector IS NULL"
+            ), {'start': start, 'end': start + BATCH_SIZE})
+
+        op.create_index('ix_songs_search_vector', 'songs', ['search_vector'],
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_songs_search_vector', table_name='songs',
+                      postgresql_concurrently=True, if_exists=True)
+    op.execute("DROP TRIGGER IF EXISTS songs_search_vector ON songs")
+    op.execute("DROP FUNCTION IF EXISTS songs_search_vector_update()")
+    op.drop_column('songs', 'search_vector')
+    op.execute("DROP TEXT SEARCH CONFIGURATION IF EXISTS es_unaccent")
@@ -0,0 +1,41 @@
+"""Etiquetas de canciones como JSONB con índice GIN
+
+JSON no se puede indexar; JSONB permite consultas de contención (@>) y
+jsonpath (@?) usando el índice.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('songs', 'tags',
+                    type_=postgresql.JSONB(astext_type=sa.Text()),
+                    existing_type=postgresql.JSON(astext_type=sa.Text()),
+                    postgresql_using='tags::jsonb')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_songs_tags', 'songs', ['tags'],
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_songs_tags', table_name='songs',
+                      postgresql_concurrently=True, if_exists=True)
+    op.alter_column('songs', 'tags',
+                    type_=postgresql.JSON(astext_type=sa.Text()),
+                    existing_type=postgresql.JSONB(astext_type=sa.Text()),
+                    postgresql_using='tags::json')
@@ -0,0 +1,48 @@
+"""Estado del procesamiento de audio de las canciones subidas
+
+Los audios subidos por el admin se transcodifican y normalizan en segundo
+plano; estas columnas guardan el estado, el original (si se conserva) y
+los datos técnicos del archivo.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Con server_default constante Postgres no reescribe la tabla
+    op.add_column('songs', sa.Column('processing_status', sa.String(length=20),
+                                     nullable=False, server_default='ready'))
+    op.add_column('songs', sa.Column('original_filename', sa.String(length=255), nullable=True))
+    op.add_column('songs', sa.Column('audio_info', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_songs_original_filename', 'songs', ['original_filename'],
+                        postgresql_where=sa.text('original_filename IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_songs_processing_pending', 'songs', ['created_at'],
+                        postgresql_where=sa.text("processing_status IN ('pending', 'processing')"),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_songs_processing_pending', table_name='songs',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_songs_original_filename', table_name='songs',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('songs', 'audio_info')
+    op.drop_column('songs', 'original_filename')
+    op.drop_column('songs', 'processing_status')
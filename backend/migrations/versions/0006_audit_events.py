@@ -0,0 +1,44 @@
+"""Tabla de eventos de auditoría
+
+Los eventos de RNF-15 (logins, logins fallidos, cambios de usuarios,
+favoritos) se guardan en audit_events para consultarlos desde
+/api/admin/audit por fecha y por usuario, sin revisar app.log.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 12:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('action', sa.String(length=50), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=True),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('ip', sa.String(length=45), nullable=True),
+        sa.Column('details', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Tabla nueva y vacía: no hace falta CONCURRENTLY
+    op.create_index('ix_audit_events_created_at', 'audit_events', ['created_at', 'id'])
+    op.create_index('ix_audit_events_actor_id_created_at', 'audit_events', ['actor_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_audit_events_actor_id_created_at', table_name='audit_events')
+    op.drop_index('ix_audit_events_created_at', table_name='audit_events')
+    op.drop_table('audit_events')
@@ -0,0 +1,45 @@
+"""Tabla de trabajos en segundo plano
+
+El estado de cada generación (queued, running, finished, failed) se guarda
+en jobs en lugar de en la memoria del worker que la ejecuta, para que
+/api/music/jobs/<id> responda en cualquier worker de gunicorn.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('queue', sa.String(length=50), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Tabla nueva y vacía: no hace falta CONCURRENTLY
+    op.create_index('ix_jobs_created_at', 'jobs', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_jobs_created_at', table_name='jobs')
+    op.drop_table('jobs')
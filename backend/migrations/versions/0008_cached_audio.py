@@ -0,0 +1,37 @@
+"""Préstamos de archivos de audio a la caché de prompts
+
+Cada caché de prompts (una por worker) registra en cached_audio los archivos
+que puede volver a entregar; el FileReaper no borra un archivo con préstamos
+vigentes aunque ya no lo use ninguna canción.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 13:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'cached_audio',
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('holder', sa.String(length=32), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('filename', 'holder')
+    )
+    # Tabla nueva y vacía: no hace falta CONCURRENTLY
+    op.create_index('ix_cached_audio_expires_at', 'cached_audio', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_cached_audio_expires_at', table_name='cached_audio')
+    op.drop_table('cached_audio')
@@ -0,0 +1,44 @@
+"""Fechas de creación obligatorias en users, songs y favorites
+
+La paginación por cursor ordena por (created_at, id) / (favorited_at, id) y
+arma el cursor con la fecha: una fila sin fecha rompía la página en la que
+cayera (y con NULL el orden tampoco es estable). Las filas viejas sin fecha
+toman la del momento de la migración.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 13:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('users', 'created_at'),
+    ('songs', 'created_at'),
+    ('favorites', 'favorited_at'),
+)
+
+
+def upgrade():
+    for table, column in COLUMNS:
+        op.execute(f"UPDATE {table} SET {column} = now() AT TIME ZONE 'utc' WHERE {column} IS NULL")
+        # SET NOT NULL revisa toda la tabla con bloqueo exclusivo; con un CHECK
+        # ya validado (que solo bloquea escrituras mientras revisa) Postgres se lo salta
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT ck_{table}_{column}_not_null "
+                   f"CHECK ({column} IS NOT NULL) NOT VALID")
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT ck_{table}_{column}_not_null")
+        op.alter_column(table, column, existing_type=sa.DateTime(), nullable=False)
+        op.drop_constraint(f"ck_{table}_{column}_not_null", table, type_='check')
+
+
+def downgrade():
+    for table, column in COLUMNS:
+        op.alter_column(table, column, existing_type=sa.DateTime(), nullable=True)
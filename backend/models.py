@@ -1,9 +1,17 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import JSON  # Usamos JSON para guardar las etiquetas
+from sqlalchemy.dialects.postgresql import JSONB  # Usamos JSONB para guardar (e indexar) las etiquetas
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+from utils.database import RoutingSession
 
 # Inicializamos la extensión de Base de Datos
-db = SQLAlchemy()
+# (la sesión envía las lecturas de @read_only() a la réplica, si hay una configurada)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Configuración de búsqueda de texto: español (stemming) + unaccent ("canción" == "cancion").
+# Se crea en la migración 0003.
+SEARCH_CONFIG = 'es_unaccent'
 
 class User(db.Model):
     """
@@ -18,7 +26,7 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
     role = db.Column(db.String(20), default='docente')  # 'admin' o 'docente'
     grade_level = db.Column(db.String(50))  # Ej: '3 años', '4 años' (Nuevo requerimiento)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Clave del cursor de /admin/users
 
     # Relaciones: Un usuario tiene muchas canciones y muchos favoritos
     songs = db.relationship('Song', backref='author', lazy=True)
@@ -34,6 +42,24 @@ class Song(db.Model):
     Esta tabla funciona como el HISTORIAL.
     """
     __tablename__ = 'songs'
+    __table_args__ = (
+        # Historial del docente: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_songs_user_id_created_at', 'user_id', 'created_at', 'id'),
+        # Limpieza de 24h y actividad del admin: WHERE/ORDER BY created_at
+        db.Index('ix_songs_created_at', 'created_at'),
+        # Verificar si otro registro usa el mismo MP3 antes de borrarlo
+        db.Index('ix_songs_audio_filename', 'audio_filename'),
+        # Búsqueda de texto completo (título, prompt y letra)
+        db.Index('ix_songs_search_vector', 'search_vector', postgresql_using='gin'),
+        # Filtros por etiqueta: tags @> {...} y tags @? '$.* ? (@ == "Piano")'
+        db.Index('ix_songs_tags', 'tags', postgresql_using='gin'),
+        # Originales conservados tras el procesamiento (también se verifican antes de borrar)
+        db.Index('ix_songs_original_filename', 'original_filename',
+                 postgresql_where=db.text('original_filename IS NOT NULL')),
+        # Reintento de audios que quedaron sin procesar (índice parcial, casi vacío)
+        db.Index('ix_songs_processing_pending', 'created_at',
+                 postgresql_where=db.text("processing_status IN ('pending', 'processing')")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -42,10 +68,20 @@ class Song(db.Model):
     prompt = db.Column(db.Text, nullable=False)  # Lo que el usuario pidió (Voz/Texto)
     audio_filename = db.Column(db.String(255), nullable=False)  # Ruta al archivo MP3
     lyrics = db.Column(db.Text)  # Letra de la canción (Nuevo requerimiento)
-    tags = db.Column(JSON)  # Etiquetas: {'curso': 'Matemática', 'instrumento': 'Piano'}
+    tags = db.Column(JSONB)  # Etiquetas: {'curso': 'Matemática', 'instrumento': 'Piano'}
     duration = db.Column(db.Integer)  # En segundos
+
+    # Procesamiento de audios subidos (transcodificar + normalizar volumen):
+    # 'pending', 'processing', 'ready' o 'failed'. Las canciones generadas nacen 'ready'.
+    processing_status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
+    original_filename = db.Column(db.String(255))  # Archivo subido, si se conserva
+    audio_info = db.Column(JSONB)  # Códec, bitrate, frecuencia, canales y etiquetas del archivo
+
+    # Documento de búsqueda (título, prompt y letra): lo mantiene un trigger de
+    # Postgres en cada INSERT/UPDATE (migración 0003). deferred: no se carga al listar canciones.
+    search_vector = deferred(db.Column(TSVECTOR))
     
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Campo calculado para saber si es favorita (se llenará en tiempo de ejecución)
     is_favorite = False 
@@ -60,14 +96,93 @@ class Favorite(db.Model):
     Esto evita que se borren con la limpieza de 24h.
     """
     __tablename__ = 'favorites'
+    __table_args__ = (
+        # Una canción solo puede estar una vez en los favoritos de un usuario
+        db.Index('uq_favorites_user_id_song_id', 'user_id', 'song_id', unique=True),
+        # NOT EXISTS de la limpieza y JOIN desde songs
+        db.Index('ix_favorites_song_id', 'song_id'),
+        # Lista de favoritos: WHERE user_id = ? ORDER BY favorited_at DESC, id DESC
+        db.Index('ix_favorites_user_id_favorited_at', 'user_id', 'favorited_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False)
-    favorited_at = db.Column(db.DateTime, default=datetime.utcnow)
+    favorited_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Relación para acceder a los datos de la canción desde el favorito
     song = db.relationship('Song', backref='favorites_entries')
 
     def __repr__(self):
         return f'<Favorite User:{self.user_id} Song:{self.song_id}>'
+
+class CachedAudio(db.Model):
+    """
+    Préstamo de un archivo de audio a la caché de prompts de un proceso
+    (services/ai_service.py). Las filas vigentes de un archivo son su cuenta de
+    referencias: mientras haya alguna, el FileReaper no lo borra aunque ninguna
+    canción lo use. Vencen solas si el proceso muere sin devolverlas.
+    """
+    __tablename__ = 'cached_audio'
+    __table_args__ = (
+        # Limpieza de préstamos vencidos: WHERE expires_at <= ?
+        db.Index('ix_cached_audio_expires_at', 'expires_at'),
+    )
+
+    filename = db.Column(db.String(255), primary_key=True)
+    holder = db.Column(db.String(32), primary_key=True)  # Caché que lo tiene (PromptCache.holder)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<CachedAudio {self.filename} {self.holder}>'
+
+class BackgroundJob(db.Model):
+    """
+    Estado de un trabajo en segundo plano (services/job_queue.py), p. ej. una generación.
+    Se guarda en la BD para que cualquier worker responda /jobs/<id>, aunque el
+    trabajo corra en otro.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Limpieza de trabajos viejos: WHERE created_at < ?
+        db.Index('ix_jobs_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 en hexadecimal
+    queue = db.Column(db.String(50), nullable=False)
+    owner_id = db.Column(db.Integer)  # Usuario que lo pidió
+    status = db.Column(db.String(20), nullable=False)  # queued | running | finished | failed
+    result = db.Column(JSONB)
+    error = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Sube en cada cambio de estado
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.status}>'
+
+class AuditEvent(db.Model):
+    """
+    Evento de auditoría (RNF-15): logins, logins fallidos, cambios de usuarios,
+    favoritos... Se escriben por lotes desde services/audit_service.py.
+    actor_id no es clave foránea: el evento se conserva aunque se borre el usuario.
+    """
+    __tablename__ = 'audit_events'
+    __table_args__ = (
+        # Consulta por rango de fechas: ORDER BY created_at DESC, id DESC
+        db.Index('ix_audit_events_created_at', 'created_at', 'id'),
+        # Qué hizo un usuario: WHERE actor_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_audit_events_actor_id_created_at', 'actor_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    action = db.Column(db.String(50), nullable=False)  # Ej: 'login', 'login_failed', 'user_deleted'
+    actor_id = db.Column(db.Integer)  # Usuario que hizo la acción (None si no hay sesión)
+    target_id = db.Column(db.Integer)  # Usuario o canción afectada
+    ip = db.Column(db.String(45))
+    details = db.Column(JSONB)  # Datos extra: correo del intento fallido, formato exportado...
+
+    def __repr__(self):
+        return f'<AuditEvent {self.action} {self.created_at}>'
@@ -1,69 +1,130 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Song
+from flask import Blueprint, jsonify, request, Response, current_app, stream_with_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models import db, User, Song, AuditEvent
+from services.job_queue import all_queue_stats
+from services.activity_feed import activity_feed
+from services.audit_service import audit_writer
+from services.audio_pipeline import audio_pipeline, PENDING, READY
+from services.cleanup_service import claim_audio_files
+from services.upload_service import UploadError, save_audio_stream, upload_store
+from sqlalchemy.orm import joinedload
+from utils.auth import admin_required, user_cache
+from utils.database import read_only
 from utils.logger import audit_logger
+from utils.pagination import get_page_args, paginate
 from werkzeug.utils import secure_filename
-import os
-from datetime import datetime
+from datetime import datetime, timezone
+import io
+import csv
+import json
+import time
 
 admin_bp = Blueprint('admin', __name__)
 
 ALLOWED_EXTENSIONS = {'mp3', 'wav'}
 
+# Filas que trae cada viaje del cursor del servidor al exportar usuarios
+EXPORT_BATCH_SIZE = 1000
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def check_admin():
-    """Helper para verificar si el usuario es admin"""
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'admin':
-        return False
-    return True
+def _filter_users(query):
+    """Filtros comunes de la lista y la exportación: ?role= y ?grade_level="""
+    role = request.args.get('role')
+    if role:
+        query = query.filter(User.role == role)
+    grade_level = request.args.get('grade_level')
+    if grade_level:
+        query = query.filter(User.grade_level == grade_level)
+    return query
+
+def _user_row(u):
+    return {
+        'id': u.id,
+        'name': u.name,
+        'email': u.email,
+        'role': u.role,
+        'grade_level': u.grade_level,
+        'joined_at': u.created_at.isoformat() if u.created_at else None
+    }
 
 @admin_bp.route('/users', methods=['GET'])
-@jwt_required()
+@admin_required()
+@read_only()
 def list_users():
-    """RF10: Listar todos los docentes registrados"""
-    if not check_admin():
-        return jsonify({'error': 'Acceso denegado'}), 403
+    """
+    RF10: Listar los docentes registrados.
+    Paginado por cursor (?limit=&cursor=) y filtrable por ?role= y ?grade_level=.
+    """
+    try:
+        limit, cursor = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    users = User.query.all()
-    results = []
-    for u in users:
-        results.append({
-            'id': u.id,
-            'name': u.name,
-            'email': u.email,
-            'role': u.role,
-            'grade_level': u.grade_level,
-            'joined_at': u.created_at.isoformat()
-        })
-    return jsonify(results), 200
+    users, next_cursor = paginate(_filter_users(User.query), User.created_at, User.id, limit, cursor)
+    return jsonify({'items': [_user_row(u) for u in users], 'next_cursor': next_cursor}), 200
+
+@admin_bp.route('/users/export', methods=['GET'])
+@admin_required()
+def export_users():
+    """
+    RF10: Exportar usuarios en CSV (?format=csv) o NDJSON (?format=ndjson).
+    Se lee con un cursor del lado del servidor y se envía por partes,
+    así la memoria no crece con la cantidad de usuarios.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Formato no soportado (csv o ndjson)'}), 400
+
+    columns = ['id', 'name', 'email', 'role', 'grade_level', 'joined_at']
+    stmt = _filter_users(
+        db.select(User.id, User.name, User.email, User.role, User.grade_level, User.created_at)
+    ).order_by(User.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for partition in db.session.execute(stmt).partitions():
+            for row in partition:
+                values = list(row[:5]) + [row[5].isoformat() if row[5] else None]
+                if fmt == 'csv':
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + '\n')
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    audit_logger.info(f"ADMIN exportó usuarios ({fmt})")
+    audit_writer.record('users_exported', actor_id=int(get_jwt_identity()), format=fmt)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=usuarios.{fmt}'
+    })
 
 @admin_bp.route('/users/<int:user_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required()
 def delete_user(user_id):
     """RF10: Eliminar un docente"""
-    if not check_admin():
-        return jsonify({'error': 'Acceso denegado'}), 403
-        
     user = User.query.get(user_id)
     if not user:
         return jsonify({'error': 'Usuario no encontrado'}), 404
         
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     audit_logger.warning(f"ADMIN eliminó al usuario {user.email}")
+    audit_writer.record('user_deleted', actor_id=int(get_jwt_identity()), target_id=user_id, email=user.email)
     return jsonify({'message': 'Usuario eliminado'}), 200
 
 @admin_bp.route('/users/<int:user_id>', methods=['PUT'])
-@jwt_required()
+@admin_required()
 def update_user(user_id):
     """RF10: Editar información de un usuario"""
-    if not check_admin():
-        return jsonify({'error': 'Acceso denegado'}), 403
-        
     user = User.query.get(user_id)
     if not user:
         return jsonify({'error': 'Usuario no encontrado'}), 404
@@ -79,18 +140,26 @@ def update_user(user_id):
         user.grade_level = data['grade_level']
         
     db.session.commit()
+    # El nuevo rol se aplica ya (en este proceso); un docente ascendido debe volver a iniciar sesión
+    user_cache.invalidate(user_id)
     audit_logger.info(f"ADMIN actualizó al usuario {user.email}")
+    audit_writer.record('user_updated', actor_id=int(get_jwt_identity()), target_id=user_id,
+                        fields=[k for k in ('name', 'role', 'grade_level') if k in data])
     return jsonify({'message': 'Usuario actualizado correctamente'}), 200
 
 @admin_bp.route('/monitor', methods=['GET'])
-@jwt_required()
+@admin_required()
+@read_only()
 def monitor_activity():
-    """RF11: Ver actividad reciente (Auditoría)"""
-    if not check_admin():
-        return jsonify({'error': 'Acceso denegado'}), 403
-        
-    # Por ahora devolvemos las últimas 50 canciones generadas por cualquiera
-    songs = Song.query.order_by(Song.created_at.desc()).limit(50).all()
+    """
+    RF11: Ver actividad reciente (Auditoría).
+    Devuelve las últimas 50 canciones (una sola consulta con el autor incluido)
+    y el cursor para seguir en vivo con /monitor/stream?cursor=...
+    """
+    # Tomamos el cursor antes de consultar: lo que ocurra después llegará por el stream
+    cursor = activity_feed.head()
+    songs = Song.query.options(joinedload(Song.author)) \
+        .order_by(Song.created_at.desc()).limit(50).all()
     
     results = []
     for s in songs:
@@ -99,74 +168,272 @@ def monitor_activity():
             'title': s.title,
             'author': s.author.name,
             'created_at': s.created_at.isoformat(),
-            'tags': s.tags
+            'tags': s.tags,
+            'processing_status': s.processing_status
         })
-    return jsonify(results), 200
+    return jsonify({'items': results, 'cursor': cursor}), 200
 
-@admin_bp.route('/upload-song', methods=['POST'])
-@jwt_required()
-def upload_song():
-    """Subir canción manualmente (solo admin)"""
-    if not check_admin():
-        return jsonify({'error': 'Acceso denegado'}), 403
-    
-    # Verificar que se envió un archivo
-    if 'audio_file' not in request.files:
-        return jsonify({'error': 'No se envió ningún archivo'}), 400
-    
-    file = request.files['audio_file']
-    
-    if file.filename == '':
-        return jsonify({'error': 'Nombre de archivo vacío'}), 400
-    
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'Solo se permiten archivos MP3 o WAV'}), 400
-    
-    # Datos del formulario
-    title = request.form.get('title', 'Canción sin título')
-    lyrics = request.form.get('lyrics', '')
-    tags_str = request.form.get('tags', '')
-    
-    # Guardar archivo
-    filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    unique_filename = f"{timestamp}_{filename}"
-    
-    from flask import current_app
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    file_path = os.path.join(upload_folder, unique_filename)
-    file.save(file_path)
-    
-    # Crear entrada en base de datos
-    user_id = get_jwt_identity()
-    audio_url = f"/static/music/{unique_filename}"
-    
-    # Procesar tags
+@admin_bp.route('/monitor/stream', methods=['GET'])
+@admin_required(stream=True)
+def monitor_stream():
+    """
+    RF11: Actividad en vivo como Server-Sent Events, leída de audit_events
+    (el cursor vale en cualquier worker).
+    Recibe ?cursor= (o la cabecera Last-Event-ID al reconectar).
+    La conexión se cierra a los MONITOR_STREAM_MAX_SECONDS o cuando vence el
+    token, lo que pase primero; el cliente vuelve a conectar con un token nuevo.
+    """
+    try:
+        last_id = request.headers.get('Last-Event-ID')
+        cursor = int(last_id) + 1 if last_id else int(request.args.get('cursor', activity_feed.head()))
+    except ValueError:
+        return jsonify({'error': 'Cursor inválido'}), 400
+
+    app = current_app._get_current_object()
+    poll_seconds = app.config['MONITOR_POLL_SECONDS']
+    deadline = min(time.time() + app.config['MONITOR_STREAM_MAX_SECONDS'], get_jwt()['exp'])
+    follower = activity_feed.follow(cursor)
+
+    def stream():
+        idle = 0.0
+        while time.time() < deadline:
+            with app.app_context():
+                events = follower.poll()
+            for event in events:
+                yield f"id: {event['offset']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if events:
+                idle = 0.0
+            elif idle >= 15:
+                # Comentario SSE para mantener viva la conexión
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(poll_seconds)
+            idle += poll_seconds
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _parse_utc(value):
+    """Fecha ISO 8601 a UTC sin zona (como se guarda created_at). Lanza ValueError si no es válida."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@admin_bp.route('/audit', methods=['GET'])
+@admin_required()
+@read_only()
+def list_audit_events():
+    """
+    RNF-15: Consultar los eventos de auditoría (logins, logins fallidos, cambios
+    de usuarios, favoritos...). Filtros: ?from= y ?to= (ISO 8601, UTC),
+    ?actor_id= y ?action=. Paginado por cursor (?limit=&cursor=), del más reciente al más antiguo.
+    """
+    try:
+        limit, cursor = get_page_args()
+        since = _parse_utc(request.args.get('from'))
+        until = _parse_utc(request.args.get('to'))
+        actor_id = int(request.args['actor_id']) if request.args.get('actor_id') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # El nombre del actor en el mismo JOIN (puede no existir si se borró el usuario)
+    query = db.session.query(AuditEvent, User.name).outerjoin(User, User.id == AuditEvent.actor_id)
+    if since:
+        query = query.filter(AuditEvent.created_at >= since)
+    if until:
+        query = query.filter(AuditEvent.created_at < until)
+    if actor_id is not None:
+        query = query.filter(AuditEvent.actor_id == actor_id)
+    if request.args.get('action'):
+        query = query.filter(AuditEvent.action == request.args['action'])
+    rows, next_cursor = paginate(query, AuditEvent.created_at, AuditEvent.id, limit, cursor)
+
+    results = []
+    for event, actor_name in rows:
+        results.append({
+            'id': event.id,
+            'created_at': event.created_at.isoformat(),
+            'action': event.action,
+            'actor_id': event.actor_id,
+            'actor': actor_name,
+            'target_id': event.target_id,
+            'ip': event.ip,
+            'details': event.details
+        })
+    return jsonify({'items': results, 'next_cursor': next_cursor}), 200
+
+@admin_bp.route('/queues', methods=['GET'])
+@admin_required()
+def queue_stats():
+    """Profundidad de las colas de trabajos (generación de música, etc.)"""
+    return jsonify(all_queue_stats()), 200
+
+def _parse_tags(tags_str):
+    # "a, b" -> {'tag_0': 'a', 'tag_1': 'b'}
     tags_dict = {}
     if tags_str:
         tags_list = [t.strip() for t in tags_str.split(',')]
         for i, tag in enumerate(tags_list):
             tags_dict[f'tag_{i}'] = tag
-    
+    return tags_dict
+
+def _create_uploaded_song(title, lyrics, tags_str, filename, deduplicated):
+    """
+    Crea la canción para un archivo ya guardado (nuevo o reutilizado) y
+    encola su procesamiento (MP3/Opus con volumen normalizado y duración).
+    """
+    app = current_app._get_current_object()
+    # Un archivo reutilizado pudo quedar sin canciones: que el reaper no lo borre antes del commit
+    if claim_audio_files([filename]):
+        db.session.rollback()
+        return jsonify({'error': 'El archivo se eliminó durante la subida, vuelve a subirlo'}), 409
+    process = audio_pipeline.available(app)
     new_song = Song(
         title=title,
-        audio_url=audio_url,
+        prompt='Subida manual',
+        audio_filename=filename,
         lyrics=lyrics,
-        tags=tags_dict,
-        user_id=user_id
+        tags=_parse_tags(tags_str),
+        user_id=int(get_jwt_identity()),
+        processing_status=PENDING if process else READY
     )
-    
     db.session.add(new_song)
     db.session.commit()
-    
-    audit_logger.info(f"ADMIN subió canción: {title}")
-    
+    if process:
+        audio_pipeline.submit(app, new_song.id)
+
+    audit_logger.info(f"ADMIN subió canción: {title}" + (" (audio ya existente)" if deduplicated else ""))
+    audit_writer.record('song_uploaded', actor_id=new_song.user_id, target_id=new_song.id, title=title)
+    audio_url = f"/static/music/{filename}"
     return jsonify({
         'message': 'Canción subida exitosamente',
         'song': {
             'id': new_song.id,
             'title': new_song.title,
-            'audio_url': audio_url
-        }
+            'audio_url': audio_url,
+            'processing_status': new_song.processing_status
+        },
+        'deduplicated': deduplicated
     }), 201
+
+@admin_bp.route('/upload-song', methods=['POST'])
+@admin_required()
+def upload_song():
+    """
+    Subir canción manualmente en una sola petición (solo admin).
+    Para archivos grandes usar /uploads (por partes y reanudable).
+    """
+    # Verificar que se envió un archivo
+    if 'audio_file' not in request.files:
+        return jsonify({'error': 'No se envió ningún archivo'}), 400
+    
+    file = request.files['audio_file']
+    
+    if file.filename == '':
+        return jsonify({'error': 'Nombre de archivo vacío'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Solo se permiten archivos MP3 o WAV'}), 400
+    
+    # Guardar archivo con su hash como nombre (el mismo audio se guarda una sola vez)
+    extension = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+    try:
+        filename, deduplicated = save_audio_stream(file.stream, extension)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    return _create_uploaded_song(
+        request.form.get('title', 'Canción sin título'),
+        request.form.get('lyrics', ''),
+        request.form.get('tags', ''),
+        filename,
+        deduplicated
+    )
+
+def _upload_state_response(state, status=200):
+    rv = jsonify({'upload_id': state['upload_id'], 'offset': state['offset'], 'size': state['size']})
+    rv.status_code = status
+    rv.headers['Upload-Offset'] = str(state['offset'])
+    rv.headers['Upload-Length'] = str(state['size'])
+    rv.headers['Cache-Control'] = 'no-store'
+    return rv
+
+@admin_bp.route('/uploads', methods=['POST'])
+@admin_required()
+def create_upload():
+    """
+    Inicia una subida por partes.
+    Recibe JSON: filename, size, title, lyrics, tags.
+    Luego: PATCH /uploads/<id> con cabecera Upload-Offset y los bytes del fragmento,
+    GET/HEAD /uploads/<id> para saber desde dónde reanudar,
+    y POST /uploads/<id>/complete para crear la canción.
+    """
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename', ''))
+    if not allowed_file(filename):
+        return jsonify({'error': 'Solo se permiten archivos MP3 o WAV'}), 400
+    try:
+        size = int(data.get('size', 0))
+        upload_id = upload_store.create(
+            size,
+            filename.rsplit('.', 1)[1].lower(),
+            title=data.get('title') or 'Canción sin título',
+            lyrics=data.get('lyrics', ''),
+            tags=data.get('tags', '')
+        )
+    except ValueError:
+        return jsonify({'error': 'size debe ser un número'}), 400
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    return _upload_state_response({'upload_id': upload_id, 'offset': 0, 'size': size}, 201)
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET'])
+@admin_required()
+def upload_status(upload_id):
+    """Offset actual de la subida (también por HEAD, en la cabecera Upload-Offset)"""
+    try:
+        state = upload_store.state(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return _upload_state_response({'upload_id': upload_id, **state})
+
+@admin_bp.route('/uploads/<upload_id>', methods=['PATCH'])
+@admin_required()
+def upload_chunk(upload_id):
+    """Agrega un fragmento; el cuerpo se escribe a disco por bloques mientras llega."""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Falta la cabecera Upload-Offset'}), 400
+    try:
+        upload_store.append(upload_id, offset, request.stream)
+        state = upload_store.state(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return _upload_state_response({'upload_id': upload_id, **state})
+
+@admin_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@admin_required()
+def complete_upload(upload_id):
+    """Cierra la subida y crea la canción (reutiliza el audio si ya existía)."""
+    try:
+        filename, deduplicated, meta = upload_store.complete(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return _create_uploaded_song(meta['title'], meta['lyrics'], meta['tags'], filename, deduplicated)
+
+@admin_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@admin_required()
+def abort_upload(upload_id):
+    """Cancela una subida en curso"""
+    try:
+        upload_store.abort(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'message': 'Subida cancelada'}), 200
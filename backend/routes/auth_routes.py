@@ -1,12 +1,46 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from flask_bcrypt import Bcrypt
+from datetime import timedelta
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
 from models import db, User
+from services.audit_service import audit_writer
+from services.job_queue import get_queue
+from services.password_service import password_hasher, PasswordBusyError
+from utils.auth import STREAM_SCOPE, user_cache
 from utils.logger import audit_logger
 
 # Creamos el Blueprint (un grupo de rutas)
 auth_bp = Blueprint('auth', __name__)
-bcrypt = Bcrypt()
+
+
+def _busy_response():
+    return jsonify({'error': 'El servidor está ocupado, intenta de nuevo en unos segundos'}), 503
+
+
+def _rehash_password(app, user_id, old_hash, password):
+    """Trabajo en segundo plano: guarda el hash con el costo actual de bcrypt."""
+    new_hash = password_hasher.hash(password)
+    with app.app_context():
+        # Solo si nadie cambió la contraseña entretanto
+        db.session.execute(
+            db.update(User)
+            .where(User.id == user_id, User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+        )
+        db.session.commit()
+
+def _schedule_rehash(user, password):
+    """
+    Si el hash se generó con otro costo (tras cambiar BCRYPT_LOG_ROUNDS) lo
+    actualiza en la cola password_rehash: el login no paga un segundo bcrypt.
+    """
+    if not password_hasher.needs_rehash(user.password_hash):
+        return
+    app = current_app._get_current_object()
+    try:
+        get_queue('password_rehash').submit(_rehash_password, app, user.id, user.password_hash, password)
+    except Exception as e:
+        # No es crítico: se reintenta en el próximo login
+        audit_logger.warning(f"No se pudo encolar la actualización del hash de {user.email}: {e}")
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -25,7 +59,10 @@ def register():
         return jsonify({'error': 'El correo ya está registrado'}), 409
 
     # Encriptar contraseña (RNF-03)
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except PasswordBusyError:
+        return _busy_response()
 
     # Crear usuario
     new_user = User(
@@ -40,6 +77,7 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         audit_logger.info(f"Nuevo usuario registrado: {new_user.email}")
+        audit_writer.record('register', actor_id=new_user.id)
         return jsonify({'message': 'Usuario registrado exitosamente'}), 201
     except Exception as e:
         db.session.rollback()
@@ -56,10 +94,19 @@ def login():
     user = User.query.filter_by(email=data.get('email')).first()
 
     # Verificar contraseña
-    if user and bcrypt.check_password_hash(user.password_hash, data.get('password')):
-        # Crear token
-        access_token = create_access_token(identity=str(user.id))
+    try:
+        valid = user is not None and password_hasher.verify(user.password_hash, data.get('password'))
+    except PasswordBusyError:
+        audit_logger.warning(f"Login rechazado por carga: {data.get('email')}")
+        audit_writer.record('login_rejected', target_id=user.id if user else None, email=data.get('email'))
+        return _busy_response()
+
+    if valid:
+        _schedule_rehash(user, data['password'])
+        # Crear token (el rol va como claim para autorizar sin consultar la BD)
+        access_token = create_access_token(identity=str(user.id), additional_claims={'role': user.role})
         audit_logger.info(f"Login exitoso: {user.email}")
+        audit_writer.record('login', actor_id=user.id, author=user.name, role=user.role)
         
         return jsonify({
             'message': 'Login exitoso',
@@ -74,8 +121,24 @@ def login():
         }), 200
     
     audit_logger.warning(f"Intento de login fallido: {data.get('email')}")
+    audit_writer.record('login_failed', target_id=user.id if user else None, email=data.get('email'))
     return jsonify({'error': 'Credenciales inválidas'}), 401
 
+@auth_bp.route('/stream-token', methods=['POST'])
+@jwt_required()
+def stream_token():
+    """
+    Token de corta duración para abrir un EventSource (?stream_token=...).
+    Solo sirve en los endpoints SSE, así el token de sesión no queda en la URL ni en los logs.
+    """
+    ttl = current_app.config['STREAM_TOKEN_TTL']
+    token = create_access_token(
+        identity=get_jwt_identity(),
+        additional_claims={'role': get_jwt().get('role'), 'scope': STREAM_SCOPE},
+        expires_delta=timedelta(seconds=ttl)
+    )
+    return jsonify({'stream_token': token, 'expires_in': ttl}), 200
+
 @auth_bp.route('/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
@@ -83,26 +146,36 @@ def update_profile():
     RF03: Actualizar Perfil.
     Permite cambiar nombre y grado.
     """
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
     data = request.get_json()
 
-    if not user:
-        return jsonify({'error': 'Usuario no encontrado'}), 404
-
-    # Actualizar campos permitidos
+    # Actualizar campos permitidos (un solo UPDATE, sin cargar el usuario)
+    values = {}
     if 'name' in data:
-        user.name = data['name']
+        values['name'] = data['name']
     if 'grade_level' in data:
-        user.grade_level = data['grade_level']
+        values['grade_level'] = data['grade_level']
     
     # Si quiere cambiar contraseña
     if 'password' in data:
-        user.password_hash = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        try:
+            values['password_hash'] = password_hasher.hash(data['password'])
+        except PasswordBusyError:
+            return _busy_response()
+
+    if not values:
+        return jsonify({'message': 'Perfil actualizado correctamente'}), 200
 
     try:
+        result = db.session.execute(db.update(User).where(User.id == current_user_id).values(**values))
+        if result.rowcount == 0:
+            db.session.rollback()
+            return jsonify({'error': 'Usuario no encontrado'}), 404
         db.session.commit()
-        audit_logger.info(f"Perfil actualizado: {user.email}")
+        user_cache.invalidate(current_user_id)
+        audit_logger.info(f"Perfil actualizado: usuario {current_user_id}")
+        audit_writer.record('profile_updated', actor_id=current_user_id,
+                            fields=['password' if k == 'password_hash' else k for k in values])
         return jsonify({'message': 'Perfil actualizado correctamente'}), 200
     except Exception as e:
         db.session.rollback()
@@ -119,4 +192,5 @@ def forgot_password():
     # Aquí iría la lógica de envío de email (SendGrid/SMTP)
     # Para la tesis, simulamos el éxito.
     audit_logger.info(f"Solicitud de recuperación de contraseña para: {email}")
+    audit_writer.record('password_reset_requested', email=email)
     return jsonify({'message': 'Si el correo existe, se ha enviado un enlace de recuperación.'}), 200
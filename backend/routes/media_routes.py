@@ -0,0 +1,67 @@
+import mimetypes
+import os
+from flask import Blueprint, Response, abort, current_app, request, send_file
+from werkzeug.security import safe_join
+from utils.media import audio_etag, is_content_addressed
+
+# Entrega de audios (reemplaza al manejador /static por defecto de Flask):
+# Range/206 para adelantar y reanudar, ETag fuerte y caché immutable para
+# nombres direccionados por contenido, y envío por el proxy si está configurado.
+media_bp = Blueprint('media', __name__)
+
+# Versiones Opus del procesamiento de audio (no todos los sistemas lo conocen)
+mimetypes.add_type('audio/ogg', '.opus')
+
+# Un año: lo máximo que respetan los navegadores
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _send_audio(folder, kind, filename, content_addressed=True):
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    etag = audio_etag(path, filename, content_addressed)
+    immutable = content_addressed and is_content_addressed(filename)
+    # Direccionado por contenido: se guarda un año sin revalidar.
+    # Si no, el navegador guarda la copia pero la revalida con el ETag (304 sin cuerpo).
+    max_age = IMMUTABLE_MAX_AGE if immutable else 0
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    accel_prefix = current_app.config.get('AUDIO_ACCEL_REDIRECT')
+    if accel_prefix:
+        # nginx envía el archivo (y resuelve los Range); aquí solo respondemos 304 si aplica
+        rv = Response(mimetype=mimetype)
+        rv.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{kind}/{filename}"
+        rv.set_etag(etag)
+        rv.cache_control.public = True
+        rv.cache_control.max_age = max_age
+    else:
+        # send_file resuelve Range/206, If-Range, If-None-Match y X-Sendfile (USE_X_SENDFILE)
+        rv = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=max_age)
+
+    if immutable:
+        rv.cache_control.immutable = True
+    else:
+        rv.cache_control.no_cache = True
+
+    if accel_prefix:
+        rv = rv.make_conditional(request)
+        if rv.status_code == 304:
+            rv.headers.pop('X-Accel-Redirect', None)
+    return rv
+
+
+@media_bp.route('/static/music/<filename>', methods=['GET'])
+def music_file(filename):
+    """Canciones generadas y subidas (RF05)"""
+    return _send_audio(current_app.config['UPLOAD_FOLDER'], 'music', filename)
+
+
+@media_bp.route('/static/tts/<filename>', methods=['GET'])
+def tts_file(filename):
+    """
+    Audios de voz del asistente (caché de TTS). El nombre es el hash de la
+    petición, no del audio: ETag del contenido y revalidación, sin immutable.
+    """
+    return _send_audio(current_app.config['TTS_FOLDER'], 'tts', filename, content_addressed=False)
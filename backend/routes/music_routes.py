@@ -1,9 +1,19 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Song, Favorite, User
-from services.ai_service import generate_music_mock
+from models import db, Song, Favorite, User, SEARCH_CONFIG
+from services.ai_service import generate_music_batch, generate_music_cached, prompt_cache
+from services.job_queue import get_queue, QueueFullError
+from services.audit_service import audit_writer
+from services.cleanup_service import claim_audio_files
+from utils.auth import stream_auth_required
+from utils.database import read_only, replica_router
 from utils.logger import audit_logger
+from utils.pagination import get_page_args, paginate
+from sqlalchemy.dialects.postgresql import JSONPATH
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 from datetime import datetime, timedelta
+import json
 
 music_bp = Blueprint('music', __name__)
 
@@ -12,87 +22,418 @@ music_bp = Blueprint('music', __name__)
 def generate_music():
     """
     RF04: Generar Música con IA.
-    Recibe: prompt (texto), duration.
-    Guarda en Historial Temporal (RF07).
+    Recibe: prompt (texto), duration, similar (opcional, por defecto true).
+    Si el prompt (o uno muy parecido, salvo similar=false) ya se generó,
+    la canción se crea al instante con ese resultado.
+    Si no, la generación corre en segundo plano: devolvemos un job_id de inmediato
+    y la canción se guarda en el Historial Temporal (RF07) al terminar.
     """
     user_id = int(get_jwt_identity())
     data = request.get_json()
     prompt = data.get('prompt')
+    allow_similar = data.get('similar', True) is not False
 
     if not prompt:
         return jsonify({'error': 'El prompt es obligatorio'}), 400
 
+    if prompt_cache is not None:
+        cached, hit = prompt_cache.lookup(prompt, allow_similar)
+        if cached is not None:
+            try:
+                result = _save_song(user_id, prompt, cached, hit)
+            except Exception:
+                # Entrada vieja (el audio ya no está) o falló el commit: se genera en segundo plano
+                prompt_cache.discard(cached['filename'])
+            else:
+                job = get_queue('generation').record(result, owner_id=user_id)
+                return jsonify({
+                    'message': 'Canción generada (caché)',
+                    'job': job.to_dict()
+                }), 201
+
+    app = current_app._get_current_object()
     try:
-        # 1. Llamar al servicio de IA (Simulado)
-        ai_result = generate_music_mock(prompt)
-        
-        # 2. Guardar en Base de Datos (Historial)
-        new_song = Song(
-            user_id=user_id,
-            title=f"Canción sobre {prompt[:20]}...", # Título automático
-            prompt=prompt,
-            audio_filename=ai_result['filename'],
-            tags=ai_result['tags'],
-            lyrics=ai_result['lyrics'],
-            duration=10 # Demo
-        )
-        
+        job = get_queue('generation').submit(_generate_and_save, app, user_id, prompt, allow_similar, owner_id=user_id)
+    except QueueFullError:
+        audit_logger.warning(f"Cola de generación llena, rechazado User {user_id}")
+        return jsonify({'error': 'El servidor está ocupado, intenta en unos segundos'}), 503
+
+    return jsonify({
+        'message': 'Generación en cola',
+        'job': job.to_dict()
+    }), 202
+
+def _generate_and_save(app, user_id, prompt, allow_similar=True):
+    """
+    Trabajo en segundo plano: llama al motor de IA (o a la caché) y guarda la canción.
+    Lo que devuelve queda como 'result' del trabajo.
+    """
+    with app.app_context():
+        try:
+            # 1. Llamar al servicio de IA (Simulado)
+            ai_result, hit = generate_music_cached(prompt, allow_similar)
+        except Exception as e:
+            audit_logger.error(f"Error generando música: {str(e)}")
+            raise Exception('Error en el motor de IA')
+        return _save_song(user_id, prompt, ai_result, hit)
+
+def _new_song(user_id, prompt, ai_result):
+    return Song(
+        user_id=user_id,
+        title=f"Canción sobre {prompt[:20]}...", # Título automático
+        prompt=prompt,
+        audio_filename=ai_result['filename'],
+        tags=ai_result['tags'],
+        lyrics=ai_result['lyrics'],
+        duration=10 # Demo
+    )
+
+def _song_result(song):
+    return {
+        'id': song.id,
+        'title': song.title,
+        'audio_url': f"/static/music/{song.audio_filename}", # URL pública
+        'tags': song.tags,
+        'lyrics': song.lyrics
+    }
+
+def _save_song(user_id, prompt, ai_result, cache_hit=None):
+    """Guarda la canción en el Historial y publica el evento para el monitor."""
+    try:
+        # El archivo puede venir de la caché: que el reaper no lo borre antes del commit
+        if claim_audio_files([ai_result['filename']]):
+            raise FileNotFoundError(f"El audio {ai_result['filename']} ya no existe")
+        new_song = _new_song(user_id, prompt, ai_result)
         db.session.add(new_song)
         db.session.commit()
-        
-        audit_logger.info(f"Música generada por User {user_id}: {prompt}")
-        
-        return jsonify({
-            'message': 'Música generada exitosamente',
-            'song': {
-                'id': new_song.id,
-                'title': new_song.title,
-                'audio_url': f"/static/music/{new_song.audio_filename}", # URL pública
-                'tags': new_song.tags,
-                'lyrics': new_song.lyrics
-            }
-        }), 201
-
     except Exception as e:
+        db.session.rollback()
         audit_logger.error(f"Error generando música: {str(e)}")
-        return jsonify({'error': 'Error en el motor de IA'}), 500
+        raise Exception('Error en el motor de IA')
+
+    # También desde un trabajo en segundo plano: el historial del usuario se lee del primario
+    replica_router.note_write(user_id)
+    audit_logger.info(f"Música generada por User {user_id}: {prompt}" + (f" (caché: {cache_hit})" if cache_hit else ""))
+    author = db.session.get(User, user_id)
+    audit_writer.record('song_generated', actor_id=user_id, target_id=new_song.id,
+                        title=new_song.title, author=author.name, tags=new_song.tags)
+    return {'song': _song_result(new_song), 'cache': cache_hit}
+
+@music_bp.route('/generate-batch', methods=['POST'])
+@jwt_required()
+def generate_batch():
+    """
+    RF04: Generar varias canciones en una sola petición (p. ej. la semana de clases).
+    Recibe: prompts (lista), similar (opcional).
+    Los prompts van al motor de IA como un solo lote y las canciones se guardan
+    en una sola transacción. El resultado del trabajo trae un ítem por prompt,
+    en el mismo orden: {'prompt', 'song', 'cache'} o {'prompt', 'error'}.
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    prompts = data.get('prompts')
+    allow_similar = data.get('similar', True) is not False
+
+    if not isinstance(prompts, list) or not prompts:
+        return jsonify({'error': 'Se requiere una lista de prompts'}), 400
+    max_items = current_app.config['GENERATION_BATCH_MAX_ITEMS']
+    if len(prompts) > max_items:
+        return jsonify({'error': f'Máximo {max_items} prompts por petición'}), 400
+
+    app = current_app._get_current_object()
+    try:
+        job = get_queue('generation').submit(_generate_batch_and_save, app, user_id, prompts, allow_similar, owner_id=user_id)
+    except QueueFullError:
+        audit_logger.warning(f"Cola de generación llena, rechazado lote de User {user_id}")
+        return jsonify({'error': 'El servidor está ocupado, intenta en unos segundos'}), 503
+
+    return jsonify({
+        'message': 'Generación en cola',
+        'job': job.to_dict()
+    }), 202
+
+def _generate_batch_and_save(app, user_id, prompts, allow_similar=True):
+    """Trabajo en segundo plano del lote: una llamada al motor y un solo INSERT/COMMIT."""
+    items = [{'prompt': p} for p in prompts]
+    valid = [i for i, p in enumerate(prompts) if isinstance(p, str) and p.strip()]
+    for i, item in enumerate(items):
+        if i not in valid:
+            item['error'] = 'El prompt es obligatorio'
+
+    with app.app_context():
+        generated = generate_music_batch([prompts[i] for i in valid], allow_similar)
+
+        saved = []  # (posición, canción, acierto de caché)
+        for i, result in zip(valid, generated):
+            if isinstance(result, Exception):
+                audit_logger.error(f"Error generando música (lote): {str(result)}")
+                items[i]['error'] = 'Error en el motor de IA'
+            else:
+                ai_result, hit = result
+                saved.append((i, _new_song(user_id, prompts[i], ai_result), hit))
+
+        songs = []
+        if saved:
+            # Los archivos pueden venir de la caché: que el reaper no los borre antes del commit
+            missing = set(claim_audio_files([song.audio_filename for _, song, _ in saved]))
+            for i, song, _ in saved:
+                if song.audio_filename in missing:
+                    audit_logger.error(f"Error generando música (lote): el audio {song.audio_filename} ya no existe")
+                    items[i]['error'] = 'Error en el motor de IA'
+            saved = [entry for entry in saved if entry[1].audio_filename not in missing]
+        if saved:
+            try:
+                db.session.add_all([song for _, song, _ in saved])
+                # flush asigna los ids (un INSERT multi-fila con RETURNING en Postgres);
+                # armamos las respuestas antes del commit para no recargar cada fila
+                db.session.flush()
+                songs = [_song_result(song) for _, song, _ in saved]
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                audit_logger.error(f"Error guardando lote de canciones: {str(e)}")
+                for i, _, _ in saved:
+                    items[i]['error'] = 'Error guardando la canción'
+                songs = []
+
+        for (i, _, hit), song in zip(saved, songs):
+            items[i]['song'] = song
+            items[i]['cache'] = hit
+        if songs:
+            audit_logger.info(f"Lote generado por User {user_id}: {len(songs)} de {len(prompts)} canciones")
+            author = db.session.get(User, user_id)
+            for song in songs:
+                audit_writer.record('song_generated', actor_id=user_id, target_id=song['id'],
+                                    title=song['title'], author=author.name, tags=song['tags'])
+
+    return {'results': items}
+
+@music_bp.route('/cache-stats', methods=['GET'])
+@jwt_required()
+def prompt_cache_stats():
+    """Aciertos (exactos y por similitud) de la caché de prompts de este proceso"""
+    if prompt_cache is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **prompt_cache.stats()}), 200
+
+def _get_user_job(job_id, user_id):
+    job = get_queue('generation').get(job_id)
+    if not job or job.owner_id != user_id:
+        return None
+    return job
+
+@music_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """
+    Estado de una generación (polling).
+    status: queued | running | finished | failed
+    """
+    user_id = int(get_jwt_identity())
+    job = _get_user_job(job_id, user_id)
+    if not job:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job.to_dict()), 200
+
+@music_bp.route('/jobs/<job_id>/events', methods=['GET'])
+@stream_auth_required()
+def job_events(job_id):
+    """
+    Estado de una generación como Server-Sent Events.
+    Envía un evento por cada cambio de estado y cierra al terminar.
+    Desde EventSource: ?stream_token= (POST /api/auth/stream-token).
+    """
+    user_id = int(get_jwt_identity())
+    job = _get_user_job(job_id, user_id)
+    if not job:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+
+    queue = get_queue('generation')
+
+    def stream():
+        # El trabajo puede correr en otro worker: wait() lo vuelve a leer de la BD
+        current, version = job, None
+        while current is not None:
+            if current.version != version:
+                version = current.version
+                yield f"event: status\ndata: {json.dumps(current.to_dict())}\n\n"
+                if current.done:
+                    return
+            else:
+                # Comentario SSE para mantener viva la conexión
+                yield ": keep-alive\n\n"
+            current = queue.wait(job_id, version, timeout=15)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Etiquetas que se pueden filtrar por nombre (?curso=Matemática)
+TAG_KEYS = ('curso', 'instrumento', 'ritmo')
+
+def _apply_tag_filters(query):
+    """
+    Filtros por etiqueta con consultas de contención sobre tags (JSONB + índice GIN):
+    - ?curso= / ?instrumento= / ?ritmo=  ->  tags @> {"curso": "..."}
+    - ?tag=Piano                         ->  cualquier etiqueta con ese valor
+    - ?tag=instrumento:Piano             ->  tags @> {"instrumento": "Piano"}
+    Varios filtros se combinan con AND.
+    """
+    for key in TAG_KEYS:
+        value = request.args.get(key)
+        if value:
+            query = query.filter(Song.tags.contains({key: value}))
+
+    for tag in request.args.getlist('tag'):
+        key, sep, value = tag.partition(':')
+        if sep and key in TAG_KEYS:
+            query = query.filter(Song.tags.contains({key: value}))
+        else:
+            # json.dumps escapa el valor como literal de cadena válido en jsonpath
+            path = f"$.* ? (@ == {json.dumps(tag, ensure_ascii=False)})"
+            query = query.filter(Song.tags.op('@?')(db.cast(path, JSONPATH)))
+    return query
 
 @music_bp.route('/history', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_history():
     """
     RF11: Ver Historial.
-    Devuelve canciones de las últimas 24h.
-    Soporta filtros por query params (?tag=Piano).
+    Devuelve canciones del período de retención (HISTORY_RETENTION_HOURS, 24h por defecto), paginadas por cursor (?limit=&cursor=).
+    Soporta filtros por query params (?tag=Piano, ?curso=Matemática).
     """
     user_id = int(get_jwt_identity())
+    try:
+        limit, cursor = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Filtro de tiempo (24h)
-    since = datetime.utcnow() - timedelta(hours=24)
-    
-    query = Song.query.filter_by(user_id=user_id).filter(Song.created_at >= since)
+    # Filtro de tiempo: lo mismo que conserva la limpieza
+    since = datetime.utcnow() - timedelta(hours=current_app.config['HISTORY_RETENTION_HOURS'])
+
+    # El flag de favorito se calcula en la misma consulta (EXISTS), no una consulta por canción
+    is_fav = db.exists().where(Favorite.song_id == Song.id, Favorite.user_id == user_id)
+    query = Song.query.add_columns(is_fav.label('is_favorite')) \
+        .filter(Song.user_id == user_id, Song.created_at >= since)
     
-    # Filtros adicionales (Buscador)
+    # Filtros adicionales (Buscador de texto completo: título, prompt y letra)
     search = request.args.get('search')
     if search:
-        query = query.filter(Song.title.contains(search))
+        query = query.filter(Song.search_vector.op('@@')(_tsquery(search)))
+    query = _apply_tag_filters(query)
 
-    songs = query.order_by(Song.created_at.desc()).all()
+    rows, next_cursor = paginate(query, Song.created_at, Song.id, limit, cursor)
     
     results = []
-    for s in songs:
-        # Verificar si es favorita
-        is_fav = Favorite.query.filter_by(user_id=user_id, song_id=s.id).first() is not None
+    for s, is_favorite in rows:
         results.append({
             'id': s.id,
             'title': s.title,
             'created_at': s.created_at.isoformat(),
             'tags': s.tags,
-            'is_favorite': is_fav,
+            'is_favorite': is_favorite,
             'audio_url': f"/static/music/{s.audio_filename}"
         })
 
-    return jsonify(results), 200
+    return jsonify({'items': results, 'next_cursor': next_cursor}), 200
+
+@music_bp.route('/songs/<int:song_id>', methods=['GET'])
+@jwt_required()
+@read_only()
+def get_song(song_id):
+    """
+    Una canción del usuario, con su letra (la abre el reproductor aunque no
+    esté en la primera página del historial o de favoritos).
+    """
+    user_id = int(get_jwt_identity())
+    is_fav = db.exists().where(Favorite.song_id == Song.id, Favorite.user_id == user_id)
+    row = Song.query.add_columns(is_fav.label('is_favorite')) \
+        .filter(Song.id == song_id, Song.user_id == user_id).first()
+    if not row:
+        return jsonify({'error': 'Canción no encontrada'}), 404
+
+    s, is_favorite = row
+    return jsonify({
+        'id': s.id,
+        'title': s.title,
+        'created_at': s.created_at.isoformat(),
+        'tags': s.tags,
+        'lyrics': s.lyrics,
+        'is_favorite': is_favorite,
+        'audio_url': f"/static/music/{s.audio_filename}"
+    }), 200
+
+def _tsquery(text):
+    # Sintaxis tipo buscador web: palabras, "frases exactas", -excluir, OR
+    return db.func.websearch_to_tsquery(SEARCH_CONFIG, text)
+
+@music_bp.route('/search', methods=['GET'])
+@jwt_required()
+@read_only()
+def search_songs():
+    """
+    Búsqueda de texto completo en las canciones del usuario.
+    Recibe: ?q= (texto), ?limit= y los filtros de etiqueta. Devuelve los resultados ordenados por relevancia.
+    Ignora tildes y usa raíces en español ("contando" encuentra "contar").
+    """
+    user_id = int(get_jwt_identity())
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'El parámetro q es obligatorio'}), 400
+    try:
+        limit, _ = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    tsquery = _tsquery(q)
+    rank = db.func.ts_rank(Song.search_vector, tsquery)
+    is_fav = db.exists().where(Favorite.song_id == Song.id, Favorite.user_id == user_id)
+    query = Song.query.add_columns(rank.label('rank'), is_fav.label('is_favorite')) \
+        .filter(Song.user_id == user_id, Song.search_vector.op('@@')(tsquery))
+    rows = _apply_tag_filters(query) \
+        .order_by(rank.desc(), Song.created_at.desc()) \
+        .limit(limit).all()
+
+    results = []
+    for s, score, is_favorite in rows:
+        results.append({
+            'id': s.id,
+            'title': s.title,
+            'created_at': s.created_at.isoformat(),
+            'tags': s.tags,
+            'is_favorite': is_favorite,
+            'audio_url': f"/static/music/{s.audio_filename}",
+            'rank': round(score, 4)
+        })
+
+    return jsonify({'items': results}), 200
+
+@music_bp.route('/facets', methods=['GET'])
+@jwt_required()
+@read_only()
+def tag_facets():
+    """
+    Conteo de canciones por etiqueta en la biblioteca del usuario, en una sola
+    consulta agregada. Acepta los filtros de etiqueta para refinar (?curso=...).
+    Ej: {"instrumento": [{"value": "Piano", "count": 4}], ...}
+    """
+    user_id = int(get_jwt_identity())
+    each = db.func.jsonb_each_text(Song.tags).table_valued('key', 'value').lateral()
+    count = db.func.count().label('count')
+
+    query = db.session.query(each.c.key, each.c.value, count) \
+        .select_from(Song).join(each, db.true()) \
+        .filter(Song.user_id == user_id, db.func.jsonb_typeof(Song.tags) == 'object')
+    rows = _apply_tag_filters(query) \
+        .group_by(each.c.key, each.c.value) \
+        .order_by(each.c.key, count.desc(), each.c.value).all()
+
+    facets = {}
+    for key, value, n in rows:
+        facets.setdefault(key, []).append({'value': value, 'count': n})
+    return jsonify(facets), 200
 
 @music_bp.route('/favorites', methods=['POST'])
 @jwt_required()
@@ -116,19 +457,37 @@ def add_favorite():
         
     new_fav = Favorite(user_id=user_id, song_id=song_id)
     db.session.add(new_fav)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Otra petición lo guardó al mismo tiempo (índice único user_id, song_id)
+        db.session.rollback()
+        return jsonify({'message': 'Ya está en favoritos'}), 200
     
     audit_logger.info(f"User {user_id} guardó en favoritos Song {song_id}")
+    audit_writer.record('favorite_added', actor_id=user_id, target_id=song_id, title=song.title)
     return jsonify({'message': 'Guardado en favoritos'}), 201
 
 @music_bp.route('/favorites', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_favorites():
     """
     RF08: Listar Favoritos.
+    Paginado por cursor (?limit=&cursor=), del más reciente al más antiguo.
+    Acepta los mismos filtros de etiqueta que /history.
     """
     user_id = int(get_jwt_identity())
-    favorites = Favorite.query.filter_by(user_id=user_id).all()
+    try:
+        limit, cursor = get_page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Traemos la canción en el mismo JOIN en lugar de cargarla por cada favorito
+    query = Favorite.query.filter_by(user_id=user_id) \
+        .join(Favorite.song).options(contains_eager(Favorite.song))
+    query = _apply_tag_filters(query)
+    favorites, next_cursor = paginate(query, Favorite.favorited_at, Favorite.id, limit, cursor)
     
     results = []
     for fav in favorites:
@@ -141,7 +500,7 @@ def get_favorites():
             'favorited_at': fav.favorited_at.isoformat()
         })
         
-    return jsonify(results), 200
+    return jsonify({'items': results, 'next_cursor': next_cursor}), 200
 
 @music_bp.route('/favorites/<int:song_id>', methods=['DELETE'])
 @jwt_required()
@@ -158,4 +517,5 @@ def remove_favorite(song_id):
     db.session.delete(fav)
     db.session.commit()
     audit_logger.info(f"User {user_id} eliminó de favoritos Song {song_id}")
+    audit_writer.record('favorite_removed', actor_id=user_id, target_id=song_id)
     return jsonify({'message': 'Eliminado de favoritos'}), 200
@@ -1,20 +1,70 @@
-from flask import Blueprint, request, jsonify
-from services.tts_service import generate_tts_audio
+from flask import Blueprint, request, jsonify, Response, current_app
+from itertools import chain
+from services.tts_service import generate_tts_audio, generate_tts_batch, stream_tts_audio, tts_cache, VOICE, RATE
+from utils.logger import audit_logger
 
 tts_bp = Blueprint('tts', __name__)
 
-@tts_bp.route('/speak', methods=['POST'])
+@tts_bp.route('/speak', methods=['GET', 'POST'])
 def speak():
-    data = request.get_json()
+    """
+    Convierte texto a voz.
+    Con stream=1 responde directamente con el audio (audio/mpeg, chunked)
+    a medida que se sintetiza; GET permite usarlo como src de un <audio>.
+    """
+    data = request.get_json() if request.method == 'POST' else request.args
     text = data.get('text')
     
     if not text:
         return jsonify({'error': 'Texto requerido'}), 400
+
+    voice = data.get('voice', VOICE)
+    rate = data.get('rate', RATE)
+
+    if data.get('stream') in (True, '1', 'true'):
+        try:
+            audio = stream_tts_audio(text, voice, rate)
+            # Esperamos el primer fragmento para poder responder 500 si el motor falla
+            first_chunk = next(audio)
+        except Exception as e:
+            audit_logger.error(f"Error generando TTS (streaming): {str(e)}")
+            return jsonify({'error': 'Error generando audio'}), 500
+        return Response(chain([first_chunk], audio), mimetype='audio/mpeg', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
         
-    audio_url = generate_tts_audio(text)
+    audio_url = generate_tts_audio(text, voice, rate)
     
     if not audio_url:
         return jsonify({'error': 'Error generando audio'}), 500
         
     # Retornamos la URL completa suponiendo que el frontend usa la misma base
     return jsonify({'audio_url': audio_url}), 200
+
+@tts_bp.route('/stats', methods=['GET'])
+def cache_stats():
+    """Aciertos/fallos y uso de disco de la caché de TTS"""
+    return jsonify(tts_cache.stats()), 200
+
+@tts_bp.route('/speak-batch', methods=['POST'])
+def speak_batch():
+    """
+    Sintetiza varias frases en una sola petición.
+    Recibe: texts (lista), voice y rate opcionales.
+    """
+    data = request.get_json()
+    texts = data.get('texts')
+
+    if not texts or not isinstance(texts, list) or not all(isinstance(t, str) and t for t in texts):
+        return jsonify({'error': 'Se requiere una lista de textos'}), 400
+
+    max_items = current_app.config['TTS_BATCH_MAX_ITEMS']
+    if len(texts) > max_items:
+        return jsonify({'error': f'Máximo {max_items} textos por petición'}), 400
+
+    audio_urls = generate_tts_batch(texts, data.get('voice', VOICE), data.get('rate', RATE))
+
+    return jsonify({
+        'results': [{'text': t, 'audio_url': url} for t, url in zip(texts, audio_urls)]
+    }), 200
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from models import db, AuditEvent
+
+
+class ActivityFeed:
+    """
+    Actividad reciente para el monitor del admin (RF11): generaciones, logins
+    y favoritos, leídos de audit_events. La tabla es común a todos los workers,
+    así que el cursor (id del próximo evento) vale en cualquiera de ellos.
+    Los eventos se publican con audit_writer.record() (services/audit_service.py).
+    """
+
+    # Acción en audit_events -> tipo de evento del monitor
+    EVENTS = {
+        'song_generated': 'generation',
+        'login': 'login',
+        'favorite_added': 'favorite_added',
+        'favorite_removed': 'favorite_removed',
+    }
+
+    def __init__(self, lookback_seconds=10):
+        # Los lotes de cada worker se confirman en cualquier orden: un id menor
+        # puede aparecer después de uno mayor. Se vuelve a mirar esta ventana.
+        self.lookback = timedelta(seconds=lookback_seconds)
+
+    def head(self):
+        """Cursor del próximo evento."""
+        return (db.session.query(db.func.max(AuditEvent.id)).scalar() or 0) + 1
+
+    def follow(self, since):
+        """Lector desde el cursor `since` (uno por conexión del stream)."""
+        return _Follower(self, since)
+
+    def _query(self, *conditions):
+        return db.session.query(AuditEvent) \
+            .filter(AuditEvent.action.in_(list(self.EVENTS)), *conditions) \
+            .order_by(AuditEvent.id).limit(500).all()
+
+    def to_event(self, row):
+        return {
+            'offset': row.id,
+            'type': self.EVENTS[row.action],
+            'at': row.created_at.isoformat(),
+            'user_id': row.actor_id,
+            'song_id': row.target_id,
+            **(row.details or {})
+        }
+
+
+class _Follower:
+
+    def __init__(self, feed, since):
+        self.feed = feed
+        self.since = since
+        # Ids ya entregados dentro de la ventana: los de antes del cursor se dan por vistos
+        window = datetime.utcnow() - feed.lookback
+        self._seen = {
+            row_id: created_at for row_id, created_at in db.session.query(AuditEvent.id, AuditEvent.created_at)
+            .filter(AuditEvent.id < since, AuditEvent.created_at >= window)
+        }
+
+    def poll(self):
+        """Eventos nuevos desde la última llamada (con app context)."""
+        window = datetime.utcnow() - self.feed.lookback
+        rows = self.feed._query(db.or_(AuditEvent.id >= self.since, AuditEvent.created_at >= window))
+        events = []
+        for row in rows:
+            if row.id in self._seen:
+                continue
+            self._seen[row.id] = row.created_at
+            events.append(self.feed.to_event(row))
+            self.since = max(self.since, row.id + 1)
+        self._seen = {row_id: at for row_id, at in self._seen.items() if at >= window}
+        return events
+
+
+# Instancia global (solo lee de la BD: vale igual en todos los procesos)
+activity_feed = ActivityFeed()
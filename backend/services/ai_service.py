@@ -1,5 +1,43 @@
+import math
+import os
+import re
+import threading
 import time
 import random
+import unicodedata
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from config import Config
+from models import db, CachedAudio
+from utils.database import advisory_xact_lock
+from utils.logger import audit_logger
+from utils.metrics import metrics
+
+# Lista de canciones de prueba (URLs públicas o archivos locales)
+# Para el prototipo, usaremos unos archivos placeholder
+MOCK_RESPONSES = [
+    {
+        "filename": "demo_piano_happy.mp3",
+        "tags": {"instrumento": "Piano", "ritmo": "Alegre", "curso": "Matemática"},
+        "lyrics": "Uno, dos, tres, vamos a contar..."
+    },
+    {
+        "filename": "demo_guitar_calm.mp3",
+        "tags": {"instrumento": "Guitarra", "ritmo": "Lento", "curso": "Comunicación"},
+        "lyrics": "Había una vez un barquito chiquitito..."
+    },
+    {
+        "filename": "demo_flute_march.mp3",
+        "tags": {"instrumento": "Flauta", "ritmo": "Marcha", "curso": "Psicomotricidad"},
+        "lyrics": "Marchando, marchando, te voy saludando..."
+    }
+]
+
+# Archivos compartidos por todas las canciones simuladas: no son de ninguna
+# canción en particular y el FileReaper nunca los borra
+PLACEHOLDER_AUDIO = frozenset(r['filename'] for r in MOCK_RESPONSES)
 
 def generate_music_mock(prompt, duration=10):
     """
@@ -9,27 +47,396 @@ def generate_music_mock(prompt, duration=10):
     # Simular tiempo de procesamiento (La IA tarda un poco)
     time.sleep(2)
     
-    # Lista de canciones de prueba (URLs públicas o archivos locales)
-    # Para el prototipo, usaremos unos archivos placeholder
-    mock_responses = [
-        {
-            "filename": "demo_piano_happy.mp3",
-            "tags": {"instrumento": "Piano", "ritmo": "Alegre", "curso": "Matemática"},
-            "lyrics": "Uno, dos, tres, vamos a contar..."
-        },
-        {
-            "filename": "demo_guitar_calm.mp3",
-            "tags": {"instrumento": "Guitarra", "ritmo": "Lento", "curso": "Comunicación"},
-            "lyrics": "Había una vez un barquito chiquitito..."
-        },
-        {
-            "filename": "demo_flute_march.mp3",
-            "tags": {"instrumento": "Flauta", "ritmo": "Marcha", "curso": "Psicomotricidad"},
-            "lyrics": "Marchando, marchando, te voy saludando..."
-        }
-    ]
-    
     # Seleccionar uno al azar para variar
-    result = random.choice(mock_responses)
+    result = random.choice(MOCK_RESPONSES)
     
     return result
+
+# Tiempo del motor de generación (solo los fallos de caché llegan hasta aquí)
+GENERATION_SECONDS = metrics.histogram(
+    'music_generation_duration_seconds', 'Tiempo de generación de música por llamada al motor',
+    buckets=(0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120))
+
+def generate_music_batch_mock(prompts, duration=10):
+    """
+    Simula la generación de varios prompts en un solo lote (inferencia por lotes):
+    el costo fijo de la llamada se paga una vez y cada ítem suma poco.
+    Devuelve un resultado por prompt, en el mismo orden.
+    """
+    time.sleep(2 + 0.2 * len(prompts))
+    return [random.choice(MOCK_RESPONSES) for _ in prompts]
+
+
+def normalize_prompt(prompt):
+    """Minúsculas, sin tildes ni signos y con espacios simples: "¡Canción!" -> "cancion"."""
+    text = unicodedata.normalize('NFKD', prompt.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9ñ]+', ' ', text).split())
+
+
+def _ngrams(text, n=3):
+    padded = f" {text} "
+    return Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+class PromptCache:
+    """
+    Caché de resultados de generación por prompt (una por proceso).
+    - Exacta: el mismo prompt normalizado devuelve el mismo resultado.
+    - Similar (opcional): vectores TF-IDF de trigramas de caracteres y
+      similitud coseno >= `threshold` ("contar del 1 al 10" ~ "contar 1 al 10").
+    Un índice invertido por trigrama limita la comparación a los candidatos
+    que comparten trigramas con la consulta.
+    Cada archivo que la caché puede entregar tiene un préstamo en cached_audio
+    (filename, holder): mientras esté vigente el FileReaper de ningún proceso
+    lo borra. Los préstamos duran `lease_seconds`, se renuevan al usarlos y se
+    devuelven cuando sale de la caché su última entrada.
+    """
+
+    # Una entrada deja de entregarse un poco antes de que venza su préstamo
+    LEASE_MARGIN = timedelta(minutes=1)
+
+    def __init__(self, max_entries=1000, threshold=0.85, audio_folder=None, lease_seconds=86400):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.audio_folder = audio_folder
+        self.lease = timedelta(seconds=lease_seconds)
+        self.holder = uuid.uuid4().hex  # Identifica los préstamos de esta caché
+        self._entries = OrderedDict()   # clave -> resultado
+        self._grams = {}                # clave -> Counter de trigramas
+        self._postings = {}             # trigrama -> set de claves
+        self._inflight = {}             # clave -> Future (generaciones en curso)
+        self._leases = {}               # archivo -> [entradas que lo usan, hasta cuándo entregarlo]
+        self._lock = threading.Lock()
+        # Serializa los cambios de préstamos en la BD (se toma antes que _lock)
+        self._lease_lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def lookup(self, prompt, allow_similar=True):
+        """Devuelve (resultado, 'exact' | 'similar') o (None, None)."""
+        key = normalize_prompt(prompt)
+        expired = []
+        result, hit = None, None
+        with self._lock:
+            result = self._get(key, expired)
+            if result is not None:
+                self.hits += 1
+                hit = 'exact'
+            elif allow_similar and self.threshold < 1:
+                similar_key = self._most_similar(key)
+                if similar_key is not None:
+                    result = self._get(similar_key, expired)
+                    if result is not None:
+                        self.similar_hits += 1
+                        hit = 'similar'
+            renew = result is not None and self._needs_renewal(result['filename'])
+        if expired:
+            self._release(expired)
+        if renew:
+            self._renew(result['filename'])
+        return result, hit
+
+    def get_or_create(self, prompt, create, allow_similar=True):
+        """
+        Resultado de la caché o create(prompt). Si el mismo prompt ya se está
+        generando, espera esa generación en vez de lanzar otra.
+        Devuelve (resultado, 'exact' | 'similar' | None).
+        """
+        result, hit = self.lookup(prompt, allow_similar)
+        if result is not None:
+            return result, hit
+
+        key = normalize_prompt(prompt)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result(), 'exact'
+        try:
+            result = create(prompt)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(prompt, result)
+            future.set_result(result)
+            return result, None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def put(self, prompt, result):
+        key = normalize_prompt(prompt)
+        filename = result['filename']
+        released = []
+        with self._lease_lock:
+            with self._lock:
+                leased = filename in PLACEHOLDER_AUDIO or filename in self._leases
+            # Sin préstamo no se guarda: otro proceso podría borrar el archivo
+            if not leased and not self._acquire(filename):
+                return
+            with self._lock:
+                if key in self._entries:
+                    self._remove(key, released)
+                self._entries[key] = result
+                if filename not in PLACEHOLDER_AUDIO:
+                    lease = self._leases.setdefault(filename, [0, datetime.utcnow() + self.lease - self.LEASE_MARGIN])
+                    lease[0] += 1
+                grams = _ngrams(key)
+                self._grams[key] = grams
+                for gram in grams:
+                    self._postings.setdefault(gram, set()).add(key)
+                while len(self._entries) > self.max_entries:
+                    self._remove(next(iter(self._entries)), released)
+            self._return_leases(released)
+
+    def discard(self, filename):
+        """Quita las entradas que entregan `filename` (p. ej. el archivo ya no está)."""
+        released = []
+        with self._lease_lock:
+            with self._lock:
+                self._remove_file(filename, released)
+            self._return_leases(released)
+
+    def count_misses(self, n):
+        """Para generaciones por lote, que consultan con lookup() y guardan con put()."""
+        with self._lock:
+            self.misses += n
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_ratio': round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+                'threshold': self.threshold,
+                'leased_files': len(self._leases),
+            }
+
+    def _get(self, key, expired):
+        result = self._entries.get(key)
+        if result is None:
+            return None
+        lease = self._leases.get(result['filename'])
+        if lease is not None and lease[1] <= datetime.utcnow():
+            # El préstamo vence: el archivo ya puede borrarse, la entrada no sirve
+            self._remove(key, expired)
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _remove(self, key, released):
+        """Quita la entrada; `released` recibe el archivo si era su última entrada."""
+        result = self._entries.pop(key, None)
+        if result is not None:
+            lease = self._leases.get(result['filename'])
+            if lease is not None:
+                lease[0] -= 1
+                if lease[0] <= 0:
+                    del self._leases[result['filename']]
+                    released.append(result['filename'])
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def _remove_file(self, filename, released):
+        for key in [k for k, r in self._entries.items() if r['filename'] == filename]:
+            self._remove(key, released)
+
+    def _needs_renewal(self, filename):
+        lease = self._leases.get(filename)
+        return lease is not None and lease[1] - datetime.utcnow() < self.lease / 2
+
+    def _acquire(self, filename):
+        """Registra el préstamo del archivo; False si ya no existe o la BD falla."""
+        try:
+            with db.engine.begin() as conn:
+                # Mismo bloqueo que el FileReaper: no puede borrarlo a la mitad
+                advisory_xact_lock(conn, [f"audio:{filename}"], shared=True)
+                if self.audio_folder and not os.path.exists(os.path.join(self.audio_folder, filename)):
+                    return False
+                expires_at = datetime.utcnow() + self.lease
+                updated = conn.execute(
+                    db.update(CachedAudio)
+                    .where(CachedAudio.filename == filename, CachedAudio.holder == self.holder)
+                    .values(expires_at=expires_at)
+                ).rowcount
+                if not updated:
+                    conn.execute(db.insert(CachedAudio).values(
+                        filename=filename, holder=self.holder, expires_at=expires_at))
+            return True
+        except Exception as e:
+            audit_logger.warning(f"Caché de prompts: no se pudo registrar el préstamo de {filename}: {e}")
+            return False
+
+    def _renew(self, filename):
+        """Extiende el préstamo de un archivo que se sigue usando."""
+        with self._lease_lock:
+            with self._lock:
+                if not self._needs_renewal(filename):
+                    return  # Otro hilo ya lo renovó (o salió de la caché)
+            now = datetime.utcnow()
+            try:
+                with db.engine.begin() as conn:
+                    renewed = conn.execute(
+                        db.update(CachedAudio)
+                        .where(CachedAudio.filename == filename, CachedAudio.holder == self.holder,
+                               CachedAudio.expires_at > now)
+                        .values(expires_at=now + self.lease)
+                    ).rowcount
+            except Exception as e:
+                audit_logger.warning(f"Caché de prompts: no se pudo renovar el préstamo de {filename}: {e}")
+                return
+            released = []
+            with self._lock:
+                if renewed:
+                    lease = self._leases.get(filename)
+                    if lease is not None:
+                        lease[1] = now + self.lease - self.LEASE_MARGIN
+                else:
+                    # El préstamo ya no está (venció y se limpió): sus entradas no sirven
+                    self._remove_file(filename, released)
+            self._return_leases(released)
+
+    def _release(self, filenames):
+        with self._lease_lock:
+            self._return_leases(filenames)
+
+    def _return_leases(self, filenames):
+        """
+        Devuelve los préstamos (con _lease_lock tomado): vencen ya y la limpieza
+        del historial borra el archivo si ninguna canción lo usa.
+        """
+        with self._lock:
+            # Pudo volver a la caché mientras tanto
+            filenames = [name for name in set(filenames) if name not in self._leases]
+        if not filenames:
+            return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    db.update(CachedAudio)
+                    .where(CachedAudio.filename.in_(filenames), CachedAudio.holder == self.holder)
+                    .values(expires_at=datetime.utcnow())
+                )
+        except Exception as e:
+            # Vencen solos al terminar el plazo
+            audit_logger.warning(f"Caché de prompts: no se pudieron devolver {len(filenames)} préstamos: {e}")
+
+    def _weights(self, grams):
+        # TF-IDF: los trigramas presentes en muchos prompts ("can", "ion") pesan poco
+        total = len(self._entries) + 1
+        return {g: c * (math.log(total / (1 + len(self._postings.get(g, ())))) + 1) for g, c in grams.items()}
+
+    def _most_similar(self, key):
+        grams = _ngrams(key)
+        candidates = Counter()
+        for gram in grams:
+            for other in self._postings.get(gram, ()):
+                candidates[other] += 1
+        if not candidates:
+            return None
+
+        query = self._weights(grams)
+        query_norm = math.sqrt(sum(w * w for w in query.values()))
+        best_key, best_score = None, self.threshold
+        # Solo los que más trigramas comparten: el resto no puede superar el umbral
+        for other, _ in candidates.most_common(20):
+            weights = self._weights(self._grams[other])
+            dot = sum(w * weights.get(g, 0.0) for g, w in query.items())
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            score = dot / (query_norm * norm) if norm else 0.0
+            if score >= best_score:
+                best_key, best_score = other, score
+        return best_key
+
+
+# Instancia global (una por proceso)
+prompt_cache = PromptCache(
+    Config.PROMPT_CACHE_SIZE,
+    Config.PROMPT_CACHE_SIMILARITY,
+    Config.UPLOAD_FOLDER,
+    Config.PROMPT_CACHE_LEASE_HOURS * 3600
+) if Config.PROMPT_CACHE_ENABLED else None
+
+
+@metrics.register_collector
+def _prompt_cache_metrics():
+    if prompt_cache is None:
+        return []
+    stats = prompt_cache.stats()
+    return [
+        ('cache_hits_total', 'counter', 'Aciertos de caché', {'cache': 'prompt'}, stats['hits'] + stats['similar_hits']),
+        ('cache_misses_total', 'counter', 'Fallos de caché', {'cache': 'prompt'}, stats['misses']),
+        ('cache_entries', 'gauge', 'Entradas en caché', {'cache': 'prompt'}, stats['entries']),
+    ]
+
+
+def _generate(prompt):
+    with GENERATION_SECONDS.time(mode='single'):
+        return generate_music_mock(prompt)
+
+
+def generate_music_cached(prompt, allow_similar=True):
+    """
+    Genera música para el prompt pasando por la caché de prompts.
+    Devuelve (resultado, acierto) con acierto 'exact', 'similar' o None.
+    """
+    if prompt_cache is None:
+        return _generate(prompt), None
+    return prompt_cache.get_or_create(prompt, _generate, allow_similar)
+
+
+def generate_music_batch(prompts, allow_similar=True):
+    """
+    Genera varios prompts. Los que están en la caché se resuelven ahí y el resto
+    va al motor en un solo lote (los repetidos dentro del lote se generan una vez).
+    Devuelve, en el mismo orden, (resultado, acierto) o la excepción de ese ítem.
+    """
+    results = [None] * len(prompts)
+    pending = OrderedDict()  # prompt normalizado -> posiciones que lo piden
+    for i, prompt in enumerate(prompts):
+        if prompt_cache is not None:
+            cached, hit = prompt_cache.lookup(prompt, allow_similar)
+            if cached is not None:
+                results[i] = (cached, hit)
+                continue
+        pending.setdefault(normalize_prompt(prompt), []).append(i)
+
+    if pending:
+        batch = [prompts[positions[0]] for positions in pending.values()]
+        if prompt_cache is not None:
+            prompt_cache.count_misses(len(batch))
+        try:
+            with GENERATION_SECONDS.time(mode='batch'):
+                generated = generate_music_batch_mock(batch)
+        except Exception as e:
+            generated = [e] * len(batch)
+
+        for prompt, positions, result in zip(batch, pending.values(), generated):
+            if isinstance(result, Exception):
+                for i in positions:
+                    results[i] = result
+                continue
+            if prompt_cache is not None:
+                prompt_cache.put(prompt, result)
+            results[positions[0]] = (result, None)
+            for i in positions[1:]:
+                results[i] = (result, 'exact')
+    return results
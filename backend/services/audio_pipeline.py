@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from models import db, Song
+from services.audio_processing import process_audio
+from services.cleanup_service import claim_audio_files, file_reaper
+from services.scheduler import scheduled_job
+from utils.logger import audit_logger
+
+# Estados de Song.processing_status
+PENDING = 'pending'
+PROCESSING = 'processing'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class AudioPipeline:
+    """
+    Procesa en segundo plano los audios subidos por el admin: ffmpeg corre en
+    un pool de procesos (no ocupa los workers web) y, al terminar, la canción
+    apunta a la versión procesada con su duración y datos técnicos.
+    Si falla se reintenta AUDIO_PROCESS_RETRIES veces; mientras tanto (y si al
+    final falla) se sigue sirviendo el archivo original.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def available(self, app):
+        config = app.config
+        return bool(config['AUDIO_PIPELINE_ENABLED']
+                    and shutil.which(config['FFMPEG_BINARY'])
+                    and shutil.which(config['FFPROBE_BINARY']))
+
+    def _get_executor(self, app):
+        with self._lock:
+            if self._executor is None:
+                # spawn: los procesos no heredan los hilos del servidor (scheduler, colas)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=app.config['AUDIO_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def submit(self, app, song_id, attempt=0):
+        with app.app_context():
+            song = db.session.get(Song, song_id)
+            if song is None or song.processing_status == READY:
+                return
+            song.processing_status = PROCESSING
+            source = song.audio_filename
+            db.session.commit()
+
+        config = app.config
+        future = self._get_executor(app).submit(
+            process_audio,
+            os.path.join(config['UPLOAD_FOLDER'], source),
+            config['UPLOAD_FOLDER'],
+            config['AUDIO_FORMAT'],
+            config['AUDIO_BITRATE'],
+            config['AUDIO_LOUDNESS_TARGET'],
+            config['FFMPEG_BINARY'],
+            config['FFPROBE_BINARY'],
+            config['AUDIO_PROCESS_TIMEOUT'],
+        )
+        future.add_done_callback(lambda f: self._finish(app, song_id, source, attempt, f))
+
+    def _finish(self, app, song_id, source, attempt, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # Un proceso murió (p. ej. sin memoria): el pool ya no sirve, se crea otro
+                with self._lock:
+                    if self._executor is not None:
+                        self._executor.shutdown(wait=False)
+                        self._executor = None
+            if attempt < app.config['AUDIO_PROCESS_RETRIES']:
+                audit_logger.warning(f"Procesamiento de audio falló (canción {song_id}, intento {attempt + 1}): {e}")
+                # Espera creciente entre intentos
+                threading.Timer(5 * 2 ** attempt, self.submit, (app, song_id, attempt + 1)).start()
+                return
+            audit_logger.error(f"Procesamiento de audio falló definitivamente (canción {song_id}): {e}")
+            self._set_status(app, song_id, FAILED)
+            return
+
+        with app.app_context():
+            song = db.session.get(Song, song_id)
+            if song is None or song.audio_filename != source:
+                # Se borró o ya la procesó otra ejecución
+                return
+            if claim_audio_files([result['filename']]):
+                # La salida ya existía (mismo audio) y el reaper la borró en medio: se procesa otra vez
+                db.session.rollback()
+                audit_logger.warning(f"Audio procesado borrado antes de guardarlo (canción {song_id}), se reintenta")
+                threading.Timer(1, self.submit, (app, song_id, attempt)).start()
+                return
+            song.audio_filename = result['filename']
+            song.duration = round(result['duration']) if result['duration'] else None
+            song.audio_info = result['audio_info']
+            song.processing_status = READY
+            if app.config['AUDIO_KEEP_ORIGINAL']:
+                song.original_filename = source
+            db.session.commit()
+
+        if not app.config['AUDIO_KEEP_ORIGINAL'] and source != result['filename']:
+            # El reaper solo lo borra si ninguna otra canción lo usa
+            file_reaper.submit(app, [source])
+        audit_logger.info(f"Audio procesado (canción {song_id}): {source} -> {result['filename']}")
+
+    def _set_status(self, app, song_id, status):
+        with app.app_context():
+            db.session.execute(db.update(Song).where(Song.id == song_id).values(processing_status=status))
+            db.session.commit()
+
+
+# Instancia global (un pool por proceso, se crea con la primera subida)
+audio_pipeline = AudioPipeline()
+
+
+@scheduled_job('interval', minutes=15)
+def resume_audio_processing(app):
+    """
+    Tarea programada: vuelve a encolar las canciones que quedaron sin procesar
+    (por ejemplo, porque el servidor se reinició a mitad del trabajo).
+    Procesar dos veces el mismo audio es inofensivo: la salida es idéntica.
+    """
+    if not audio_pipeline.available(app):
+        return
+    with app.app_context():
+        stale = datetime.utcnow() - timedelta(minutes=app.config['AUDIO_PROCESS_STALE_MINUTES'])
+        song_ids = db.session.execute(
+            db.select(Song.id).where(
+                Song.processing_status.in_((PENDING, PROCESSING)),
+                Song.created_at < stale
+            )
+        ).scalars().all()
+    for song_id in song_ids:
+        audio_pipeline.submit(app, song_id)
+    if song_ids:
+        audit_logger.info(f"Audios reencolados para procesar: {len(song_ids)}")
@@ -0,0 +1,102 @@
+import json
+import os
+import subprocess
+import uuid
+from utils.media import file_hash
+
+# Funciones puras (sin Flask ni BD): se ejecutan dentro de los procesos del pool.
+
+CODECS = {
+    'mp3': ['-c:a', 'libmp3lame', '-ar', '44100'],
+    'opus': ['-c:a', 'libopus', '-ar', '48000'],
+}
+
+
+class AudioProcessingError(Exception):
+    pass
+
+
+def _run(cmd, timeout):
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise AudioProcessingError(f"{os.path.basename(cmd[0])} superó {timeout}s")
+    if result.returncode != 0:
+        # Solo el final de stderr: es lo que explica el error
+        message = result.stderr.decode('utf-8', 'replace').strip()[-500:]
+        raise AudioProcessingError(f"{os.path.basename(cmd[0])} falló: {message}")
+    return result.stdout
+
+
+def probe(path, ffprobe='ffprobe', timeout=60):
+    """Duración (s), datos técnicos del primer stream de audio y etiquetas del archivo."""
+    out = _run([
+        ffprobe, '-v', 'error', '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate,format_name:format_tags:stream=codec_name,sample_rate,channels',
+        '-of', 'json', path
+    ], timeout)
+    data = json.loads(out or b'{}')
+    fmt = data.get('format', {})
+    stream = (data.get('streams') or [{}])[0]
+    return {
+        'duration': float(fmt['duration']) if fmt.get('duration') else None,
+        'codec': stream.get('codec_name'),
+        'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+        'channels': stream.get('channels'),
+        'bit_rate': int(fmt['bit_rate']) if fmt.get('bit_rate') else None,
+        'container': fmt.get('format_name'),
+        'tags': {k.lower(): v for k, v in (fmt.get('tags') or {}).items()},
+    }
+
+
+def process_audio(src_path, folder, fmt='mp3', bitrate='128k', loudness=-16.0,
+                  ffmpeg='ffmpeg', ffprobe='ffprobe', timeout=600):
+    """
+    Transcodifica src_path a `fmt` con el volumen normalizado (loudnorm, EBU R128)
+    y la guarda en `folder` como <sha256>.<fmt>. La salida es reproducible
+    (bitexact, sin metadatos), así el mismo audio siempre produce el mismo archivo.
+    Devuelve {'filename', 'duration', 'audio_info'}.
+    """
+    if fmt not in CODECS:
+        raise AudioProcessingError(f"Formato no soportado: {fmt}")
+
+    source = probe(src_path, ffprobe, timeout)
+    tmp_path = os.path.join(folder, f".{uuid.uuid4().hex}.{fmt}")
+    try:
+        _run([
+            ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', src_path, '-vn', '-map_metadata', '-1',
+            '-af', f'loudnorm=I={loudness}:TP=-1.5:LRA=11',
+            *CODECS[fmt], '-b:a', bitrate,
+            '-fflags', '+bitexact', '-flags:a', '+bitexact',
+            tmp_path
+        ], timeout)
+
+        filename = f"{file_hash(tmp_path)}.{fmt}"
+        final_path = os.path.join(folder, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    rendition = probe(final_path, ffprobe, timeout)
+    return {
+        'filename': filename,
+        'duration': rendition['duration'] or source['duration'],
+        'audio_info': {
+            'codec': rendition['codec'],
+            'bit_rate': rendition['bit_rate'],
+            'sample_rate': rendition['sample_rate'],
+            'channels': rendition['channels'],
+            'size': os.path.getsize(final_path),
+            'loudness_target': loudness,
+            'source': {
+                **{key: source[key] for key in ('codec', 'bit_rate', 'sample_rate', 'channels', 'container')},
+                'size': os.path.getsize(src_path),
+            },
+            'tags': source['tags'],
+        },
+    }
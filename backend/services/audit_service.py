@@ -0,0 +1,102 @@
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from config import Config
+from models import db, AuditEvent
+from utils.logger import audit_logger
+from utils.metrics import metrics
+
+
+class AuditWriter:
+    """
+    Guarda los eventos de auditoría (RNF-15) en la tabla audit_events sin
+    hacer un INSERT por petición: record() solo agrega el evento a un buffer
+    en memoria y un hilo los inserta en lote cada `batch_size` eventos o cada
+    `flush_ms` milisegundos (lo que pase primero).
+    El buffer tiene tope `max_pending`; si la BD no da abasto se descartan los
+    más antiguos (la línea en app.log se conserva igual).
+    """
+
+    def __init__(self, batch_size=200, flush_ms=500, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._dropped = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._app = None
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.flush)
+
+    def record(self, action, actor_id=None, target_id=None, **details):
+        """Registra un evento. No hace E/S: se inserta en el próximo lote."""
+        if self._app is None:
+            return
+        event = {
+            'created_at': datetime.utcnow(),
+            'action': action,
+            'actor_id': actor_id,
+            'target_id': target_id,
+            'ip': request.remote_addr if has_request_context() else None,
+            'details': details or None,
+        }
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append(event)
+            self._ensure_thread()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _ensure_thread(self):
+        # Se crea con el primer evento; tras un fork el hilo del padre no existe en el hijo
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size, timeout=self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Inserta todo lo pendiente, en lotes de `batch_size` filas."""
+        while True:
+            with self._cond:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                audit_logger.warning(f"Eventos de auditoría descartados por buffer lleno: {dropped}")
+            if not batch:
+                return
+            try:
+                with self._app.app_context():
+                    # executemany: un solo INSERT ... VALUES con todas las filas (insertmanyvalues)
+                    db.session.execute(db.insert(AuditEvent), batch)
+                    db.session.commit()
+            except Exception as e:
+                # El lote se pierde en la tabla, pero cada evento sigue en app.log
+                audit_logger.error(f"No se pudieron guardar {len(batch)} eventos de auditoría: {e}")
+                return
+
+    def stats(self):
+        with self._cond:
+            return {'pending': len(self._pending), 'batch_size': self.batch_size}
+
+
+# Instancia global (un buffer por proceso)
+audit_writer = AuditWriter(Config.AUDIT_BATCH_SIZE, Config.AUDIT_FLUSH_MS, Config.AUDIT_QUEUE_MAX)
+
+
+@metrics.register_collector
+def _audit_metrics():
+    return [('audit_events_pending', 'gauge', 'Eventos de auditoría esperando su INSERT', {},
+             audit_writer.stats()['pending'])]
+
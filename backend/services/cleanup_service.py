@@ -0,0 +1,210 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Song, Favorite, CachedAudio
+from services.ai_service import PLACEHOLDER_AUDIO
+from services.scheduler import scheduled_job
+from utils.database import advisory_xact_lock
+from utils.logger import audit_logger
+from utils.metrics import metrics
+
+
+def _lock_audio_files(filenames, shared):
+    """Bloqueo por archivo de audio hasta el fin de la transacción actual de db.session."""
+    advisory_xact_lock(db.session, [f"audio:{name}" for name in filenames], shared)
+
+
+def claim_audio_files(filenames):
+    """
+    Para guardar canciones que apuntan a archivos que quizá ya existían
+    (caché de prompts, subidas deduplicadas, audio procesado repetido):
+    toma el bloqueo compartido de cada archivo en la transacción actual y
+    devuelve los que ya no están en disco. Hasta el commit el FileReaper no
+    puede borrarlos, y después ya ve la canción que los usa.
+    """
+    # Los archivos simulados no se borran nunca (ni tienen por qué estar en disco)
+    filenames = [name for name in filenames if name not in PLACEHOLDER_AUDIO]
+    _lock_audio_files(filenames, shared=True)
+    folder = current_app.config['UPLOAD_FOLDER']
+    return [name for name in filenames if not os.path.exists(os.path.join(folder, os.path.basename(name)))]
+
+
+class FileReaper:
+    """
+    Borra en segundo plano los MP3 de las canciones eliminadas.
+    Antes de borrar verifica que ninguna otra canción use el mismo archivo
+    (las subidas repetidas, por ejemplo, comparten archivo) y que ninguna
+    caché de prompts lo tenga prestado (tabla cached_audio). La verificación
+    y el borrado van con el bloqueo exclusivo del archivo, así nadie guarda
+    una canción que lo use en medio (ver claim_audio_files).
+    Los archivos de las canciones simuladas (PLACEHOLDER_AUDIO) nunca se borran.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.deleted = 0
+        self.kept = 0
+        self.errors = 0
+
+    def submit(self, app, filenames):
+        if not filenames:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='file-reaper', daemon=True)
+                self._thread.start()
+        self._queue.put((app, list(filenames)))
+
+    def join(self):
+        """Espera a que se procesen los archivos pendientes (útil en la CLI)."""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'pending': self._queue.qsize(),
+            'deleted': self.deleted,
+            'kept': self.kept,
+            'errors': self.errors,
+        }
+
+    def _run(self):
+        while True:
+            app, filenames = self._queue.get()
+            try:
+                self._reap(app, filenames)
+            except Exception as e:
+                self.errors += len(filenames)
+                audit_logger.error(f"Error borrando archivos de audio: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _reap(self, app, filenames):
+        names = set(filenames)
+        placeholders = names & PLACEHOLDER_AUDIO
+        self.kept += len(placeholders)
+        names -= placeholders
+        if not names:
+            return
+
+        with app.app_context():
+            folder = app.config['UPLOAD_FOLDER']
+            try:
+                _lock_audio_files(names, shared=False)
+                # Un archivo sigue en uso si es el audio de otra canción o su original conservado
+                still_used = {
+                    name for (name,) in db.session.query(Song.audio_filename)
+                    .filter(Song.audio_filename.in_(names)).distinct()
+                } | {
+                    name for (name,) in db.session.query(Song.original_filename)
+                    .filter(Song.original_filename.in_(names)).distinct()
+                } | {
+                    # o si la caché de prompts de algún proceso lo tiene prestado
+                    name for (name,) in db.session.query(CachedAudio.filename)
+                    .filter(CachedAudio.filename.in_(names), CachedAudio.expires_at > datetime.utcnow()).distinct()
+                }
+                for name in names:
+                    if name in still_used:
+                        self.kept += 1
+                        continue
+                    try:
+                        os.remove(os.path.join(folder, os.path.basename(name)))
+                        self.deleted += 1
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        self.errors += 1
+                        audit_logger.error(f"No se pudo borrar {name}: {str(e)}")
+            finally:
+                # Suelta los bloqueos
+                db.session.rollback()
+
+
+# Instancia global (un hilo por proceso)
+file_reaper = FileReaper()
+
+
+def _expired_filter(expiration_time):
+    # Canciones viejas que NO están en favoritos
+    not_favorite = ~db.exists().where(Favorite.song_id == Song.id)
+    return (Song.created_at < expiration_time, not_favorite)
+
+
+CLEANUP_SECONDS = metrics.histogram(
+    'cleanup_duration_seconds', 'Duración de la limpieza del historial (RNF-12)',
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900))
+CLEANUP_DELETED = metrics.counter('cleanup_deleted_songs_total', 'Canciones borradas por la limpieza del historial')
+
+
+@scheduled_job('interval', hours=1)
+def cleanup_history(app, dry_run=False):
+    """
+    Tarea programada: Elimina canciones viejas (>24h) que NO son favoritas.
+    RNF-12: Gestión del historial.
+    Borra en lotes de CLEANUP_BATCH_SIZE con un DELETE ... WHERE NOT EXISTS,
+    confirmando cada lote, y deja los MP3 al FileReaper (también los de los
+    préstamos vencidos de la caché de prompts).
+    Con dry_run=True solo cuenta lo que se borraría.
+    Devuelve métricas de la ejecución.
+    """
+    with app.app_context():
+        started = time.monotonic()
+        expiration_time = datetime.utcnow() - timedelta(hours=app.config['HISTORY_RETENTION_HOURS'])
+        conditions = _expired_filter(expiration_time)
+
+        if dry_run:
+            pending = db.session.query(db.func.count(Song.id)).filter(*conditions).scalar()
+            stats = {'dry_run': True, 'would_delete': pending, 'elapsed_seconds': round(time.monotonic() - started, 3)}
+            audit_logger.info(f"Limpieza (simulación): {pending} canciones serían eliminadas.")
+            return stats
+
+        audit_logger.info("Ejecutando limpieza automática de historial...")
+        batch_size = app.config['CLEANUP_BATCH_SIZE']
+        deleted_count = 0
+        batches = 0
+
+        while True:
+            batch_ids = db.select(Song.id).where(*conditions).limit(batch_size).scalar_subquery()
+            stmt = db.delete(Song).where(Song.id.in_(batch_ids)) \
+                .returning(Song.audio_filename, Song.original_filename) \
+                .execution_options(synchronize_session=False)
+            rows = db.session.execute(stmt).all()
+            db.session.commit()
+
+            if not rows:
+                break
+            batches += 1
+            deleted_count += len(rows)
+            file_reaper.submit(app, [name for row in rows for name in row if name])
+            if len(rows) < batch_size:
+                break
+
+        # Préstamos vencidos o devueltos de la caché de prompts: si su archivo
+        # ya no lo usa ninguna canción, ahora sí se puede borrar
+        released = db.session.execute(
+            db.delete(CachedAudio).where(CachedAudio.expires_at <= datetime.utcnow())
+            .returning(CachedAudio.filename)
+        ).scalars().all()
+        db.session.commit()
+        file_reaper.submit(app, set(released))
+
+        elapsed = time.monotonic() - started
+        CLEANUP_SECONDS.observe(elapsed)
+        CLEANUP_DELETED.inc(deleted_count)
+        stats = {
+            'dry_run': False,
+            'deleted': deleted_count,
+            'batches': batches,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(deleted_count / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        if deleted_count > 0:
+            audit_logger.info(
+                f"Limpieza completada: {deleted_count} canciones eliminadas "
+                f"en {batches} lotes ({stats['elapsed_seconds']}s, {stats['rows_per_second']} filas/s)."
+            )
+        return stats
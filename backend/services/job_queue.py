@@ -0,0 +1,285 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from models import db, BackgroundJob
+from services.scheduler import scheduled_job
+from utils.logger import audit_logger
+from utils.metrics import metrics
+
+# Estados posibles de un trabajo
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+TERMINAL_STATES = (FINISHED, FAILED)
+
+# Columnas de la tabla jobs que se copian del Job
+_JOB_COLUMNS = ('id', 'queue', 'owner_id', 'status', 'result', 'error', 'version',
+                'created_at', 'started_at', 'finished_at')
+
+
+class QueueFullError(Exception):
+    """La cola alcanzó su límite de trabajos pendientes."""
+    pass
+
+
+class Job:
+    """
+    Un trabajo encolado (por ejemplo, una generación de música).
+    Su estado se guarda en la tabla jobs para que el cliente pueda consultarlo
+    (polling o SSE) desde cualquier worker.
+    """
+
+    def __init__(self, queue_name, owner_id=None):
+        self.id = uuid.uuid4().hex
+        self.queue = queue_name
+        self.owner_id = owner_id
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        # Se incrementa en cada cambio de estado (lo usa el stream SSE)
+        self.version = 0
+
+    @classmethod
+    def from_row(cls, row):
+        job = cls.__new__(cls)
+        for column in _JOB_COLUMNS:
+            setattr(job, column, getattr(row, column))
+        return job
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATES
+
+    def to_row(self):
+        return {column: getattr(self, column) for column in _JOB_COLUMNS}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'queue': self.queue,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': _epoch(self.created_at),
+            'started_at': _epoch(self.started_at),
+            'finished_at': _epoch(self.finished_at),
+        }
+
+
+def _epoch(value):
+    # La API devuelve segundos desde 1970, como antes de guardar los trabajos en la BD
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+class JobQueue:
+    """
+    Cola de trabajos con un pool acotado de hilos.
+    - workers: cuántos trabajos corren a la vez (límite de concurrencia).
+    - max_pending: cuántos trabajos pueden esperar (en cola + corriendo).
+    Así una ráfaga de generaciones no bloquea los hilos del servidor web.
+    Los trabajos corren en el proceso que los recibió, pero su estado se
+    escribe en la tabla jobs: get() y wait() funcionan desde cualquier worker.
+    """
+
+    def __init__(self, name, app, workers=2, max_pending=50, poll_interval=1.0):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self._app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'job-{name}')
+        self._local = {}  # Trabajos de este proceso que aún no terminan
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._running = 0
+        self._finished = 0
+        self._failed = 0
+
+    def submit(self, func, *args, owner_id=None, **kwargs):
+        """Encola func(*args, **kwargs) y devuelve el Job inmediatamente."""
+        with self._cond:
+            if self._queued + self._running >= self.max_pending:
+                raise QueueFullError(f"Cola '{self.name}' llena")
+            job = Job(self.name, owner_id=owner_id)
+            self._local[job.id] = job
+            self._queued += 1
+
+        try:
+            self._save(job, insert=True)
+        except Exception:
+            with self._cond:
+                del self._local[job.id]
+                self._queued -= 1
+            raise
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def record(self, result, owner_id=None):
+        """
+        Registra un trabajo que ya se resolvió sin pasar por la cola
+        (por ejemplo, desde una caché), para consultarlo igual que los demás.
+        """
+        job = Job(self.name, owner_id=owner_id)
+        job.status = FINISHED
+        job.result = result
+        job.started_at = job.finished_at = job.created_at
+        job.version = 1
+        self._save(job, insert=True)
+        with self._cond:
+            self._finished += 1
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._local.get(job_id)
+            if job is not None:
+                return job
+        with self._app.app_context(), db.engine.connect() as conn:
+            row = conn.execute(db.select(BackgroundJob.__table__).where(BackgroundJob.id == job_id)).first()
+        return Job.from_row(row) if row else None
+
+    def wait(self, job_id, since_version, timeout=None):
+        """
+        Espera hasta que el trabajo cambie de versión (o venza el timeout) y
+        devuelve su estado actual (None si ya no existe).
+        Si corre en este proceso se despierta al instante; si corre en otro
+        worker, consulta la BD cada `poll_interval` segundos.
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            with self._cond:
+                job = self._local.get(job_id)
+                if job is not None:
+                    self._cond.wait_for(lambda: job.version != since_version,
+                                        timeout=max(0, deadline - time.monotonic()))
+                    return job
+            job = self.get(job_id)
+            if job is None or job.version != since_version or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(self.poll_interval, max(0, deadline - time.monotonic())))
+
+    def stats(self):
+        """Profundidad de la cola y contadores de este proceso (para monitoreo)."""
+        with self._cond:
+            return {
+                'name': self.name,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': self._queued,
+                'running': self._running,
+                'finished': self._finished,
+                'failed': self._failed,
+            }
+
+    def _run(self, job, func, args, kwargs):
+        self._update(job, RUNNING)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._update(job, FAILED, error=str(e))
+        else:
+            self._update(job, FINISHED, result=result)
+
+    def _update(self, job, status, result=None, error=None):
+        with self._cond:
+            if status == RUNNING:
+                self._queued -= 1
+                self._running += 1
+                job.started_at = datetime.utcnow()
+            else:
+                self._running -= 1
+                job.finished_at = datetime.utcnow()
+                if status == FINISHED:
+                    self._finished += 1
+                else:
+                    self._failed += 1
+            job.status = status
+            job.result = result
+            job.error = error
+            job.version += 1
+        try:
+            self._save(job)
+        except Exception as e:
+            audit_logger.error(f"No se pudo guardar el estado del trabajo {job.id}: {str(e)}")
+        with self._cond:
+            if job.done:
+                self._local.pop(job.id, None)
+            self._cond.notify_all()
+
+    def _save(self, job, insert=False):
+        # Conexión propia: no toca la sesión (ni la transacción) de quien encola
+        table = BackgroundJob.__table__
+        with self._app.app_context(), db.engine.begin() as conn:
+            if insert:
+                conn.execute(table.insert().values(**job.to_row()))
+            else:
+                conn.execute(table.update().where(table.c.id == job.id).values(**job.to_row()))
+
+
+# Registro de colas por nombre (una instancia por proceso)
+_queues = {}
+
+
+def init_job_queues(app):
+    """Crea las colas definidas en Config.JOB_QUEUES."""
+    for name, options in app.config['JOB_QUEUES'].items():
+        if name not in _queues:
+            _queues[name] = JobQueue(
+                name,
+                app,
+                workers=options.get('workers', 2),
+                max_pending=options.get('max_pending', 50),
+                poll_interval=app.config['JOB_POLL_INTERVAL'],
+            )
+
+
+def get_queue(name):
+    return _queues[name]
+
+
+def all_queue_stats():
+    return [q.stats() for q in _queues.values()]
+
+
+@scheduled_job('interval', minutes=10)
+def prune_jobs(app):
+    """
+    Borra los trabajos de hace más de JOB_RESULT_TTL segundos. Los que siguen
+    sin terminar a esa edad quedaron huérfanos (se reinició su worker): se
+    marcan como fallidos y se borran en la siguiente pasada.
+    """
+    limit = datetime.utcnow() - timedelta(seconds=app.config['JOB_RESULT_TTL'])
+    table = BackgroundJob.__table__
+    with app.app_context(), db.engine.begin() as conn:
+        deleted = conn.execute(
+            table.delete().where(table.c.created_at < limit, table.c.status.in_(TERMINAL_STATES))
+        ).rowcount
+        orphaned = conn.execute(
+            table.update()
+            .where(table.c.created_at < limit, table.c.status.notin_(TERMINAL_STATES))
+            .values(status=FAILED, error='Trabajo interrumpido', finished_at=datetime.utcnow(),
+                    version=table.c.version + 1)
+        ).rowcount
+    if deleted or orphaned:
+        audit_logger.info(f"Trabajos viejos: {deleted} borrados, {orphaned} marcados como interrumpidos")
+
+
+@metrics.register_collector
+def _queue_metrics():
+    samples = []
+    for stats in all_queue_stats():
+        labels = {'queue': stats['name']}
+        samples += [
+            ('job_queue_queued', 'gauge', 'Trabajos esperando en la cola', labels, stats['queued']),
+            ('job_queue_running', 'gauge', 'Trabajos en ejecución', labels, stats['running']),
+            ('job_queue_finished_total', 'counter', 'Trabajos terminados', labels, stats['finished']),
+            ('job_queue_failed_total', 'counter', 'Trabajos fallidos', labels, stats['failed']),
+        ]
+    return samples
@@ -0,0 +1,111 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from config import Config
+
+# bcrypt solo usa los primeros 72 bytes; se recortan siempre para que
+# las contraseñas largas den el mismo hash que con Flask-Bcrypt
+MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+# Funciones puras: se ejecutan dentro de los procesos del pool.
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode('utf-8'))
+    except ValueError:
+        # Hash con formato inválido
+        return False
+
+
+class PasswordBusyError(Exception):
+    """No hubo lugar en el pool de contraseñas a tiempo (se responde 503)."""
+
+
+class PasswordHasher:
+    """
+    Hash y verificación de contraseñas con bcrypt (RNF-03) en un pool de procesos:
+    con muchos logins a la vez (toda la escuela a las 8:00) bcrypt no le quita
+    la CPU ni el GIL al resto de las rutas.
+    Como mucho `workers` + `max_pending` operaciones en curso; si no hay lugar
+    en `wait_timeout` segundos se lanza PasswordBusyError.
+    Con workers=0 bcrypt corre en el hilo de la petición (scripts, pruebas).
+    """
+
+    def __init__(self, rounds, workers, max_pending, wait_timeout):
+        self.rounds = rounds
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending) if workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: los procesos no heredan los hilos del servidor (scheduler, colas)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                executor.shutdown(wait=False)
+                self._executor = None
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise PasswordBusyError('Demasiados inicios de sesión a la vez')
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # Un proceso murió: el pool ya no sirve, el próximo intento crea otro
+            self._reset_executor(executor)
+            raise
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        if not password_hash or not password:
+            return False
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True si el hash se generó con otro costo (cambió BCRYPT_LOG_ROUNDS)."""
+        # Formato: $2b$<costo>$<sal y hash>
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+# Instancia global (un pool por proceso, se crea con el primer login)
+password_hasher = PasswordHasher(
+    Config.BCRYPT_LOG_ROUNDS,
+    Config.PASSWORD_WORKERS,
+    Config.PASSWORD_QUEUE_MAX,
+    Config.PASSWORD_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,170 @@
+import os
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from utils.db_profiler import query_profile
+from utils.logger import audit_logger
+
+# Tareas periódicas registradas desde cualquier módulo con @scheduled_job.
+# Cada proceso (worker de gunicorn) arranca su scheduler, pero solo el que
+# tiene el candado de líder ejecuta las tareas.
+_jobs = []
+
+
+def scheduled_job(trigger, **trigger_args):
+    """
+    Decorador: registra func(app) como tarea periódica.
+    Ej: @scheduled_job('interval', hours=1)
+    El módulo debe importarse antes de create_app() para que la tarea se registre.
+    """
+    def decorator(func):
+        _jobs.append((func, trigger, trigger_args))
+        return func
+    return decorator
+
+
+class PostgresLeaderLock:
+    """
+    Candado de líder con pg_try_advisory_lock.
+    Usa una conexión propia que se mantiene abierta: si el proceso muere,
+    Postgres libera el candado y otro worker lo toma en la siguiente ejecución.
+    """
+
+    def __init__(self, url, key):
+        self.key = key
+        self._engine = create_engine(url, poolclass=NullPool)
+        self._conn = None
+
+    def try_acquire(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute(text('SELECT 1'))
+                self._conn.commit()
+                return True
+            except Exception:
+                # Se perdió la conexión, y con ella el candado
+                self.release()
+
+        conn = self._engine.connect()
+        try:
+            acquired = conn.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': self.key}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def release(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class FileLeaderLock:
+    """Candado de líder con un archivo bloqueado (instalaciones locales sin Postgres)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self):
+        if self._file is not None:
+            return True
+        f = open(self.path, 'a+')
+        try:
+            _lock_file(f)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _lock_file(f):
+    # Bloqueo no bloqueante; lanza OSError si otro proceso lo tiene
+    if os.name == 'nt':
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def create_leader_lock(app):
+    """
+    Candado de líder según SCHEDULER_LOCK. El de Postgres es de sesión, así que
+    no sirve a través de pgbouncer en modo transacción (cada sentencia puede ir
+    a otra conexión del servidor): con DB_PGBOUNCER hace falta una URL directa
+    en SCHEDULER_LOCK_URL; sin ella 'auto' usa el candado de archivo.
+    """
+    kind = app.config['SCHEDULER_LOCK']
+    url = app.config['SCHEDULER_LOCK_URL'] or app.config['SQLALCHEMY_DATABASE_URI']
+    through_pgbouncer = app.config['DB_PGBOUNCER'] and not app.config['SCHEDULER_LOCK_URL']
+    if kind == 'auto':
+        kind = 'postgres' if url.startswith('postgresql') and not through_pgbouncer else 'file'
+        if kind == 'file' and through_pgbouncer:
+            audit_logger.warning(
+                "Scheduler con candado de archivo (DB_PGBOUNCER sin SCHEDULER_LOCK_URL): "
+                "solo coordina los workers de esta máquina"
+            )
+    if kind == 'postgres':
+        if through_pgbouncer:
+            raise ValueError("SCHEDULER_LOCK='postgres' con DB_PGBOUNCER requiere SCHEDULER_LOCK_URL (conexión directa)")
+        return PostgresLeaderLock(url, app.config['SCHEDULER_LOCK_KEY'])
+    if kind == 'file':
+        return FileLeaderLock(app.config['SCHEDULER_LOCK_FILE'])
+    raise ValueError(f"Tipo de candado desconocido: {kind}")
+
+
+def _leader_only(app, lock, func):
+    def run():
+        try:
+            if not lock.try_acquire():
+                return
+        except Exception as e:
+            audit_logger.error(f"No se pudo verificar el líder del scheduler: {str(e)}")
+            return
+        if app.config['SQL_PROFILER'] == 'on':
+            # Mismo perfil que las peticiones: N+1 en tareas como cleanup_history
+            with query_profile(f"tarea {func.__name__}"):
+                func(app)
+        else:
+            func(app)
+    run.__name__ = func.__name__
+    return run
+
+
+def init_scheduler(app):
+    """
+    Arranca el scheduler con las tareas registradas.
+    Devuelve None si está desactivado (SCHEDULER_ENABLED=false).
+    """
+    if not app.config['SCHEDULER_ENABLED']:
+        return None
+
+    lock = create_leader_lock(app)
+    scheduler = BackgroundScheduler()
+    for func, trigger, trigger_args in _jobs:
+        scheduler.add_job(
+            func=_leader_only(app, lock, func),
+            trigger=trigger,
+            id=f"{func.__module__}.{func.__name__}",
+            max_instances=1,
+            coalesce=True,
+            **trigger_args
+        )
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,106 @@
+import asyncio
+import types
+import aiohttp
+import edge_tts
+import edge_tts.communicate
+
+# Motores de síntesis de voz intercambiables.
+# Todos exponen la misma interfaz asíncrona, así el servicio TTS
+# puede usar edge-tts en producción o un stub local para pruebas de carga.
+
+
+class TTSBackend:
+    """Interfaz base: stream() produce bytes MP3; save() los escribe a disco."""
+
+    async def stream(self, text, voice, rate):
+        raise NotImplementedError
+        yield b''
+
+    async def save(self, text, voice, rate, output_path):
+        with open(output_path, 'wb') as f:
+            async for chunk in self.stream(text, voice, rate):
+                f.write(chunk)
+
+    async def close(self):
+        pass
+
+
+class _EdgeTTSAiohttp(types.ModuleType):
+    """
+    aiohttp tal como lo ve edge-tts. edge-tts abre una ClientSession por frase
+    y al cerrarla también cerraría el conector que le pasamos; con
+    connector_owner=False la sesión lo deja abierto y se conservan la caché DNS
+    y las conexiones entre frases. El resto de aiohttp no cambia.
+    """
+
+    def __getattr__(self, name):
+        return getattr(aiohttp, name)
+
+    @staticmethod
+    def ClientSession(*args, **kwargs):
+        if kwargs.get('connector') is not None:
+            kwargs.setdefault('connector_owner', False)
+        return aiohttp.ClientSession(*args, **kwargs)
+
+
+# Solo dentro de edge_tts.communicate: las demás sesiones de aiohttp no cambian
+edge_tts.communicate.aiohttp = _EdgeTTSAiohttp('aiohttp')
+
+
+class EdgeTTSBackend(TTSBackend):
+    """Voces neuronales de Microsoft Edge (requiere internet)."""
+
+    def __init__(self, connection_limit=20):
+        self.connection_limit = connection_limit
+        self._connector = None
+
+    def _get_connector(self):
+        # Se crea dentro del event loop del servicio TTS
+        if self._connector is None:
+            self._connector = aiohttp.TCPConnector(limit=self.connection_limit, ttl_dns_cache=300)
+        return self._connector
+
+    async def stream(self, text, voice, rate):
+        communicate = edge_tts.Communicate(text, voice, rate=rate, connector=self._get_connector())
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                yield chunk['data']
+
+    async def close(self):
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+# Frame MP3 silencioso (MPEG-1 Layer III, 128 kbps, 44.1 kHz, ~26 ms)
+_SILENT_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+class StubTTSBackend(TTSBackend):
+    """
+    Motor falso para pruebas sin conexión.
+    Simula la latencia de red y devuelve silencio proporcional al texto.
+    """
+
+    def __init__(self, latency=0.5, chunk_delay=0.0):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+
+    async def stream(self, text, voice, rate):
+        await asyncio.sleep(self.latency)
+        # ~1 frame por carácter, entregado en bloques como lo haría edge-tts
+        frames = max(1, len(text))
+        for start in range(0, frames, 40):
+            yield _SILENT_FRAME * min(40, frames - start)
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+
+
+def create_backend(config):
+    """Instancia el motor indicado en Config.TTS_BACKEND ('edge' o 'stub')."""
+    name = config.TTS_BACKEND
+    if name == 'edge':
+        return EdgeTTSBackend(connection_limit=config.TTS_CONNECTION_LIMIT)
+    if name == 'stub':
+        return StubTTSBackend(latency=config.TTS_STUB_LATENCY)
+    raise ValueError(f"Motor TTS desconocido: {name}")
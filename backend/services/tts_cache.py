@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+USAGE_FILE = '.usage'
+
+
+class AudioCache:
+    """
+    Caché de audio direccionada por contenido.
+    - El nombre del archivo es el hash de (texto, voz, velocidad): misma entrada, mismo archivo.
+    - Si varias peticiones piden la misma clave a la vez, solo una sintetiza.
+    - Se eliminan los archivos menos usados (LRU por fecha de modificación, que se
+      actualiza en cada acierto) para no pasar de max_bytes en disco.
+    El directorio es común a todos los workers: el total de bytes vive en el
+    archivo .usage, que se actualiza con flock, y la eliminación recorre el
+    directorio con ese candado tomado. No se eliminan los archivos usados hace
+    menos de `grace_seconds` (otro worker pudo haber entregado ya su URL) ni los
+    que este proceso está leyendo (pin=True) hasta unpin().
+    """
+
+    def __init__(self, directory, max_bytes, extension='mp3', grace_seconds=300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._inflight = {}  # clave -> asyncio.Future de la síntesis en curso
+        self._pins = {}  # nombre de archivo -> lectores que lo usan (no se elimina)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        # Al arrancar se recalcula el total desde el disco
+        with self._usage(exclusive=True) as usage:
+            usage.update(self._scan_and_evict())
+
+    @staticmethod
+    def make_key(*parts):
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def filename_for(self, key):
+        return f"{key}.{self.extension}"
+
+    def path_for(self, key):
+        return os.path.join(self.directory, self.filename_for(key))
+
+    async def get_or_create(self, key, create, pin=False):
+        """
+        Devuelve el nombre del archivo para la clave.
+        Si no existe, espera create(tmp_path) para generarlo (una sola vez por clave).
+        Con pin=True el archivo no se elimina hasta llamar a unpin(nombre).
+        Debe llamarse siempre desde el mismo event loop (el del servicio TTS).
+        """
+        filename = self.filename_for(key)
+        path = self.path_for(key)
+
+        while True:
+            with self._lock:
+                if self._lookup(filename, path):
+                    self.hits += 1
+                    if pin:
+                        self._pin(filename)
+                    return filename
+                pending = self._inflight.get(key)
+                if pending is None:
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+            if pending is None:
+                break
+            # Otra petición ya está sintetizando esta clave: esperamos su resultado
+            try:
+                await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # La síntesis original se canceló: lo volvemos a intentar
+
+        pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            # Escribimos en un temporal y renombramos: nadie ve archivos a medias
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                await create(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.add(filename, os.path.getsize(path), pin=pin)
+            pending.set_result(filename)
+            return filename
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Evita el aviso de "excepción nunca recuperada" si nadie esperaba
+            pending.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def add(self, filename, size, pin=False):
+        """Registra un archivo ya escrito en el directorio y aplica el presupuesto."""
+        with self._lock:
+            if pin:
+                self._pin(filename)
+            with self._usage(exclusive=True) as usage:
+                # Si otro worker escribió el mismo archivo se cuenta dos veces hasta el próximo recorrido
+                usage['bytes'] += size
+                usage['entries'] += 1
+                if usage['bytes'] > self.max_bytes:
+                    usage.update(self._scan_and_evict())
+
+    def unpin(self, filename):
+        """El lector terminó con el archivo: ya se puede eliminar si hace falta espacio."""
+        with self._lock:
+            count = self._pins.pop(filename, 0) - 1
+            if count > 0:
+                self._pins[filename] = count
+                return
+            with self._usage(exclusive=True) as usage:
+                if usage['bytes'] > self.max_bytes:
+                    usage.update(self._scan_and_evict())
+
+    def _pin(self, filename):
+        # Se llama con el lock tomado
+        self._pins[filename] = self._pins.get(filename, 0) + 1
+
+    def stats(self):
+        with self._usage() as usage:
+            pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': usage['entries'],
+                'bytes': usage['bytes'],
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'inflight': len(self._inflight),
+                'pinned': len(self._pins),
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _lookup(self, filename, path):
+        # Se llama con el lock tomado. El candado compartido evita que otro
+        # worker lo elimine entre que lo vemos y actualizamos su fecha de uso.
+        with self._usage():
+            if os.path.exists(path):
+                _touch(path)
+                return True
+        return False
+
+    @contextmanager
+    def _usage(self, exclusive=False):
+        """
+        Total de bytes y entradas del directorio (archivo .usage) con flock:
+        compartido para leer, exclusivo para modificar. Si se modifica el dict
+        dentro del bloque exclusivo, se guarda al salir.
+        """
+        path = os.path.join(self.directory, USAGE_FILE)
+        # Se abre en cada uso: con fork (gunicorn --preload) un descriptor heredado
+        # compartiría el candado entre workers
+        with open(path, 'a+', encoding='utf-8') as f:
+            if os.name != 'nt':
+                import fcntl
+                # Se suelta al cerrar el archivo
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            f.seek(0)
+            try:
+                usage = json.loads(f.read())
+            except ValueError:
+                usage = {'bytes': 0, 'entries': 0}
+            before = dict(usage)
+            yield usage
+            if exclusive and usage != before:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(usage))
+
+    def _scan_and_evict(self):
+        """
+        Recorre el directorio (con el candado exclusivo de .usage tomado) y elimina
+        los archivos menos usados hasta quedar bajo max_bytes. Devuelve el total real.
+        """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(f".{self.extension}"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        total = sum(size for _, _, size in entries)
+        count = len(entries)
+        protected_since = time.time() - self.grace_seconds
+        for mtime, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if mtime >= protected_since:
+                break  # Los siguientes son aún más recientes
+            if name in self._pins:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            count -= 1
+            self.evictions += 1
+        return {'bytes': total, 'entries': count}
+
+
+def _touch(path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
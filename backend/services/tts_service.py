@@ -1,33 +1,297 @@
-import edge_tts
-import uuid
 import os
 import asyncio
+import atexit
+import queue
+import re
+import threading
+import time
 from config import Config
+from services.tts_cache import AudioCache
+from services.tts_backends import create_backend
+from utils.logger import audit_logger
+from utils.metrics import metrics
 
 # Asegurar que el directorio existe
-TTS_DIR = os.path.join(Config.BASE_DIR, 'static', 'tts')
+TTS_DIR = Config.TTS_FOLDER
 os.makedirs(TTS_DIR, exist_ok=True)
 
 VOICE = "es-PE-CamilaNeural"  # Voz natural de Perú
+RATE = "+0%"
 
-async def _generate_audio_file(text, output_path):
-    communicate = edge_tts.Communicate(text, VOICE)
-    await communicate.save(output_path)
+# Caché de frases: la misma (texto, voz, velocidad) se sintetiza una sola vez
+tts_cache = AudioCache(TTS_DIR, Config.TTS_CACHE_MAX_BYTES, grace_seconds=Config.TTS_CACHE_GRACE_SECONDS)
 
-def generate_tts_audio(text):
+# Motor de síntesis (edge-tts o stub), intercambiable con set_backend()
+_backend = create_backend(Config)
+
+# Tiempo de síntesis de las frases que no estaban en caché:
+# 'phrase' = texto completo, 'chunk' = fragmento de un texto largo
+TTS_SYNTHESIS_SECONDS = metrics.histogram(
+    'tts_synthesis_duration_seconds', 'Tiempo de síntesis de voz (fallos de caché)',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+
+
+@metrics.register_collector
+def _tts_metrics():
+    stats = tts_cache.stats()
+    return [
+        ('cache_hits_total', 'counter', 'Aciertos de caché', {'cache': 'tts'}, stats['hits']),
+        ('cache_misses_total', 'counter', 'Fallos de caché', {'cache': 'tts'}, stats['misses']),
+        # La carpeta de la caché es la misma para todos los workers: no se suma
+        ('cache_entries', 'shared_gauge', 'Entradas en caché', {'cache': 'tts'}, stats['entries']),
+        ('tts_inflight_syntheses', 'gauge', 'Síntesis de voz en curso', {}, stats['inflight']),
+    ]
+
+
+def _timed(create, kind):
+    """Envuelve la función de creación de la caché para medir la síntesis."""
+    async def run(path):
+        started = time.perf_counter()
+        await create(path)
+        TTS_SYNTHESIS_SECONDS.observe(time.perf_counter() - started, kind=kind)
+    return run
+
+# Event loop de larga vida en un hilo propio.
+# Antes cada petición hacía asyncio.run(): creaba y destruía un loop y una conexión.
+_loop = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='tts-loop', daemon=True).start()
+        return _loop
+
+def run_async(coro, timeout=None):
+    """Ejecuta una corrutina en el loop del servicio TTS y espera su resultado (para código síncrono)."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+def set_backend(backend):
+    """Cambia el motor de síntesis (por ejemplo, un stub para pruebas de carga)."""
+    global _backend
+    previous = _backend
+    _backend = backend
+    if _loop is not None:
+        run_async(previous.close())
+
+@atexit.register
+def _shutdown():
+    if _loop is not None and _loop.is_running():
+        run_async(_backend.close(), timeout=5)
+        _loop.call_soon_threadsafe(_loop.stop)
+
+def _read_file(f, block_size=64 * 1024):
+    with f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+async def _open_cached(filename):
+    """
+    Abre un archivo de la caché en un hilo. Quien llama lo tiene fijado
+    (get_or_create(..., pin=True)) y lo suelta con unpin() en un finally, pase
+    lo que pase aquí. Ya abierto se puede leer completo aunque luego se elimine
+    (LRU de este u otro worker).
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(None, open, os.path.join(TTS_DIR, filename), 'rb')
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # El hilo sigue: si llega a abrirlo, se cierra
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or f.result().close())
+        raise
+
+async def _read_blocks(f, block_size=64 * 1024):
+    # Las lecturas de disco van a un hilo: no bloquean el loop compartido
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            block = await loop.run_in_executor(None, f.read, block_size)
+            if not block:
+                return
+            yield block
+    finally:
+        f.close()
+
+# Fin de oración/línea, y comas para partir oraciones demasiado largas
+_SENTENCE_END = re.compile(r'(?<=[.!?…;:])\s+|\n+')
+_CLAUSE_END = re.compile(r'(?<=,)\s+')
+
+def split_text(text, max_chars):
+    """
+    Parte un texto largo en fragmentos de hasta max_chars, cortando en
+    fin de oración o de línea y, si hace falta, en comas y espacios.
+    Los versos repetidos (coros) producen fragmentos idénticos.
+    """
+    chunks = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if len(sentence) <= max_chars:
+            if sentence:
+                chunks.append(sentence)
+            continue
+        current = ''
+        for clause in _CLAUSE_END.split(sentence):
+            for part in (clause.split() if len(clause) > max_chars else [clause]):
+                candidate = f"{current} {part}" if current else part
+                if len(candidate) <= max_chars:
+                    current = candidate
+                else:
+                    if current:
+                        chunks.append(current)
+                    current = part
+        if current:
+            chunks.append(current)
+    return chunks
+
+async def _synthesize_chunk(text, voice, rate):
+    # Cada fragmento pasa por la caché: un coro repetido se sintetiza una sola vez
+    key = AudioCache.make_key(text, voice, rate)
+    for attempt in range(Config.TTS_CHUNK_RETRIES + 1):
+        try:
+            return await tts_cache.get_or_create(
+                key, _timed(lambda path: _backend.save(text, voice, rate, path), 'chunk'), pin=True
+            )
+        except Exception:
+            if attempt == Config.TTS_CHUNK_RETRIES:
+                raise
+
+async def _audio_stream(text, voice, rate):
+    """
+    Bytes MP3 del texto completo. Los textos largos se parten en fragmentos
+    que se sintetizan en paralelo y se emiten en orden (los frames MP3 se
+    pueden concatenar).
     """
-    Genera un archivo de audio MP3 para el texto dado.
+    chunks = split_text(text, Config.TTS_CHUNK_MAX_CHARS) if len(text) > Config.TTS_CHUNK_MAX_CHARS else [text]
+    if len(chunks) == 1:
+        async for block in _backend.stream(text, voice, rate):
+            yield block
+        return
+
+    semaphore = asyncio.Semaphore(Config.TTS_CHUNK_CONCURRENCY)
+
+    async def one(chunk):
+        filename = None
+        try:
+            async with semaphore:
+                filename = await _synthesize_chunk(chunk, voice, rate)
+            # Fijado en la caché hasta abrirlo: otra síntesis no lo elimina mientras esperamos
+            return await _open_cached(filename)
+        finally:
+            # También si la tarea se cancela (el cliente se desconectó)
+            if filename is not None:
+                tts_cache.unpin(filename)
+
+    tasks = [asyncio.ensure_future(one(chunk)) for chunk in chunks]
+    try:
+        for task in tasks:
+            async for block in _read_blocks(await task):
+                yield block
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                task.result().close()
+            else:
+                task.cancel()
+
+async def _save_audio(text, voice, rate, output_path):
+    with open(output_path, 'wb') as f:
+        async for block in _audio_stream(text, voice, rate):
+            f.write(block)
+
+async def _synthesize(text, voice, rate):
+    key = AudioCache.make_key(text, voice, rate)
+    # Solo llama al motor si la frase no está en caché
+    filename = await tts_cache.get_or_create(
+        key, _timed(lambda path: _save_audio(text, voice, rate, path), 'phrase')
+    )
+    return f"/static/tts/{filename}"
+
+async def _synthesize_many(texts, voice, rate, limit):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(text):
+        async with semaphore:
+            try:
+                return await _synthesize(text, voice, rate)
+            except Exception as e:
+                audit_logger.error(f"Error generando TTS: {str(e)}")
+                return None
+
+    return await asyncio.gather(*(one(text) for text in texts))
+
+def generate_tts_audio(text, voice=VOICE, rate=RATE):
+    """
+    Genera (o reutiliza de la caché) un archivo de audio MP3 para el texto dado.
     Retorna la ruta relativa para servirlo.
     """
-    filename = f"{uuid.uuid4()}.mp3"
-    output_path = os.path.join(TTS_DIR, filename)
-    
-    # Ejecutar la función asíncrona de manera síncrona
     try:
-        asyncio.run(_generate_audio_file(text, output_path))
-        
         # Retornar URL relativa para el frontend
-        return f"/static/tts/{filename}"
+        return run_async(_synthesize(text, voice, rate))
     except Exception as e:
-        print(f"Error generando TTS: {e}")
+        audit_logger.error(f"Error generando TTS: {str(e)}")
         return None
+
+_STREAM_END = object()
+
+def stream_tts_audio(text, voice=VOICE, rate=RATE):
+    """
+    Devuelve un generador con los bytes MP3 a medida que el motor los produce.
+    Mientras tanto el audio se escribe en la caché, así la siguiente vez sale de disco.
+    Si la frase ya está en caché (o la está generando otra petición), se lee del archivo.
+    """
+    key = AudioCache.make_key(text, voice, rate)
+    chunks = queue.Queue()
+
+    synthesized = False
+
+    async def produce(tmp_path):
+        nonlocal synthesized
+        synthesized = True
+        with open(tmp_path, 'wb') as f:
+            async for chunk in _audio_stream(text, voice, rate):
+                f.write(chunk)
+                chunks.put(chunk)
+        chunks.put(_STREAM_END)
+
+    async def run():
+        # Corre en el loop del servicio: termina de escribir la caché aunque el cliente se desconecte
+        try:
+            filename = await tts_cache.get_or_create(key, _timed(produce, 'phrase'), pin=True)
+            try:
+                # Si se sintetizó aquí, los bytes ya salieron por la cola
+                if not synthesized:
+                    chunks.put(await _open_cached(filename))
+            finally:
+                tts_cache.unpin(filename)
+        except Exception as e:
+            chunks.put(e)
+
+    asyncio.run_coroutine_threadsafe(run(), _get_loop())
+
+    def generate():
+        while True:
+            item = chunks.get(timeout=Config.TTS_STREAM_TIMEOUT)
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if not isinstance(item, bytes):
+                # No hubo síntesis: servimos el archivo cacheado (ya abierto)
+                yield from _read_file(item)
+                return
+            yield item
+
+    return generate()
+
+def generate_tts_batch(texts, voice=VOICE, rate=RATE, limit=None):
+    """
+    Sintetiza varias frases en paralelo (máximo `limit` a la vez).
+    Retorna las URLs en el mismo orden; None para las que fallaron.
+    """
+    return run_async(_synthesize_many(texts, voice, rate, limit or Config.TTS_BATCH_CONCURRENCY))
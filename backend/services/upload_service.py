@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import Config
+from services.scheduler import scheduled_job
+from utils.logger import audit_logger
+
+# Bloque de lectura del cuerpo de la petición: la memoria no depende del tamaño del archivo
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Error de una subida; `status` es el código HTTP a devolver."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _copy_hashing(stream, f, digest, limit):
+    """Copia el stream al archivo en bloques, actualizando el hash. Devuelve los bytes escritos."""
+    written = 0
+    while True:
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            return written
+        written += len(block)
+        if written > limit:
+            raise UploadError('El archivo supera el tamaño máximo permitido', 413)
+        f.write(block)
+        digest.update(block)
+
+
+def _publish(tmp_path, digest, extension, folder):
+    """
+    Mueve el archivo a su nombre definitivo <sha256>.<ext>.
+    Si ya existe (mismo audio subido antes) se descarta la copia nueva.
+    Devuelve (nombre, deduplicado).
+    """
+    filename = f"{digest.hexdigest()}.{extension}"
+    final_path = os.path.join(folder, filename)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return filename, True
+    os.replace(tmp_path, final_path)
+    return filename, False
+
+
+def save_audio_stream(stream, extension, folder=None, max_bytes=None):
+    """
+    Guarda un archivo completo (subida de una sola vez) calculando su hash
+    mientras se escribe. Devuelve (nombre, deduplicado).
+    """
+    folder = folder or Config.UPLOAD_FOLDER
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            _copy_hashing(stream, f, digest, max_bytes or Config.MAX_UPLOAD_BYTES)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return _publish(tmp_path, digest, extension, folder)
+
+
+class UploadStore:
+    """
+    Subidas por partes y reanudables (RF: subida manual del admin).
+    Cada subida tiene un archivo .part y un .json con sus datos en `tmp_folder`;
+    el tamaño del .part es el offset, así que una subida cortada continúa
+    desde donde quedó (aunque la reciba otro worker). Cada escritura toma un
+    flock sobre el .json, así dos workers no agregan a la vez al mismo .part.
+    El sha256 se calcula mientras llegan los bytes; si el proceso no tiene
+    el hash en memoria (reinicio u otro worker), se recalcula desde el disco.
+    """
+
+    def __init__(self, folder, tmp_folder, max_bytes):
+        self.folder = folder
+        self.tmp_folder = tmp_folder
+        self.max_bytes = max_bytes
+        # upload_id -> (hash parcial, offset que cubre)
+        self._digests = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        if not upload_id.isalnum():
+            raise UploadError('Subida no encontrada', 404)
+        base = os.path.join(self.tmp_folder, upload_id)
+        return f"{base}.part", f"{base}.json"
+
+    @contextmanager
+    def _upload_lock(self, upload_id):
+        """
+        Una escritura a la vez por subida, también entre workers (flock sobre
+        el .json). Quien espera debe volver a leer el estado al entrar.
+        """
+        _, meta_path = self._paths(upload_id)
+        with self._lock:
+            thread_lock = self._locks.setdefault(upload_id, threading.Lock())
+        with thread_lock:
+            try:
+                f = open(meta_path, 'rb')
+            except FileNotFoundError:
+                raise UploadError('Subida no encontrada', 404)
+            with f:
+                if os.name != 'nt':
+                    import fcntl
+                    # Se suelta al cerrar el archivo
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                yield
+
+    def create(self, size, extension, **meta):
+        """Registra una subida de `size` bytes y devuelve su id."""
+        if size <= 0:
+            raise UploadError('El tamaño del archivo no es válido')
+        if size > self.max_bytes:
+            raise UploadError('El archivo supera el tamaño máximo permitido', 413)
+
+        os.makedirs(self.tmp_folder, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'extension': extension, 'created_at': time.time(), **meta}, f)
+        with self._lock:
+            self._digests[upload_id] = (hashlib.sha256(), 0)
+        return upload_id
+
+    def state(self, upload_id):
+        """Datos de la subida con su offset actual."""
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise UploadError('Subida no encontrada', 404)
+        return meta
+
+    def append(self, upload_id, offset, stream):
+        """Agrega bytes en `offset` (debe coincidir con lo ya recibido). Devuelve el nuevo offset."""
+        with self._upload_lock(upload_id):
+            # El offset se revisa con el candado tomado: otro worker pudo escribir mientras esperábamos
+            meta = self.state(upload_id)
+            if offset != meta['offset']:
+                raise UploadError(f"Offset incorrecto, se esperaba {meta['offset']}", 409)
+
+            with self._lock:
+                digest, covered = self._digests.pop(upload_id, (None, None))
+            if covered != offset:
+                digest = None
+
+            part_path, _ = self._paths(upload_id)
+            # Sin hash en memoria seguimos guardando; se recalcula al completar
+            target = digest or hashlib.sha256()
+            with open(part_path, 'ab') as f:
+                written = _copy_hashing(stream, f, target, meta['size'] - offset)
+
+            new_offset = offset + written
+            if digest is not None:
+                with self._lock:
+                    self._digests[upload_id] = (digest, new_offset)
+            return new_offset
+
+    def complete(self, upload_id):
+        """
+        Cierra la subida y mueve el archivo a la carpeta de música.
+        Devuelve (nombre, deduplicado, datos de la subida).
+        """
+        with self._upload_lock(upload_id):
+            meta = self.state(upload_id)
+            if meta['offset'] != meta['size']:
+                raise UploadError(f"Faltan bytes: recibidos {meta['offset']} de {meta['size']}", 409)
+
+            part_path, meta_path = self._paths(upload_id)
+            with self._lock:
+                digest, covered = self._digests.pop(upload_id, (None, None))
+            if covered != meta['size']:
+                digest = hashlib.sha256()
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                        digest.update(block)
+
+            os.makedirs(self.folder, exist_ok=True)
+            filename, deduplicated = _publish(part_path, digest, meta['extension'], self.folder)
+            os.remove(meta_path)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        return filename, deduplicated, meta
+
+    def abort(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with self._upload_lock(upload_id):
+                os.remove(meta_path)
+        except UploadError:
+            pass  # Ya no estaba el .json: solo queda borrar el .part, si hay
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        with self._lock:
+            self._digests.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def purge_expired(self, max_age_seconds):
+        """Borra subidas abandonadas (sin cambios en `max_age_seconds`). Devuelve cuántas."""
+        if not os.path.isdir(self.tmp_folder):
+            return 0
+        limit = time.time() - max_age_seconds
+        purged = 0
+        for name in os.listdir(self.tmp_folder):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            part_path, meta_path = self._paths(upload_id)
+            try:
+                last_change = max(os.path.getmtime(meta_path), os.path.getmtime(part_path))
+            except FileNotFoundError:
+                last_change = 0
+            if last_change < limit:
+                self.abort(upload_id)
+                purged += 1
+        return purged
+
+
+# Instancia global (los datos de cada subida viven en disco, compartidos entre procesos)
+upload_store = UploadStore(Config.UPLOAD_FOLDER, Config.UPLOAD_TMP_FOLDER, Config.MAX_UPLOAD_BYTES)
+
+
+@scheduled_job('interval', hours=1)
+def purge_abandoned_uploads(app):
+    """Tarea programada: borra las subidas por partes que nunca se completaron."""
+    purged = upload_store.purge_expired(app.config['UPLOAD_EXPIRE_HOURS'] * 3600)
+    if purged:
+        audit_logger.info(f"Subidas abandonadas eliminadas: {purged}")
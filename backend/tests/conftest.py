@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar config: sin consola (pytest la captura) y con los logs fuera del repo
+os.environ.setdefault('LOG_TO_CONSOLE', 'false')
+os.environ.setdefault('LOG_FOLDER', tempfile.mkdtemp(prefix='tesis-logs-'))
@@ -0,0 +1,147 @@
+"""Subidas por partes (services/upload_service.py): reanudación, deduplicación, límites y memoria."""
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from services.upload_service import BLOCK_SIZE, UploadError, UploadStore
+
+
+class FakeStream:
+    """Cuerpo de petición de `size` bytes generado al vuelo (no ocupa memoria)."""
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, n=-1):
+        if self.remaining <= 0:
+            return b''
+        n = self.remaining if n < 0 else min(n, self.remaining)
+        self.remaining -= n
+        return b'\x5a' * n
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'music'), str(tmp_path / 'tmp'), max_bytes=1024 * 1024)
+
+
+def upload(store, data, chunk=1000):
+    upload_id = store.create(len(data), 'mp3')
+    for offset in range(0, len(data), chunk):
+        store.append(upload_id, offset, io.BytesIO(data[offset:offset + chunk]))
+    return store.complete(upload_id)
+
+
+def test_resume_after_wrong_offset(store):
+    data = os.urandom(3000)
+    upload_id = store.create(len(data), 'mp3')
+    assert store.append(upload_id, 0, io.BytesIO(data[:1000])) == 1000
+
+    # El cliente cree que el servidor no recibió nada: se rechaza y se le indica el offset
+    with pytest.raises(UploadError) as error:
+        store.append(upload_id, 0, io.BytesIO(data[:1000]))
+    assert error.value.status == 409
+    assert store.state(upload_id)['offset'] == 1000
+
+    assert store.append(upload_id, 1000, io.BytesIO(data[1000:])) == 3000
+    filename, deduplicated, meta = store.complete(upload_id)
+    assert filename == f"{hashlib.sha256(data).hexdigest()}.mp3"
+    assert not deduplicated
+    assert meta['size'] == 3000
+    with open(os.path.join(store.folder, filename), 'rb') as f:
+        assert f.read() == data
+
+
+def test_complete_with_missing_bytes(store):
+    upload_id = store.create(2000, 'mp3')
+    store.append(upload_id, 0, io.BytesIO(b'x' * 1000))
+    with pytest.raises(UploadError) as error:
+        store.complete(upload_id)
+    assert error.value.status == 409
+
+
+def test_same_content_is_deduplicated(store):
+    data = os.urandom(2500)
+    first, deduplicated, _ = upload(store, data)
+    assert not deduplicated
+
+    second, deduplicated, _ = upload(store, data)
+    assert deduplicated
+    assert second == first
+    assert os.listdir(store.folder) == [first]
+    assert os.listdir(store.tmp_folder) == []
+
+
+def test_size_limits(store):
+    with pytest.raises(UploadError) as error:
+        store.create(store.max_bytes + 1, 'mp3')
+    assert error.value.status == 413
+
+    # Más bytes que los declarados al crear la subida
+    upload_id = store.create(1000, 'mp3')
+    with pytest.raises(UploadError) as error:
+        store.append(upload_id, 0, io.BytesIO(b'x' * 1001))
+    assert error.value.status == 413
+
+
+def _append_in_other_process(folder, tmp_folder, upload_id, data):
+    UploadStore(folder, tmp_folder, len(data)).append(upload_id, 0, io.BytesIO(data))
+
+
+def test_hash_is_recomputed_when_another_process_appended(store):
+    data = os.urandom(4000)
+    upload_id = store.create(len(data), 'mp3')
+
+    # La primera mitad la recibe otro worker: este proceso no tiene el hash parcial
+    process = multiprocessing.get_context('spawn').Process(
+        target=_append_in_other_process,
+        args=(store.folder, store.tmp_folder, upload_id, data[:2000])
+    )
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+    assert store.append(upload_id, 2000, io.BytesIO(data[2000:])) == 4000
+    filename, _, _ = store.complete(upload_id)
+    assert filename == f"{hashlib.sha256(data).hexdigest()}.mp3"
+
+
+def test_purge_expired(store):
+    old_id = store.create(100, 'mp3')
+    store.append(old_id, 0, io.BytesIO(b'x' * 50))
+    new_id = store.create(100, 'mp3')
+
+    long_ago = time.time() - 7200
+    for path in store._paths(old_id):
+        os.utime(path, (long_ago, long_ago))
+
+    assert store.purge_expired(3600) == 1
+    with pytest.raises(UploadError) as error:
+        store.state(old_id)
+    assert error.value.status == 404
+    assert sorted(os.listdir(store.tmp_folder)) == [f"{new_id}.json", f"{new_id}.part"]
+
+
+def test_memory_does_not_grow_with_file_size(tmp_path):
+    size = 1000 * BLOCK_SIZE
+    store = UploadStore(str(tmp_path / 'music'), str(tmp_path / 'tmp'), max_bytes=size)
+    upload_id = store.create(size, 'mp3')
+
+    tracemalloc.start()
+    try:
+        chunk = size // 4
+        for offset in range(0, size, chunk):
+            store.append(upload_id, offset, FakeStream(chunk))
+        filename, _, _ = store.complete(upload_id)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Unos pocos bloques como máximo, nunca el archivo (64 MB)
+    assert peak < 4 * BLOCK_SIZE
+    assert os.path.getsize(os.path.join(store.folder, filename)) == size
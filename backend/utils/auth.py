@@ -0,0 +1,123 @@
+import threading
+import time
+from functools import wraps
+from flask import g, jsonify
+from flask_jwt_extended import (jwt_required, get_jwt, get_jwt_identity, get_jwt_request_location,
+                                verify_jwt_in_request)
+from config import Config
+from models import db, User
+from utils.metrics import metrics
+
+
+class UserCache:
+    """
+    Caché por proceso de los datos básicos de cada usuario (rol, nombre, correo).
+    Evita una consulta a la BD en cada petición autorizada.
+    Las entradas vencen a los `ttl` segundos y se invalidan al editar o
+    eliminar un usuario; en otros workers el cambio se ve al vencer el TTL.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Devuelve un dict con id, name, email y role, o None si el usuario no existe."""
+        user_id = int(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.session.query(User.id, User.name, User.email, User.role) \
+            .filter(User.id == user_id).first()
+        data = dict(row._mapping) if row else None
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, data)
+        return data
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Instancia global (una por proceso)
+user_cache = UserCache(Config.USER_CACHE_TTL)
+
+
+@metrics.register_collector
+def _user_cache_metrics():
+    stats = user_cache.stats()
+    return [
+        ('cache_hits_total', 'counter', 'Aciertos de caché', {'cache': 'user'}, stats['hits']),
+        ('cache_misses_total', 'counter', 'Fallos de caché', {'cache': 'user'}, stats['misses']),
+        ('cache_entries', 'gauge', 'Entradas en caché', {'cache': 'user'}, stats['entries']),
+    ]
+
+
+def admin_required(stream=False):
+    """
+    Decorador para rutas de admin (reemplaza a @jwt_required() + check_admin()).
+    El rol viaja como claim en el JWT: un token sin rol admin se rechaza sin
+    tocar la BD. Si el claim dice admin, se confirma con la caché de usuarios
+    para que una degradación o eliminación tenga efecto antes de que expire el token.
+    stream=True: endpoint SSE, acepta también ?stream_token= (ver stream_auth_required).
+    """
+    def decorator(fn):
+        @wraps(fn)
+        @(stream_auth_required() if stream else jwt_required())
+        def wrapper(*args, **kwargs):
+            if get_jwt().get('role') != 'admin':
+                return jsonify({'error': 'Acceso denegado'}), 403
+            user = user_cache.get(get_jwt_identity())
+            if not user or user['role'] != 'admin':
+                return jsonify({'error': 'Acceso denegado'}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Claim de los tokens de corta duración para endpoints SSE
+STREAM_SCOPE = 'stream'
+
+
+def stream_auth_required():
+    """
+    Decorador para endpoints SSE (reemplaza a @jwt_required()).
+    EventSource no permite enviar cabeceras, así que además del JWT en la
+    cabecera se acepta ?stream_token=: solo un token de stream (POST
+    /api/auth/stream-token), que dura STREAM_TOKEN_TTL segundos. El token de
+    sesión nunca viaja en la URL.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            g._stream_auth = True
+            verify_jwt_in_request(locations=['headers', 'query_string'])
+            if get_jwt_request_location() == 'query_string' and get_jwt().get('scope') != STREAM_SCOPE:
+                return jsonify({'error': 'En la URL solo se acepta un token de stream'}), 401
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_jwt(jwt):
+    """Un token de stream solo sirve en los endpoints con @stream_auth_required()."""
+
+    @jwt.token_verification_loader
+    def check_token_scope(jwt_header, jwt_data):
+        return jwt_data.get('scope') != STREAM_SCOPE or g.get('_stream_auth', False)
@@ -0,0 +1,198 @@
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from utils.logger import audit_logger
+
+# Retraso de la réplica en segundos (0 si ya aplicó todo lo que recibió;
+# NULL si la URL apunta a un servidor que no es réplica)
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def advisory_xact_lock(conn, keys, shared=False):
+    """
+    Bloqueos de Postgres (pg_advisory_xact_lock) por clave de texto, hasta el fin
+    de la transacción de `conn` (Connection o Session). Se toman en orden para
+    que dos procesos no se bloqueen mutuamente. Con otra BD no hace nada.
+    """
+    dialect = conn.dialect if hasattr(conn, 'dialect') else conn.get_bind().dialect
+    if dialect.name != 'postgresql':
+        return
+    fn = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    for key in sorted(set(keys)):
+        conn.execute(text(f"SELECT {fn}(hashtext(:key))"), {'key': key})
+
+
+def engine_options(url, config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS para `url` según la configuración DB_*.
+    Solo aplica a Postgres; con otra BD (pruebas locales) usa los valores de SQLAlchemy.
+    """
+    if not url.startswith('postgresql'):
+        return {}
+    connect_args = {'connect_timeout': config['DB_CONNECT_TIMEOUT']}
+    if config['DB_PGBOUNCER']:
+        # pgbouncer (modo transacción) ya agrupa las conexiones: sin pool propio.
+        # No acepta parámetros de inicio como statement_timeout (definirlo en el rol
+        # con ALTER ROLE ... SET statement_timeout) ni sentencias preparadas en el
+        # servidor, que psycopg 3 crea solo (psycopg2 no las usa). Tampoco conserva
+        # candados de sesión (pg_advisory_lock): el del scheduler necesita una URL
+        # directa en SCHEDULER_LOCK_URL o usa el de archivo (services/scheduler.py).
+        # Los de transacción (advisory_xact_lock) sí funcionan.
+        if url.startswith('postgresql+psycopg:'):
+            connect_args['prepare_threshold'] = None
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        connect_args['options'] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        # Conexiones más viejas se cierran antes de usarlas (firewalls, reinicios de Postgres)
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        # SELECT 1 al sacar una conexión del pool: tras un reinicio se descartan las muertas
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'connect_args': connect_args,
+    }
+
+
+class ReplicaRouter:
+    """
+    Envía las consultas de los endpoints de solo lectura (@read_only()) a la
+    réplica DB_REPLICA_URL. Todo lo demás va al primario, y también:
+      - lo que ocurra en la petición después de escribir (flush),
+      - las lecturas de un usuario durante `sticky_seconds` después de que
+        escribió, para que vea sus propios cambios aunque la réplica vaya atrasada
+        (por proceso: con varios workers lo cubre el margen de max_lag),
+      - todas las lecturas si la réplica no responde o va más de `max_lag`
+        segundos atrasada (se revisa cada `check_interval` segundos).
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.max_lag = 5.0
+        self.sticky_seconds = 10
+        self.check_interval = 10
+        self._recent_writes = {}  # user_id -> hasta cuándo (monotonic) leer del primario
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._checked_at = None
+        self._healthy = False
+
+    def init_app(self, app):
+        url = app.config['DB_REPLICA_URL']
+        if not url:
+            return
+        self.engine = create_engine(url, **engine_options(url, app.config))
+        self.max_lag = app.config['DB_REPLICA_MAX_LAG']
+        self.sticky_seconds = app.config['DB_REPLICA_STICKY_SECONDS']
+        self.check_interval = app.config['DB_REPLICA_CHECK_SECONDS']
+
+        @app.after_request
+        def remember_write(response):
+            if g.get('_db_wrote'):
+                user_id = _current_user_id()
+                if user_id is not None:
+                    self.note_write(user_id)
+            return response
+
+    def note_write(self, user_id):
+        """El usuario acaba de escribir: sus lecturas van al primario un rato."""
+        if self.engine is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[int(user_id)] = now + self.sticky_seconds
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {k: v for k, v in self._recent_writes.items() if v > now}
+
+    def _wrote_recently(self, user_id):
+        with self._lock:
+            until = self._recent_writes.get(int(user_id))
+        return until is not None and until > time.monotonic()
+
+    def use_replica(self):
+        """True si la consulta actual puede ir a la réplica (se decide una vez por petición)."""
+        if self.engine is None or not has_request_context() or not g.get('_db_read_only'):
+            return False
+        decided = g.get('_db_use_replica')
+        if decided is None:
+            user_id = _current_user_id()
+            decided = g._db_use_replica = (
+                not (user_id is not None and self._wrote_recently(user_id)) and self.available()
+            )
+        return decided
+
+    def available(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._healthy
+        # Un solo hilo revisa; los demás usan el último resultado
+        if not self._check_lock.acquire(blocking=False):
+            return self._healthy
+        try:
+            self._checked_at = now
+            try:
+                with self.engine.connect() as conn:
+                    lag = conn.execute(REPLICA_LAG_SQL).scalar() or 0
+                healthy, reason = lag <= self.max_lag, f"{lag:.1f}s de retraso"
+            except Exception as e:
+                healthy, reason = False, str(e)
+            if healthy != self._healthy:
+                if healthy:
+                    audit_logger.info(f"Réplica de lectura disponible ({reason})")
+                else:
+                    audit_logger.warning(f"Réplica de lectura no disponible, se lee del primario: {reason}")
+            self._healthy = healthy
+            return healthy
+        finally:
+            self._check_lock.release()
+
+
+def _current_user_id():
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        return None
+    return int(identity) if identity is not None else None
+
+
+# Instancia global (una por proceso)
+replica_router = ReplicaRouter()
+
+
+class RoutingSession(Session):
+    """db.session: las lecturas de @read_only() van a la réplica, el resto al primario."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and replica_router.engine is not None and has_request_context():
+            if self._flushing:
+                # Escribió: el resto de la petición (y sus lecturas) en el primario
+                g._db_wrote = True
+                g._db_use_replica = False
+            elif replica_router.use_replica():
+                return replica_router.engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only():
+    """
+    Decorador para endpoints que solo leen (historial, favoritos, monitor...):
+    sus consultas pueden ir a la réplica. Va debajo de @jwt_required()/@admin_required(),
+    así la verificación del usuario se hace en el primario.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            g._db_read_only = True
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,156 @@
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import Config
+from utils.logger import audit_logger
+
+# Perfil de las consultas SQL, con los eventos del Engine de SQLAlchemy.
+# Cada petición cuenta sus consultas y el tiempo en la BD (lo usa /metrics).
+# Con el perfil detallado además responde con Server-Timing y avisa de
+# consultas idénticas repetidas dentro de la misma petición (probable N+1).
+# Las consultas que pasan de SQL_SLOW_QUERY_MS se registran siempre.
+
+# Perfil activo en el hilo (o tarea) actual; None fuera de una petición
+_current = ContextVar('sql_profile', default=None)
+
+_PROFILER_FILE = os.path.abspath(__file__)
+_WHITESPACE = re.compile(r'\s+')
+
+
+class QueryProfile:
+    """Consultas de una petición o tarea: cuántas, cuánto tardaron y cuáles se repiten."""
+
+    def __init__(self, name, detailed=False, repeat_threshold=5):
+        self.name = name
+        self.detailed = detailed
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.repeated = {}  # sentencia -> lugar del código donde se repite
+
+    def add(self, statement, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        if self.detailed:
+            # Los valores van como parámetros: la misma sentencia con otros
+            # valores tiene el mismo texto
+            self.shapes[statement] += 1
+            if self.shapes[statement] == self.repeat_threshold:
+                self.repeated[statement] = _call_site()
+
+    def server_timing(self):
+        value = f'db;dur={self.duration * 1000:.1f};desc="{self.count} consultas"'
+        if self.repeated:
+            value += f', db-repeated;desc="{len(self.repeated)} consultas repetidas"'
+        return value
+
+    def report(self):
+        audit_logger.info(f"Perfil SQL {self.name}: {self.count} consultas, {self.duration * 1000:.1f} ms")
+        for statement, site in self.repeated.items():
+            audit_logger.warning(
+                f"Posible N+1 en {self.name}: {self.shapes[statement]} ejecuciones desde {site} "
+                f"de {_shorten(statement, 300)}")
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def query_profile(name, detailed=True):
+    """
+    Perfila las consultas del bloque, fuera de una petición (tareas, scripts).
+    Ej: with query_profile('cleanup_history'): ...
+    """
+    profile = QueryProfile(name, detailed, Config.SQL_N_PLUS_ONE_THRESHOLD)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        if detailed:
+            profile.report()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    profile = _current.get()
+    if profile is not None:
+        # executemany cuenta como una consulta: es un solo viaje a la BD
+        profile.add(statement, elapsed)
+    slow_ms = Config.SQL_SLOW_QUERY_MS
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        where = f" en {profile.name}" if profile is not None else ''
+        audit_logger.warning(
+            f"Consulta lenta ({elapsed * 1000:.0f} ms){where} desde {_call_site()}: "
+            f"{_shorten(statement, 1000)} | parámetros: {_shorten(repr(parameters), 500)}")
+
+
+def _call_site():
+    """Primer frame del código de la app (fuera de SQLAlchemy, Flask y este módulo)."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(Config.BASE_DIR) and filename != _PROFILER_FILE
+                and 'site-packages' not in filename):
+            return f"{os.path.relpath(filename, Config.BASE_DIR)}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return 'desconocido'
+
+
+def _shorten(text, limit):
+    text = _WHITESPACE.sub(' ', text).strip()
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def _wants_detail(app):
+    mode = app.config['SQL_PROFILER']
+    if mode == 'on':
+        return True
+    # 'request': solo las peticiones que lo piden (staging); nunca activarlo en producción
+    return mode == 'request' and (
+        request.headers.get('X-Profile-SQL') == '1' or request.args.get('_profile_sql') == '1')
+
+
+def init_db_profiler(app):
+    """Perfila las consultas de cada petición. SQL_PROFILER: 'off', 'request' u 'on'."""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        route = request.url_rule.rule if request.url_rule else request.path
+        profile = QueryProfile(f"{request.method} {route}", _wants_detail(app),
+                               app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+        g._sql_profile_token = _current.set(profile)
+
+    @app.after_request
+    def report_profile(response):
+        profile = _current.get()
+        if profile is not None and profile.detailed:
+            response.headers.add('Server-Timing', profile.server_timing())
+            profile.report()
+        return response
+
+    @app.teardown_request
+    def end_profile(exc):
+        token = g.pop('_sql_profile_token', None)
+        if token is not None:
+            _current.reset(token)
@@ -1,34 +1,229 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from config import Config
+
+# Campos de la petición que se agregan a cada registro
+CONTEXT_FIELDS = ('user_id', 'method', 'route', 'status', 'latency_ms')
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea: fácil de filtrar con jq o de enviar a un agregador."""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'msg': record.getMessage(),
+            'pid': record.process,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BatchFileHandler(logging.Handler):
+    """
+    Acumula las líneas y las escribe con un solo write() en modo O_APPEND
+    cuando el listener hace flush (cola vacía o lote lleno).
+    Varios procesos pueden escribir el mismo archivo: cada write() agrega
+    líneas completas al final. No rota el archivo (con varios workers cada uno
+    rotaría por su cuenta); si logrotate lo mueve, se vuelve a abrir.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._lines = []
+        self._fd = None
+        self._inode = None
+
+    def emit(self, record):
+        try:
+            self._lines.append(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def _open_if_needed(self):
+        try:
+            stat = os.stat(self.path)
+            inode = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            inode = None
+        if self._fd is not None and inode == self._inode:
+            return
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        stat = os.fstat(self._fd)
+        self._inode = (stat.st_dev, stat.st_ino)
+
+    def flush(self):
+        if not self._lines:
+            return
+        data = ''.join(self._lines).encode('utf-8')
+        self._lines = []
+        try:
+            self._open_if_needed()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+        except OSError as e:
+            # Sin archivo de log no se corta la aplicación
+            sys.stderr.write(f"No se pudo escribir {self.path}: {e}\n")
+
+    def discard(self):
+        """Olvida las líneas pendientes (las copió fork y las escribe el proceso padre)."""
+        self._lines = []
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        super().close()
+
+
+class BatchQueueListener(QueueListener):
+    """
+    QueueListener que escribe por lotes: hace flush de los handlers cuando la
+    cola queda vacía o cada `batch_size` registros, en vez de uno por registro.
+    """
+
+    def __init__(self, log_queue, *handlers, batch_size=500):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self._pending = 0
+
+    def dequeue(self, block):
+        if self._pending >= self.batch_size:
+            self.flush()
+        try:
+            record = self.queue.get_nowait()
+        except queue.Empty:
+            self.flush()
+            record = self.queue.get(block)
+        self._pending += 1
+        return record
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush()
+        self._pending = 0
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Encola el registro sin hacer E/S en el hilo de la petición.
+    Los datos de la petición (usuario, ruta, latencia) se leen aquí, porque en
+    el hilo del listener ya no hay contexto de Flask.
+    """
+
+    def prepare(self, record):
+        # Este handler es el único del logger: se modifica el registro sin copiarlo
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        context = g.get('_log_context') if has_request_context() else None
+        if context is not None:
+            fields = record.__dict__
+            fields.setdefault('method', context['method'])
+            fields.setdefault('route', context['route'])
+            fields.setdefault('latency_ms', round((time.perf_counter() - context['started']) * 1000, 1))
+            if 'user_id' not in fields:
+                fields['user_id'] = _current_user_id()
+        return record
+
+
+def _current_user_id():
+    # Solo si la ruta ya validó el token (jwt_required); no decodifica nada nuevo
+    from flask_jwt_extended import get_jwt_identity
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        return None
+    return int(identity) if isinstance(identity, str) and identity.isdigit() else identity
+
+
+def _start_listener(handler, file_handler, console_handler):
+    handler.queue = queue.SimpleQueue()
+    handlers = [h for h in (file_handler, console_handler) if h is not None]
+    listener = BatchQueueListener(handler.queue, *handlers, batch_size=Config.LOG_BATCH_SIZE)
+    listener.start()
+    return listener
+
 
 def setup_logger():
     """
     Configura el sistema de Auditoría (Logs).
     RNF-15: Registrar acciones críticas.
+    Las rutas solo encolan el registro; un hilo aparte lo escribe en
+    LOG_FOLDER/app.log (JSON, una línea por registro) y en consola.
     """
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
+    os.makedirs(Config.LOG_FOLDER, exist_ok=True)
 
-    # Configuración básica
     logger = logging.getLogger('tesis_app')
     logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    file_handler = BatchFileHandler(os.path.join(Config.LOG_FOLDER, 'app.log'))
+    file_handler.setFormatter(JsonFormatter())
+
+    console_handler = None
+    if Config.LOG_TO_CONSOLE:
+        # Formato: [Fecha] [Nivel] [Mensaje]
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+
+    handler = RequestQueueHandler(None)
+    logger.addHandler(handler)
+    state = {'listener': _start_listener(handler, file_handler, console_handler)}
 
-    # Handler para escribir en archivo (rota cada 1MB, guarda 10 archivos)
-    file_handler = RotatingFileHandler('logs/app.log', maxBytes=1024*1024, backupCount=10)
-    
-    # Formato: [Fecha] [Nivel] [Mensaje]
-    formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-    file_handler.setFormatter(formatter)
-    
-    logger.addHandler(file_handler)
-    
-    # También mostrar en consola
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    def restart_in_child():
+        # gunicorn --preload: el hilo del listener no sobrevive al fork
+        file_handler.discard()
+        state['listener'] = _start_listener(handler, file_handler, console_handler)
 
+    os.register_at_fork(after_in_child=restart_in_child)
+    # Al salir se escribe lo que quede en la cola
+    atexit.register(lambda: state['listener'].stop())
     return logger
 
+
+def init_request_logging(app):
+    """Mide la latencia de cada petición; con LOG_REQUESTS deja una línea por petición."""
+
+    @app.before_request
+    def start_timer():
+        g._log_context = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else request.path,
+            'started': time.perf_counter(),
+        }
+
+    @app.after_request
+    def log_request(response):
+        if app.config['LOG_REQUESTS']:
+            audit_logger.info(f"{request.method} {request.path} {response.status_code}",
+                              extra={'status': response.status_code})
+        return response
+
+
 # Instancia global para usar en toda la app
 audit_logger = setup_logger()
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Nombres direccionados por contenido: <sha256 del contenido>.<ext> (subidas
+# deduplicadas, audio procesado). Un mismo nombre nunca cambia de contenido, así
+# que el cliente puede guardarlo para siempre. Los de la caché TTS tienen la misma
+# forma pero son el hash de la petición (texto, voz, velocidad): al volver a
+# sintetizarse tras un desalojo los bytes pueden cambiar.
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+_MAX_HASHES = 4096
+
+
+def is_content_addressed(filename):
+    return bool(_CONTENT_ADDRESSED.match(filename))
+
+
+def file_hash(path, block_size=1024 * 1024):
+    """
+    sha256 del contenido del archivo. Se recuerda por (ruta, mtime, tamaño)
+    para no releer el archivo en cada petición.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _hashes_lock:
+        cached = _hashes.get(path)
+        if cached and cached[0] == signature:
+            _hashes.move_to_end(path)
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    value = digest.hexdigest()
+
+    with _hashes_lock:
+        _hashes[path] = (signature, value)
+        _hashes.move_to_end(path)
+        while len(_hashes) > _MAX_HASHES:
+            _hashes.popitem(last=False)
+    return value
+
+
+def audio_etag(path, filename, content_addressed=True):
+    """
+    ETag fuerte: el hash del nombre si es direccionado por contenido, si no el del archivo.
+    content_addressed=False para carpetas cuyos nombres no salen del contenido (TTS).
+    """
+    if content_addressed and is_content_addressed(filename):
+        return filename.split('.', 1)[0]
+    return file_hash(path)
@@ -0,0 +1,430 @@
+import atexit
+import bisect
+import glob
+import json
+import hmac
+import os
+import threading
+import time
+import uuid
+from flask import Response, abort, g, request
+from utils.db_profiler import current_profile
+
+# Métricas en formato de texto de Prometheus (GET /metrics), sin dependencias.
+# Con varios workers (gunicorn) cada proceso del servidor guarda cada segundo
+# una foto de sus métricas en METRICS_DIR/<worker>.json y /metrics suma las de
+# todos. Los contadores de los workers que terminaron se pasan a retired.json.
+
+# Segundos: de una consulta rápida a una generación de música
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Contadores sumados de los workers que ya terminaron
+RETIRED_FILE = 'retired.json'
+RETIRE_LOCK_FILE = '.retire.lock'
+
+
+class Counter:
+    def __init__(self, registry, name):
+        self._registry = registry
+        self.name = name
+
+    def inc(self, value=1, **labels):
+        self._registry._inc(self.name, _label_key(labels), value)
+
+
+class Histogram:
+    def __init__(self, registry, name, buckets):
+        self._registry = registry
+        self.name = name
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        self._registry._observe(self, _label_key(labels), value)
+
+    def time(self, **labels):
+        """Context manager: mide la duración del bloque en segundos."""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso: contadores, histogramas y colectores
+    (funciones que devuelven valores del momento, como la profundidad de
+    una cola o los aciertos de una caché).
+    Los contadores y los histogramas de procesos que ya terminaron se siguen
+    sumando (un contador no debe bajar); sus valores instantáneos (gauges) no.
+    Un proceso se da por terminado cuando su archivo no cambia en
+    `retire_after` segundos (no por su pid, que el sistema reutiliza).
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0, retire_after=60):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.retire_after = retire_after
+        self._meta = {}  # nombre -> {'type', 'help', 'buckets'}
+        self._counters = {}  # (nombre, etiquetas) -> valor
+        self._histograms = {}  # (nombre, etiquetas) -> [conteo por bucket..., +Inf, suma]
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._writer_pid = None
+        self._worker = None  # (pid, id del worker)
+
+    @property
+    def worker_id(self):
+        """Id de este proceso, único por arranque: un worker nuevo con el pid de uno muerto no pisa su archivo."""
+        pid = os.getpid()
+        if self._worker is None or self._worker[0] != pid:
+            self._worker = (pid, f"{pid}-{uuid.uuid4().hex[:8]}")
+        return self._worker[1]
+
+    def counter(self, name, help_text):
+        self._meta[name] = {'type': 'counter', 'help': help_text}
+        return Counter(self, name)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._meta[name] = {'type': 'histogram', 'help': help_text, 'buckets': list(buckets)}
+        return Histogram(self, name, buckets)
+
+    def register_collector(self, func):
+        """
+        func() devuelve una lista de (nombre, tipo, ayuda, etiquetas, valor);
+        tipo 'gauge' (valor actual), 'counter' (acumulado del proceso) o
+        'shared_gauge' (valor de algo común a todos los procesos, como una
+        carpeta en disco: se toma el máximo en vez de sumarlo).
+        Se puede usar como decorador.
+        """
+        self._collectors.append(func)
+        return func
+
+    def _inc(self, name, key, value):
+        with self._lock:
+            self._counters[(name, key)] = self._counters.get((name, key), 0) + value
+        self._ensure_writer()
+
+    def _observe(self, histogram, key, value):
+        with self._lock:
+            data = self._histograms.get((histogram.name, key))
+            if data is None:
+                data = self._histograms[(histogram.name, key)] = [0] * (len(histogram.buckets) + 2)
+            # Conteo no acumulado por bucket; se acumula al exportar
+            data[bisect.bisect_left(histogram.buckets, value)] += 1
+            data[-1] += value
+        self._ensure_writer()
+
+    # --- Foto del proceso y archivos por proceso ---
+
+    def snapshot(self):
+        collected = []
+        for func in self._collectors:
+            try:
+                collected.extend(func())
+            except Exception:
+                # Un colector roto no debe tumbar /metrics
+                continue
+        with self._lock:
+            meta = dict(self._meta)
+            counters = [[name, list(key), value] for (name, key), value in self._counters.items()]
+            histograms = [[name, list(key), list(data)] for (name, key), data in self._histograms.items()]
+        gauges = []
+        for name, kind, help_text, labels, value in collected:
+            meta.setdefault(name, {'type': 'gauge' if kind == 'shared_gauge' else kind, 'help': help_text})
+            if kind == 'counter':
+                counters.append([name, list(_label_key(labels)), value])
+            else:
+                gauges.append([name, list(_label_key(labels)), value, 'max' if kind == 'shared_gauge' else 'sum'])
+        return {'worker': self.worker_id, 'pid': os.getpid(), 'meta': meta, 'counters': counters,
+                'histograms': histograms, 'gauges': gauges}
+
+    def _ensure_writer(self):
+        # Un hilo por proceso; tras un fork el del padre no existe en el hijo
+        if not self.directory or self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.write()
+
+    def write(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.worker_id}.json")
+        # Temporal por hilo: el hilo de fondo y atexit pueden escribir a la vez
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            # Reemplazo atómico: quien lee nunca ve un archivo a medias
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        if not self.directory:
+            return [own]
+        snapshots = [own]
+        stale = []
+        now = time.time()
+        # Compartido: mientras se lee, nadie pasa archivos a retired.json
+        with _dir_lock(self.directory, shared=True):
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    age = now - os.path.getmtime(path)
+                    with open(path, encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if data.get('worker') == own['worker']:
+                    continue
+                if age > 5 * self.flush_interval:
+                    # Dejó de escribir: sus valores instantáneos ya no valen
+                    data['gauges'] = []
+                if age > self.retire_after and os.path.basename(path) != RETIRED_FILE:
+                    stale.append(path)
+                snapshots.append(data)
+        if stale:
+            self._retire(stale)
+        return snapshots
+
+    def _retire(self, paths):
+        """Suma los contadores de los workers terminados en retired.json y borra sus archivos."""
+        with _dir_lock(self.directory, shared=False):
+            retired_path = os.path.join(self.directory, RETIRED_FILE)
+            snapshots = []
+            try:
+                with open(retired_path, encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass
+            retired = []
+            for path in paths:
+                try:
+                    # Otro proceso pudo retirarlo mientras esperábamos el candado
+                    if time.time() - os.path.getmtime(path) <= self.retire_after:
+                        continue
+                    with open(path, encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+                retired.append(path)
+            if not retired:
+                return
+            meta, counters, _, histograms = _merge(snapshots)
+            data = {
+                'worker': 'retired',
+                'meta': {name: info for name, info in meta.items() if info['type'] != 'gauge'},
+                'counters': [[name, list(key), value] for (name, key), value in counters.items()],
+                'histograms': [[name, list(key), value] for (name, key), value in histograms.items()],
+                'gauges': [],
+            }
+            tmp_path = f"{retired_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, retired_path)
+            for path in retired:
+                os.remove(path)
+
+    # --- Exportación ---
+
+    def render(self):
+        """Texto de Prometheus con las métricas sumadas de todos los procesos."""
+        meta, counters, gauges, histograms = _merge(self._snapshots())
+        _add_hit_ratios(meta, counters, gauges)
+
+        lines = []
+        for name in sorted(meta):
+            info = meta[name]
+            lines.append(f"# HELP {name} {info['help']}")
+            lines.append(f"# TYPE {name} {info['type']}")
+            if info['type'] == 'histogram':
+                for (sample_name, key), data in sorted(histograms.items()):
+                    if sample_name == name:
+                        lines.extend(_histogram_lines(name, key, info['buckets'], data))
+            else:
+                source = counters if info['type'] == 'counter' else gauges
+                for (sample_name, key), value in sorted(source.items()):
+                    if sample_name == name:
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(snapshots):
+    """Suma las fotos de varios procesos. Devuelve (meta, contadores, gauges, histogramas)."""
+    meta, counters, gauges, histograms = {}, {}, {}, {}
+    for snap in snapshots:
+        for name, info in snap['meta'].items():
+            meta.setdefault(name, info)
+        for name, key, value in snap['counters']:
+            sample = (name, tuple(map(tuple, key)))
+            counters[sample] = counters.get(sample, 0) + value
+        for name, key, value, *mode in snap['gauges']:
+            sample = (name, tuple(map(tuple, key)))
+            if mode == ['max']:
+                gauges[sample] = max(gauges.get(sample, value), value)
+            else:
+                gauges[sample] = gauges.get(sample, 0) + value
+        for name, key, data in snap['histograms']:
+            current = histograms.setdefault((name, tuple(map(tuple, key))), [0] * len(data))
+            if len(current) == len(data):
+                for i, value in enumerate(data):
+                    current[i] += value
+    return meta, counters, gauges, histograms
+
+
+class _dir_lock:
+    """flock sobre METRICS_DIR/.retire.lock (sin efecto en Windows)."""
+
+    def __init__(self, directory, shared):
+        self.path = os.path.join(directory, RETIRE_LOCK_FILE)
+        self.shared = shared
+
+    def __enter__(self):
+        self.file = None
+        if os.name == 'nt':
+            return self
+        import fcntl
+        try:
+            self.file = open(self.path, 'a')
+        except FileNotFoundError:
+            return self  # Aún no hay carpeta: no hay nada que leer ni retirar
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            self.file.close()
+
+
+def reset_metrics_dir(directory):
+    """
+    Vacía METRICS_DIR. Lo llama el proceso maestro de gunicorn al arrancar
+    (gunicorn.conf.py), antes de crear los workers: cada despliegue empieza de cero.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _add_hit_ratios(meta, counters, gauges):
+    # Proporción de aciertos calculada con los totales de todos los procesos
+    hits = {key: value for (name, key), value in counters.items() if name == 'cache_hits_total'}
+    misses = {key: value for (name, key), value in counters.items() if name == 'cache_misses_total'}
+    if not hits and not misses:
+        return
+    meta['cache_hit_ratio'] = {'type': 'gauge', 'help': 'Aciertos / consultas de cada caché (todos los procesos)'}
+    for key in set(hits) | set(misses):
+        lookups = hits.get(key, 0) + misses.get(key, 0)
+        gauges[('cache_hit_ratio', key)] = hits.get(key, 0) / lookups if lookups else 0.0
+
+
+def _histogram_lines(name, key, buckets, data):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ['+Inf'], data[:-1]):
+        cumulative += count
+        le = bound if bound == '+Inf' else _format_value(bound)
+        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(data[-1])}")
+    lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+    return lines
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for k, v in key
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Instancia global (una por proceso). Solo los procesos del servidor comparten
+# sus métricas en METRICS_DIR (init_metrics con shared=True).
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration_seconds', 'Latencia de las peticiones por endpoint, método y estado')
+REQUEST_DB_QUERIES = metrics.histogram(
+    'http_request_db_queries', 'Consultas SQL por petición, por endpoint',
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+REQUEST_DB_SECONDS = metrics.histogram(
+    'http_request_db_seconds', 'Tiempo en la BD por petición, por endpoint')
+
+
+def init_metrics(app, shared=False):
+    """
+    Mide cada petición (latencia y consultas a la BD) y expone GET /metrics.
+    Las consultas las cuenta utils/db_profiler (init_db_profiler).
+    shared: el proceso es un worker del servidor y suma sus métricas con los
+    demás en METRICS_DIR; scripts y benchmarks no (no se mezclan con producción).
+    /metrics solo existe con METRICS_TOKEN y pide Authorization: Bearer <token>.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+    if shared and metrics.directory is None:
+        metrics.directory = app.config['METRICS_DIR']
+        atexit.register(metrics.write)
+
+    @app.before_request
+    def start_metrics():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_metrics(response):
+        started = g.get('_metrics_started')
+        if started is not None:
+            # request.endpoint ('music.history') y no la URL: pocas series distintas
+            endpoint = request.endpoint or 'unmatched'
+            REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint,
+                                    method=request.method, status=response.status_code)
+            profile = current_profile()
+            if profile is not None:
+                REQUEST_DB_QUERIES.observe(profile.count, endpoint=endpoint)
+                REQUEST_DB_SECONDS.observe(profile.duration, endpoint=endpoint)
+        return response
+
+    token = app.config['METRICS_TOKEN']
+    if not token:
+        return
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+            abort(401)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
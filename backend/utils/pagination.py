@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import tuple_
+
+# Paginación por cursor (keyset): en vez de OFFSET, el cliente envía la
+# posición del último elemento que recibió, y la consulta sigue desde ahí
+# usando el índice. El tiempo de respuesta no crece con el tamaño del historial.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, id). Lanza ValueError si el cursor no es válido."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
+def get_page_args():
+    """Lee ?limit= y ?cursor= de la petición. Lanza ValueError si no son válidos."""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit debe ser un número')
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    cursor = request.args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def paginate(query, created_col, id_col, limit, cursor):
+    """
+    Aplica orden descendente por (created_col, id_col) y el cursor.
+    Devuelve (filas, next_cursor); next_cursor es None en la última página.
+    """
+    if cursor:
+        query = query.filter(tuple_(created_col, id_col) < cursor)
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(*_key_of(last, created_col, id_col))
+    return rows, next_cursor
+
+
+def _key_of(row, created_col, id_col):
+    # row puede ser un modelo o una fila (modelo, columnas extra...)
+    model = created_col.class_
+    entities = (row,) if isinstance(row, model) else tuple(row)
+    for entity in entities:
+        if isinstance(entity, model):
+            return getattr(entity, created_col.key), getattr(entity, id_col.key)
+    raise ValueError('La fila no contiene las columnas del cursor')
@@ -0,0 +1,5 @@
+from app import create_app
+
+# Punto de entrada para producción: gunicorn wsgi:app
+# Todos los workers arrancan el scheduler, pero solo el líder ejecuta las tareas.
+app = create_app(start_scheduler=True)
@@ -64,11 +64,8 @@ const HandsFreeAssistant = ({ onComplete, onCancel }) => {
         setErrorMsg('');
 
         try {
-            const res = await api.post('/tts/speak', { text });
-
-            if (!mounted.current) return;
-
-            const audioUrl = `http://localhost:5000${res.data.audio_url}`;
+            // Modo streaming: el audio empieza a sonar mientras se sintetiza
+            const audioUrl = `${api.defaults.baseURL}/tts/speak?stream=1&text=${encodeURIComponent(text)}`;
             const audio = new Audio(audioUrl);
             audioRef.current = audio;
 
@@ -3,9 +3,16 @@ import { Users, Trash2, Edit2, Activity, Save, X, Upload, Music } from 'lucide-r
 import ConfirmModal from '../components/ui/ConfirmModal';
 import api from '../services/api';
 
+// Subidas por partes: tamaño de cada fragmento y reintentos por fragmento
+const UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 3;
+
 const AdminDashboard = () => {
     const [users, setUsers] = useState([]);
+    const [usersCursor, setUsersCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [activity, setActivity] = useState([]);
+    const [activityCursor, setActivityCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     const [editingUser, setEditingUser] = useState(null);
     const [activeTab, setActiveTab] = useState('users'); // 'users', 'monitor', or 'upload'
@@ -27,15 +34,47 @@ const AdminDashboard = () => {
         fetchData();
     }, [activeTab]);
 
+    // Actividad en vivo (SSE) a partir del cursor de la última carga
+    useEffect(() => {
+        if (activeTab !== 'monitor' || activityCursor === null) return;
+        let source = null;
+        let stopped = false;
+        let since = activityCursor;
+        const connect = async () => {
+            // EventSource no envía cabeceras: pedimos un token corto que solo sirve para el stream
+            // (el token de sesión no debe quedar en la URL)
+            const { data } = await api.post('/auth/stream-token');
+            if (stopped) return;
+            source = new EventSource(`${api.defaults.baseURL}/admin/monitor/stream?cursor=${since}&stream_token=${data.stream_token}`);
+            source.addEventListener('generation', (e) => {
+                const event = JSON.parse(e.data);
+                since = Math.max(since, event.offset + 1);
+                setActivity((prev) => prev.some((s) => s.id === event.song_id) ? prev : [{ id: event.song_id, title: event.title, author: event.author, created_at: event.at, tags: event.tags }, ...prev].slice(0, 50));
+            });
+            // El servidor cierra cada conexión al rato (o al vencer el token): si el navegador
+            // no puede reconectar solo, abrimos otra con un token nuevo desde el último evento
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED && !stopped) setTimeout(connect, 1000);
+            };
+        };
+        connect().catch((error) => console.error("Error abriendo el monitor en vivo:", error));
+        return () => {
+            stopped = true;
+            if (source) source.close();
+        };
+    }, [activeTab, activityCursor]);
+
     const fetchData = async () => {
         setLoading(true);
         try {
             if (activeTab === 'users') {
                 const res = await api.get('/admin/users');
-                setUsers(res.data);
+                setUsers(res.data.items);
+                setUsersCursor(res.data.next_cursor);
             } else {
                 const res = await api.get('/admin/monitor');
-                setActivity(res.data);
+                setActivity(res.data.items);
+                setActivityCursor(res.data.cursor);
             }
         } catch (error) {
             console.error("Error fetching data:", error);
@@ -45,6 +84,15 @@ const AdminDashboard = () => {
         }
     };
 
+    const loadMoreUsers = async () => {
+        setLoadingMore(true);
+        try {
+            const res = await api.get('/admin/users', { params: { cursor: usersCursor } });
+            setUsers((prev) => [...prev, ...res.data.items]);
+            setUsersCursor(res.data.next_cursor);
+        } catch (error) { console.error("Error fetching users:", error); } finally { setLoadingMore(false); }
+    };
+
     const confirmDeleteUser = (id) => {
         setUserToDelete(id);
         setModalOpen(true);
@@ -85,15 +133,32 @@ const AdminDashboard = () => {
 
         setUploading(true);
         try {
-            const formData = new FormData();
-            formData.append('audio_file', uploadForm.audioFile);
-            formData.append('title', uploadForm.title);
-            formData.append('lyrics', uploadForm.lyrics);
-            formData.append('tags', uploadForm.tags);
-
-            const res = await api.post('/admin/upload-song', formData, {
-                headers: { 'Content-Type': 'multipart/form-data' }
+            // Subida por partes: si un fragmento falla, se pregunta el offset y se reanuda
+            const file = uploadForm.audioFile;
+            const created = await api.post('/admin/uploads', {
+                filename: file.name,
+                size: file.size,
+                title: uploadForm.title,
+                lyrics: uploadForm.lyrics,
+                tags: uploadForm.tags
             });
+            const uploadId = created.data.upload_id;
+            let offset = 0;
+            let retries = 0;
+            while (offset < file.size) {
+                try {
+                    const res = await api.patch(`/admin/uploads/${uploadId}`, file.slice(offset, offset + UPLOAD_CHUNK_SIZE), {
+                        headers: { 'Content-Type': 'application/offset+octet-stream', 'Upload-Offset': offset }
+                    });
+                    offset = res.data.offset;
+                    retries = 0;
+                } catch (error) {
+                    if (++retries > UPLOAD_MAX_RETRIES) throw error;
+                    const state = await api.get(`/admin/uploads/${uploadId}`);
+                    offset = state.data.offset;
+                }
+            }
+            await api.post(`/admin/uploads/${uploadId}/complete`);
 
             alert('¡Canción subida exitosamente!');
             setUploadForm({ title: '', lyrics: '', tags: '', audioFile: null });
@@ -199,6 +264,7 @@ const AdminDashboard = () => {
                                     )}
                                 </div>
                             ))}
+                            {usersCursor && <button onClick={loadMoreUsers} disabled={loadingMore} className="w-full py-3 text-primary font-medium rounded-xl hover:bg-indigo-50 disabled:opacity-50">{loadingMore ? 'Cargando...' : 'Cargar más'}</button>}
                         </div>
                     )}
 
@@ -57,8 +57,15 @@ const CreateMusic = () => {
         if (!prompt.trim()) return;
         setLoading(true);
         try {
+            // La generación corre en segundo plano: consultamos el trabajo hasta que termine
             const response = await api.post('/music/generate', { prompt });
-            window.location.href = `/player/${response.data.song.id}`;
+            let job = response.data.job;
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                job = (await api.get(`/music/jobs/${job.id}`)).data;
+            }
+            if (job.status === 'failed') throw new Error(job.error);
+            window.location.href = `/player/${job.result.song.id}`;
         } catch (error) {
             console.error("Error generando:", error);
             const errorMsg = error.response?.data?.error || error.response?.data?.msg || error.message || "Error desconocido";
@@ -13,15 +13,28 @@ const Favorites = () => {
     const [search, setSearch] = useState('');
     const [modalOpen, setModalOpen] = useState(false);
     const [songToDelete, setSongToDelete] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     const fetchFavorites = async () => {
         try {
             const res = await api.get('/music/favorites');
-            setFavorites(res.data);
-            setFiltered(res.data);
+            setFavorites(res.data.items);
+            setFiltered(res.data.items);
+            setNextCursor(res.data.next_cursor);
         } catch (error) { console.error("Error fetching favorites", error); }
     };
 
+    // Siguiente página: el backend devuelve next_cursor mientras queden favoritos
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const res = await api.get('/music/favorites', { params: { cursor: nextCursor } });
+            setFavorites((prev) => [...prev, ...res.data.items]);
+            setNextCursor(res.data.next_cursor);
+        } catch (error) { console.error("Error fetching favorites", error); } finally { setLoadingMore(false); }
+    };
+
     useEffect(() => { fetchFavorites(); }, []);
 
     useEffect(() => {
@@ -31,7 +44,7 @@ const Favorites = () => {
     }, [search, favorites]);
 
     const handlePlaySong = (songId) => {
-        navigate(`/player/${songId}`, { state: { from: 'favorites' } });
+        navigate(`/player/${songId}`, { state: { from: 'favorites', playlist: filtered } });
     };
 
     const confirmDelete = (songId) => {
@@ -79,6 +92,7 @@ const Favorites = () => {
                         <button onClick={(e) => { e.stopPropagation(); confirmDelete(song.id); }} className="p-2 text-slate-400 hover:text-red-500 transition-colors"><Trash2 size={18} /></button>
                     </Card>
                 ))}
+                {nextCursor && <button onClick={loadMore} disabled={loadingMore} className="w-full py-3 text-primary font-medium rounded-xl hover:bg-pink-50 disabled:opacity-50">{loadingMore ? 'Cargando...' : 'Cargar más'}</button>}
             </div>
         </div>
     );
@@ -9,6 +9,8 @@ const History = () => {
     const [songs, setSongs] = useState([]);
     const [search, setSearch] = useState('');
     const [loading, setLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const navigate = useNavigate();
 
     const fetchHistory = async () => {
@@ -17,10 +19,23 @@ const History = () => {
             const params = {};
             if (search) params.search = search;
             const res = await api.get('/music/history', { params });
-            setSongs(res.data);
+            setSongs(res.data.items);
+            setNextCursor(res.data.next_cursor);
         } catch (error) { console.error("Error fetching history", error); } finally { setLoading(false); }
     };
 
+    // Siguiente página: el backend devuelve next_cursor mientras queden canciones
+    const loadMore = async () => {
+        setLoadingMore(true);
+        try {
+            const params = { cursor: nextCursor };
+            if (search) params.search = search;
+            const res = await api.get('/music/history', { params });
+            setSongs((prev) => [...prev, ...res.data.items]);
+            setNextCursor(res.data.next_cursor);
+        } catch (error) { console.error("Error fetching history", error); } finally { setLoadingMore(false); }
+    };
+
     useEffect(() => { fetchHistory(); }, [search]);
 
     const handleFavorite = async (e, songId) => {
@@ -34,13 +49,13 @@ const History = () => {
     return (
         <div className="pb-20">
             <div className="mb-6"><h1 className="text-2xl font-bold text-slate-900">Historial 🕒</h1><p className="text-slate-500 text-sm">Tus creaciones de las últimas 24h</p></div>
-            <div className="mb-6"><Input placeholder="Buscar por título..." icon={Search} value={search} onChange={(e) => setSearch(e.target.value)} /></div>
+            <div className="mb-6"><Input placeholder="Buscar por título, tema o letra..." icon={Search} value={search} onChange={(e) => setSearch(e.target.value)} /></div>
             <div className="space-y-4">
                 {loading ? <p className="text-center text-slate-400">Cargando...</p> : songs.length === 0 ? (
                     <div className="text-center py-10 bg-slate-50 rounded-2xl border border-dashed border-slate-200"><Clock className="mx-auto text-slate-300 mb-2" size={32} /><p className="text-slate-500">No hay canciones recientes</p></div>
                 ) : (
                     songs.map((song) => (
-                        <Card key={song.id} className="flex flex-col gap-3 cursor-pointer hover:border-indigo-200 transition-colors" onClick={() => navigate(`/player/${song.id}`, { state: { from: 'history' } })}>
+                        <Card key={song.id} className="flex flex-col gap-3 cursor-pointer hover:border-indigo-200 transition-colors" onClick={() => navigate(`/player/${song.id}`, { state: { from: 'history', playlist: songs } })}>
                             <div className="flex items-center justify-between">
                                 <div className="flex items-center gap-3 overflow-hidden">
                                     <div className="bg-indigo-100 p-2 rounded-full text-primary flex-shrink-0"><Play size={20} fill="currentColor" /></div>
@@ -52,6 +67,7 @@ const History = () => {
                         </Card>
                     ))
                 )}
+                {!loading && nextCursor && <button onClick={loadMore} disabled={loadingMore} className="w-full py-3 text-primary font-medium rounded-xl hover:bg-indigo-50 disabled:opacity-50">{loadingMore ? 'Cargando...' : 'Cargar más'}</button>}
             </div>
         </div>
     );
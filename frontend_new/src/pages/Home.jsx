@@ -15,7 +15,7 @@ const Home = () => {
         const fetchHistory = async () => {
             try {
                 const res = await api.get('/music/history');
-                if (res.data && res.data.length > 0) setLastSong(res.data[0]);
+                if (res.data.items.length > 0) setLastSong(res.data.items[0]);
             } catch (error) { console.error("Error cargando historial", error); }
         };
         fetchHistory();
@@ -16,41 +16,18 @@ const PlayerPage = () => {
     useEffect(() => {
         const fetchSong = async () => {
             try {
-                const sourceContext = location.state?.from;
-                let found = null;
-                let sourcePlaylist = [];
-
-                if (sourceContext === 'favorites') {
-                    // Force load from favorites FIRST
-                    const favRes = await api.get('/music/favorites');
-                    found = favRes.data.find(s => s.id === parseInt(id));
-                    sourcePlaylist = favRes.data;
-                } else if (sourceContext === 'history') {
-                    // Force load from history FIRST
-                    const res = await api.get('/music/history');
-                    found = res.data.find(s => s.id === parseInt(id));
-                    sourcePlaylist = res.data;
-                } else {
-                    // Fallback to auto-detection (original logic)
-                    // Try history first
-                    const res = await api.get('/music/history');
-                    found = res.data.find(s => s.id === parseInt(id));
-                    sourcePlaylist = res.data;
-
-                    if (!found) {
-                        const favRes = await api.get('/music/favorites');
-                        found = favRes.data.find(s => s.id === parseInt(id));
-                        sourcePlaylist = favRes.data;
-                    }
-                }
-
-                if (found) {
-                    setSong(found);
-                    setPlaylist(sourcePlaylist);
-                    const index = sourcePlaylist.findIndex(s => s.id === parseInt(id));
-                    setCurrentIndex(index);
-                }
-            } catch (error) { console.error("Error loading song", error); } finally { setLoading(false); }
+                // La canción se pide por id: puede no estar en la primera página del historial o de favoritos
+                const res = await api.get(`/music/songs/${id}`);
+                // Anterior/siguiente recorren la lista que ya cargó la pantalla de origen
+                const sourcePlaylist = location.state?.playlist || [];
+                const index = sourcePlaylist.findIndex(s => s.id === parseInt(id));
+                setSong(res.data);
+                setPlaylist(index >= 0 ? sourcePlaylist : [res.data]);
+                setCurrentIndex(Math.max(index, 0));
+            } catch (error) {
+                console.error("Error loading song", error);
+                setSong(null);
+            } finally { setLoading(false); }
         };
         fetchSong();
     }, [id, location.state]);